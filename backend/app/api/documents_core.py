@@ -13,6 +13,7 @@ from app.models.database import (
     DocumentType, ProcessingStatus, User
 )
 from app.services.enhanced_document_parser import EnhancedDocumentParser
+from app.services.vector_search import get_vector_search
 from datetime import datetime
 import structlog
 import json
@@ -687,6 +688,9 @@ async def delete_document(document_id: str, db: AsyncSession = Depends(get_db)):
         await db.delete(document)
         await db.commit()
         
+        # 同步常驻向量索引
+        get_vector_search().remove_document(document_id)
+        
         return {
             "success": True,
             "message": "文档删除成功"
@@ -724,6 +728,7 @@ async def chunk_document(
     try:
         from app.models.database import DocumentChunk
         from app.services.llm_chunking_service import get_chunking_service
+        from app.services.embedding_jobs import get_embedding_job_worker, reset_embedding_jobs
         
         # 1. 获取文档和关联的DevType
         stmt = select(Document).filter(Document.id == document_id)
@@ -766,6 +771,7 @@ async def chunk_document(
             
             # 5. 保存新的chunks到数据库
             saved_chunks = []
+            chunk_texts = []
             for chunk_data in chunks_data:
                 chunk = DocumentChunk(
                     id=str(uuid.uuid4()),
@@ -778,6 +784,7 @@ async def chunk_document(
                     keywords="[]"  # 后续可以添加关键词提取
                 )
                 db.add(chunk)
+                chunk_texts.append((chunk.id, chunk.content))
                 saved_chunks.append({
                     "chunk_index": chunk.chunk_index,
                     "chunk_size": chunk.chunk_size,
@@ -786,9 +793,20 @@ async def chunk_document(
                     "metadata": chunk_data.get("metadata", {})
                 })
             
-            # 6. 更新文档状态
+            # 6. 重置未完成的向量化任务（检查点指向旧chunks），与新chunks一起提交
+            reset_jobs = await reset_embedding_jobs(db, document_id, len(saved_chunks))
+            
+            # 7. 更新文档状态
             document.processing_status = ProcessingStatus.COMPLETED
             await db.commit()
+            if reset_jobs:
+                get_embedding_job_worker().notify()
+                logger.info("文档重新分块，已重置向量化任务", document_id=document_id, jobs=reset_jobs)
+            
+            # 旧chunks已删除，新chunks尚未向量化；关键词索引直接写入新chunks
+            vector_search = get_vector_search()
+            vector_search.remove_document(document_id)
+            vector_search.index_chunks(document_id, chunk_texts)
             
             logger.info(f"文档分块完成: document_id={document_id}, chunks_count={len(saved_chunks)}")
             
@@ -818,25 +836,28 @@ async def chunk_document(
         raise HTTPException(status_code=500, detail=f"分块API失败: {str(e)}")
 
 
-@router.post("/{document_id}/embed")
+@router.post("/{document_id}/embed", status_code=202)
 async def embed_document_chunks(
     document_id: str,
     db: AsyncSession = Depends(get_db)
 ):
     """
-    为文档的所有chunks生成向量
+    为文档的所有chunks提交向量化任务
     
-    使用Qwen3-Embedding-8B为每个chunk生成8192维向量，存储到embedding字段
+    任务持久化在任务表中，由后台worker分批编码并写回，每批提交检查点，
+    进程崩溃后从检查点续跑；接口立即返回任务ID，进度通过 /embed-jobs/{job_id} 查询。
+    文档已有未完成的任务时返回该任务
     
     Args:
         document_id: 文档ID
     
     Returns:
-        向量化统计信息
+        任务ID与当前状态
     """
     try:
-        from app.models.database import DocumentChunk
-        from app.services.embedding_service import get_embedding_service
+        from app.services.embedding_jobs import (
+            enqueue_embedding_job, get_embedding_job_worker, job_to_dict
+        )
         
         # 1. 检查文档是否存在
         stmt = select(Document).filter(Document.id == document_id)
@@ -846,72 +867,63 @@ async def embed_document_chunks(
         if not document:
             raise HTTPException(status_code=404, detail="文档不存在")
         
-        # 2. 获取所有chunks
-        chunks_stmt = select(DocumentChunk).filter(
-            DocumentChunk.document_id == document_id
-        ).order_by(DocumentChunk.chunk_index)
-        
-        chunks_result = await db.execute(chunks_stmt)
-        chunks = chunks_result.scalars().all()
-        
-        if not chunks:
+        # 2. 提交任务（已有排队中/运行中的任务时直接返回）
+        job, created = await enqueue_embedding_job(db, document_id)
+        if created and job.total_chunks == 0:
+            await db.delete(job)
+            await db.commit()
             raise HTTPException(
                 status_code=400,
                 detail="文档尚未分块，请先调用 /chunk 接口"
             )
         
-        logger.info(f"开始为文档 {document_id} 的 {len(chunks)} 个chunks生成向量")
-        
-        # 3. 准备chunks数据
-        chunks_data = [
-            {
-                "id": chunk.id,
-                "content": chunk.content,
-                "chunk_index": chunk.chunk_index
-            }
-            for chunk in chunks
-        ]
-        
-        # 4. 定义更新回调函数
-        async def update_chunk_embedding(chunk_id: str, embedding: str, embedding_dim: int):
-            """更新chunk的embedding字段"""
-            chunk = await db.get(DocumentChunk, chunk_id)
-            if chunk:
-                chunk.embedding = embedding
-                # 可以在meta_data中记录embedding维度
-                try:
-                    meta_data = json.loads(chunk.meta_data) if chunk.meta_data else {}
-                    meta_data["embedding_dim"] = embedding_dim
-                    chunk.meta_data = json.dumps(meta_data)
-                except:
-                    pass
-        
-        # 5. 调用embedding服务
-        embedding_service = get_embedding_service()
-        stats = await embedding_service.embed_chunks_for_document(
-            chunks=chunks_data,
-            update_callback=update_chunk_embedding
-        )
-        
-        # 6. 提交数据库更新
-        await db.commit()
+        # 3. 唤醒后台worker
+        get_embedding_job_worker().notify()
         
         logger.info(
-            f"文档向量化完成: document_id={document_id}",
-            **stats
+            "向量化任务已提交" if created else "文档已有未完成的向量化任务",
+            document_id=document_id,
+            job_id=job.id,
+            total_chunks=job.total_chunks
         )
         
         return {
             "success": True,
             "document_id": document_id,
             "document_title": document.title,
-            "embedding_stats": stats,
-            "message": f"成功为 {stats['success']} 个chunks生成向量"
+            "job_id": job.id,
+            "created": created,
+            "job": job_to_dict(job),
+            "message": f"向量化任务已提交，共 {job.total_chunks} 个chunks" if created else "文档已有未完成的向量化任务"
         }
         
     except HTTPException:
         raise
     except Exception as e:
         await db.rollback()
-        logger.error(f"向量化API失败: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"向量化API失败: {str(e)}")
+        logger.error(f"提交向量化任务失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"提交向量化任务失败: {str(e)}")
+
+
+@router.get("/embed-jobs/{job_id}")
+async def get_embedding_job(
+    job_id: str,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    查询向量化任务进度
+    
+    Returns:
+        job: 任务状态、已处理/总chunk数、检查点、成功/失败/跳过数及处理速度（与提交接口的 job 字段相同）
+    """
+    from app.models.database import EmbeddingJob
+    from app.services.embedding_jobs import job_to_dict
+    
+    job = await db.get(EmbeddingJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="向量化任务不存在")
+    
+    return {
+        "success": True,
+        "job": job_to_dict(job)
+    }
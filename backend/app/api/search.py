@@ -2,28 +2,69 @@
 语义搜索API - 基于简化向量搜索（SQLite + Numpy）
 注意：由于ChromaDB在Python 3.13上的兼容性问题，暂时使用SQLite存储 + Numpy计算的方案
 """
+import asyncio
+import json
+
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, func
 from pydantic import BaseModel
 from typing import List, Optional
 import structlog
 
+from app.core.config import get_settings
 from app.database import get_db
 from app.models.database import Document, DocumentChunk
 from app.services.embedding_service import get_embedding_service
+from app.services.embedding_codec import has_embedding
+from app.services.embedding_jobs import get_embedding_job_worker, queue_stats
+from app.services.snippets import CONTENT_MODES, shape_content
+from app.services.centroid_index import evaluate_two_stage
 from app.services.vector_search import get_vector_search
+from app.services.vector_quantization import compare_quantization_modes
 
 logger = structlog.get_logger()
 router = APIRouter(prefix="/search", tags=["search"])
 
+# 流式搜索的输出格式及其媒体类型
+STREAM_FORMATS = {"sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+
 
 class SemanticSearchRequest(BaseModel):
     """语义搜索请求"""
     query: str
     top_k: int = 5
+    document_type: Optional[str] = None  # dev_type分类: business_doc / demo_code / checklist
+    document_id: Optional[str] = None
+    team_id: Optional[str] = None
+    project_id: Optional[str] = None
+    access_levels: Optional[List[str]] = None  # private / team / public，多个取值为OR
+    index: Optional[str] = None  # flat / ivf / hnsw，默认取配置
+    nprobe: Optional[int] = None  # IVF扫描簇数量
+    ef_search: Optional[int] = None  # HNSW搜索候选队列长度
+    mode: str = "vector"  # vector / two_stage（文档质心预选+chunk精排）/ hybrid（向量+BM25融合）/ keyword（仅BM25）
+    rerank: Optional[bool] = None  # cross-encoder重排序，默认取配置 RERANK_ENABLED
+    budget_ms: Optional[float] = None  # 延迟预算（毫秒），超出时返回第一阶段顺序
+    mmr_lambda: Optional[float] = None  # MMR多样化的相关度权重(0-1)，越小越偏向多样性，默认不启用
+    max_per_document: Optional[int] = None  # 每个文档最多返回的chunk数
+    centroid_documents: Optional[int] = None  # two_stage 模式第一阶段选取的文档数，默认取配置
+    content_mode: str = "full"  # full / truncate（前N字符）/ snippet（查询词附近N字符）/ none
+    content_max_chars: int = 300  # truncate / snippet 模式的最大字符数
+
+
+class BatchSemanticSearchRequest(BaseModel):
+    """批量语义搜索请求"""
+    queries: List[str]
+    top_k: int = 5
     document_type: Optional[str] = None
     document_id: Optional[str] = None
+    team_id: Optional[str] = None
+    project_id: Optional[str] = None
+    access_levels: Optional[List[str]] = None
+    merge: bool = False  # 是否返回所有查询结果的合并视图
+    content_mode: str = "full"  # full / truncate / none（批量查询不支持 snippet）
+    content_max_chars: int = 300
 
 
 class SearchResult(BaseModel):
@@ -32,9 +73,110 @@ class SearchResult(BaseModel):
     document_id: str
     document_title: str
     content: str
-    similarity: float
+    similarity: Optional[float]  # 向量相似度，混合检索中仅关键词命中时为 None
     chunk_index: int
     metadata: dict
+    score: Optional[float] = None  # 混合检索的融合分数
+    bm25_score: Optional[float] = None
+    rerank_score: Optional[float] = None
+
+
+def _validate_top_k(top_k: int) -> None:
+    """top_k 取值范围为 1 到 SEARCH_MAX_TOP_K，不合法时抛出400"""
+    max_top_k = get_settings().SEARCH_MAX_TOP_K
+    if not 1 <= top_k <= max_top_k:
+        raise HTTPException(400, f"top_k 取值范围为 1-{max_top_k}")
+
+
+def _validate_semantic_request(request: SemanticSearchRequest) -> None:
+    """校验结果数量、检索模式、索引及多样化参数，不合法时抛出400"""
+    vector_search = get_vector_search()
+    
+    _validate_top_k(request.top_k)
+    
+    if request.mode not in vector_search.SEARCH_MODES:
+        raise HTTPException(
+            400,
+            f"不支持的检索模式: {request.mode}，可选: {list(vector_search.SEARCH_MODES)}"
+        )
+    
+    if request.index and request.index not in vector_search.available_indexes():
+        raise HTTPException(
+            400,
+            f"索引不可用: {request.index}，可用索引: {vector_search.available_indexes()}"
+        )
+    
+    if request.mmr_lambda is not None and not 0.0 <= request.mmr_lambda <= 1.0:
+        raise HTTPException(400, "mmr_lambda 取值范围为 0-1")
+    if request.max_per_document is not None and request.max_per_document < 1:
+        raise HTTPException(400, "max_per_document 必须大于等于 1")
+    if request.centroid_documents is not None and request.centroid_documents < 1:
+        raise HTTPException(400, "centroid_documents 必须大于等于 1")
+    _validate_content_mode(request.content_mode, request.content_max_chars)
+
+
+def _validate_content_mode(content_mode: str, content_max_chars: int, modes=CONTENT_MODES) -> None:
+    """校验内容裁剪参数"""
+    if content_mode not in modes:
+        raise HTTPException(400, f"不支持的内容模式: {content_mode}，可选: {list(modes)}")
+    if content_max_chars < 1:
+        raise HTTPException(400, "content_max_chars 必须大于等于 1")
+
+
+def _search_kwargs(request: SemanticSearchRequest) -> dict:
+    """语义搜索请求转换为 search_by_text / search_stages 的参数"""
+    return {
+        "query_text": request.query,
+        "top_k": request.top_k,
+        "document_type": request.document_type,
+        "document_id": request.document_id,
+        "min_similarity": 0.0,
+        "index": request.index,
+        "nprobe": request.nprobe,
+        "ef_search": request.ef_search,
+        "filters": {
+            "team_id": request.team_id,
+            "project_id": request.project_id,
+            "access_level": request.access_levels
+        },
+        "mode": request.mode,
+        "rerank": request.rerank,
+        "budget_ms": request.budget_ms,
+        "mmr_lambda": request.mmr_lambda,
+        "max_per_document": request.max_per_document,
+        "centroid_documents": request.centroid_documents
+    }
+
+
+def _format_results(results: List[dict], request: SemanticSearchRequest) -> List[SearchResult]:
+    """
+    检索结果转换为响应模型
+    
+    chunk内容和文档标题已在检索阶段由一次关联查询加载，这里不再访问数据库
+    """
+    search_results = []
+    for item in results:
+        chunk = item['chunk']
+        similarity = item['similarity']
+        
+        search_results.append(SearchResult(
+            chunk_id=chunk.id,
+            document_id=chunk.document_id,
+            document_title=chunk.document_title or "未知文档",
+            content=shape_content(
+                chunk.content,
+                request.content_mode,
+                request.content_max_chars,
+                request.query
+            ),
+            similarity=round(similarity, 4) if similarity is not None else None,
+            chunk_index=chunk.chunk_index,
+            metadata={"chunk_size": len(chunk.content or "")},
+            score=round(item['score'], 6) if 'score' in item else None,
+            bm25_score=round(item['bm25_score'], 4) if item.get('bm25_score') is not None else None,
+            rerank_score=round(item['rerank_score'], 4) if 'rerank_score' in item else None
+        ))
+    return search_results
 
 
 @router.post("/semantic")
@@ -49,50 +191,36 @@ async def semantic_search(
     使用SQLite存储 + Numpy计算相似度
     """
     try:
-        # 使用简化的向量搜索服务
-        vector_search = get_vector_search()
+        _validate_semantic_request(request)
         
-        results = await vector_search.search_by_text(
+        timings = {}
+        results = await get_vector_search().search_by_text(
             db=db,
-            query_text=request.query,
-            top_k=request.top_k,
-            document_type=request.document_type,
-            document_id=request.document_id,
-            min_similarity=0.0
+            timings=timings,
+            **_search_kwargs(request)
         )
         
+        index_used = timings.pop("index", None)
+        
         if not results:
             return {
                 "success": True,
                 "query": request.query,
                 "results": [],
                 "total": 0,
-                "message": "未找到相关结果"
+                "message": "未找到相关结果",
+                "index": index_used,
+                "timing": timings
             }
         
         # 格式化结果
-        search_results = []
-        for item in results:
-            chunk = item['chunk']
-            similarity = item['similarity']
-            
-            # 获取文档信息
-            document = await db.get(Document, chunk.document_id)
-            
-            search_results.append(SearchResult(
-                chunk_id=chunk.id,
-                document_id=chunk.document_id,
-                document_title=document.title if document else "未知文档",
-                content=chunk.content,
-                similarity=round(similarity, 4),
-                chunk_index=chunk.chunk_index,
-                metadata={"chunk_size": len(chunk.content)}
-            ))
+        search_results = _format_results(results, request)
         
         logger.info(
             "搜索完成",
             query=request.query,
             found=len(search_results),
+            mode=request.mode,
             top_similarity=search_results[0].similarity if search_results else 0
         )
         
@@ -101,29 +229,336 @@ async def semantic_search(
             "query": request.query,
             "results": [r.dict() for r in search_results],
             "total": len(search_results),
-            "method": "sqlite_numpy"
+            "method": "sqlite_numpy",
+            "mode": request.mode,
+            "index": index_used,
+            "timing": timings
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error("搜索失败", error=str(e), query=request.query)
         raise HTTPException(500, f"搜索失败: {str(e)}")
 
 
+@router.post("/semantic/stream")
+async def semantic_search_stream(
+    request: SemanticSearchRequest,
+    format: str = "sse"
+):
+    """
+    流式语义搜索接口
+    
+    每完成一个检索阶段推送一次当前结果，Agent无需等待重排序等后续阶段即可拿到首批结果：
+    - first_stage: 第一阶段检索结果（查询向量化 + 索引扫描后立即推送）
+    - rerank / diversify: 重排序、多样化后的更新结果（启用时）
+    - summary: 最终结果数量、检索模式和各阶段耗时
+    - error: 检索失败
+    
+    format=sse 时为Server-Sent Events（text/event-stream），format=ndjson 时每行一个JSON对象
+    """
+    if format not in STREAM_FORMATS:
+        raise HTTPException(400, f"不支持的流式格式: {format}，可选: {list(STREAM_FORMATS)}")
+    _validate_semantic_request(request)
+    
+    def encode(event: str, payload: dict) -> str:
+        if format == "sse":
+            return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+        return json.dumps({"event": event, **payload}, ensure_ascii=False) + "\n"
+    
+    async def events():
+        from app.core import database as db_module
+        
+        # 响应流式发送期间依赖注入的会话可能已关闭，使用独立的会话
+        if db_module.async_session is None:
+            await db_module.init_db()
+        timings = {}
+        total = 0
+        index_used = None
+        try:
+            async with db_module.async_session() as db:
+                async for stage, results in get_vector_search().search_stages(
+                    db=db,
+                    timings=timings,
+                    **_search_kwargs(request)
+                ):
+                    index_used = timings.pop("index", index_used)
+                    search_results = _format_results(results, request)
+                    total = len(search_results)
+                    yield encode(stage, {
+                        "results": [r.dict() for r in search_results],
+                        "total": total,
+                        "timing": dict(timings)
+                    })
+        except Exception as e:
+            logger.error("流式搜索失败", error=str(e), query=request.query)
+            yield encode("error", {"message": f"搜索失败: {str(e)}"})
+            return
+        
+        yield encode("summary", {
+            "query": request.query,
+            "total": total,
+            "method": "sqlite_numpy",
+            "mode": request.mode,
+            "index": index_used,
+            "timing": timings
+        })
+    
+    return StreamingResponse(
+        events(),
+        media_type=STREAM_FORMATS[format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/semantic/batch")
+async def batch_semantic_search(
+    request: BatchSemanticSearchRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    批量语义搜索接口
+    
+    一次请求提交多个相关查询：一次批量向量化、一次矩阵乘法打分。
+    每个查询只返回 (chunk_id, similarity)，命中的chunk内容在 chunks 中只出现一次；
+    merge=true 时额外返回按最高相似度排序的合并结果
+    """
+    try:
+        max_queries = get_settings().SEARCH_BATCH_MAX_QUERIES
+        if not request.queries:
+            raise HTTPException(400, "queries 不能为空")
+        if len(request.queries) > max_queries:
+            raise HTTPException(400, f"单次最多 {max_queries} 个查询")
+        _validate_top_k(request.top_k)
+        # chunk内容在所有查询间共享，无法按单个查询定位片段
+        _validate_content_mode(
+            request.content_mode,
+            request.content_max_chars,
+            modes=tuple(mode for mode in CONTENT_MODES if mode != "snippet")
+        )
+        
+        vector_search = get_vector_search()
+        hits, chunks_by_id = await vector_search.search_batch_by_text(
+            db=db,
+            query_texts=request.queries,
+            top_k=request.top_k,
+            document_type=request.document_type,
+            document_id=request.document_id,
+            min_similarity=0.0,
+            filters={
+                "team_id": request.team_id,
+                "project_id": request.project_id,
+                "access_level": request.access_levels
+            }
+        )
+        
+        # chunk内容和文档标题已由一次关联查询加载
+        chunks = {
+            chunk_id: {
+                "document_id": chunk.document_id,
+                "document_title": chunk.document_title or "未知文档",
+                "content": shape_content(chunk.content, request.content_mode, request.content_max_chars),
+                "chunk_index": chunk.chunk_index,
+                "metadata": {"chunk_size": len(chunk.content or "")}
+            }
+            for chunk_id, chunk in chunks_by_id.items()
+        }
+        
+        results = [
+            {
+                "query": query,
+                "results": [
+                    {"chunk_id": chunk_id, "similarity": round(similarity, 4)}
+                    for chunk_id, similarity in query_hits
+                ],
+                "total": len(query_hits)
+            }
+            for query, query_hits in zip(request.queries, hits)
+        ]
+        
+        merged = None
+        if request.merge:
+            union = {}
+            for query_index, query_hits in enumerate(hits):
+                for chunk_id, similarity in query_hits:
+                    entry = union.setdefault(
+                        chunk_id,
+                        {"chunk_id": chunk_id, "similarity": similarity, "matched_queries": []}
+                    )
+                    entry["similarity"] = max(entry["similarity"], similarity)
+                    entry["matched_queries"].append(query_index)
+            merged = sorted(
+                union.values(),
+                key=lambda entry: (entry["similarity"], len(entry["matched_queries"])),
+                reverse=True
+            )
+            for entry in merged:
+                entry["similarity"] = round(entry["similarity"], 4)
+        
+        logger.info(
+            "批量搜索完成",
+            queries=len(request.queries),
+            unique_chunks=len(chunks)
+        )
+        
+        return {
+            "success": True,
+            "total_queries": len(request.queries),
+            "results": results,
+            "chunks": chunks,
+            "merged": merged,
+            "method": "sqlite_numpy"
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("批量搜索失败", error=str(e), queries=len(request.queries))
+        raise HTTPException(500, f"批量搜索失败: {str(e)}")
+
+
+@router.get("/documents/{document_id}/similar")
+async def similar_documents(
+    document_id: str,
+    top_k: int = 5,
+    document_type: Optional[str] = None,
+    team_id: Optional[str] = None,
+    project_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    相似文档推荐（more like this）
+    
+    以文档质心（chunk向量均值）在所有文档质心上检索，只做一次M×D的矩阵-向量乘法
+    """
+    _validate_top_k(top_k)
+    try:
+        document = await db.get(Document, document_id)
+        if not document:
+            raise HTTPException(status_code=404, detail="文档不存在")
+        
+        hits = await get_vector_search().similar_documents(
+            db=db,
+            document_id=document_id,
+            top_k=top_k,
+            document_type=document_type,
+            filters={"team_id": team_id, "project_id": project_id}
+        )
+        if hits is None:
+            raise HTTPException(400, "文档尚未向量化，请先调用 /documents/{id}/embed")
+        
+        titles = {}
+        if hits:
+            result = await db.execute(
+                select(Document.id, Document.title).filter(
+                    Document.id.in_([hit_id for hit_id, _ in hits])
+                )
+            )
+            titles = dict(result.all())
+        
+        return {
+            "success": True,
+            "document_id": document_id,
+            "document_title": document.title,
+            "results": [
+                {
+                    "document_id": hit_id,
+                    "document_title": titles.get(hit_id, "未知文档"),
+                    "similarity": round(similarity, 4)
+                }
+                for hit_id, similarity in hits
+            ],
+            "total": len(hits)
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("相似文档检索失败", error=str(e), document_id=document_id)
+        raise HTTPException(500, f"相似文档检索失败: {str(e)}")
+
+
 @router.get("/stats")
-async def get_search_stats(db: AsyncSession = Depends(get_db)):
+async def get_search_stats(
+    evaluate_quantization: bool = False,
+    compare_quantization: bool = False,
+    compare_two_stage: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
     """
     获取搜索统计信息
     
-    返回已向量化的chunks数量
+    返回已向量化的chunks数量，以及当前量化模式的每向量内存；
+    以下评估均为CPU密集的全量扫描，默认关闭，开启时在线程池中执行，不阻塞其他请求:
+    evaluate_quantization=true 时评估当前量化模式的recall@k；
+    compare_quantization=true 时在采样子集上评估所有量化模式；
+    compare_two_stage=true 时评估两阶段检索相对精确搜索的recall@k和延迟
     """
     try:
-        stmt = select(DocumentChunk).filter(DocumentChunk.embedding.isnot(None))
-        result = await db.execute(stmt)
-        chunks = result.scalars().all()
+        stmt = select(func.count()).select_from(DocumentChunk).filter(has_embedding())
+        total_vectorized = (await db.execute(stmt)).scalar() or 0
+        
+        binary_stmt = select(func.count()).select_from(DocumentChunk).filter(
+            DocumentChunk.embedding_blob.isnot(None)
+        )
+        binary_count = (await db.execute(binary_stmt)).scalar() or 0
+        
+        vector_search = get_vector_search()
+        index = vector_search.index
+        embedding_service = get_embedding_service()
+        
+        loop = asyncio.get_running_loop()
+        quantization = await loop.run_in_executor(
+            None, lambda: index.quantization_stats(evaluate_recall=True)
+        ) if evaluate_quantization else index.quantization_stats()
+        quantization_comparison = await loop.run_in_executor(
+            None, lambda: compare_quantization_modes(index.snapshot()[2])
+        ) if compare_quantization else None
+        two_stage_comparison = await loop.run_in_executor(
+            None, lambda: evaluate_two_stage(
+                index,
+                vector_search.centroids,
+                documents=get_settings().SEARCH_CENTROID_DOCUMENTS
+            )
+        ) if compare_two_stage else None
         
         return {
             "success": True,
-            "total_vectorized_chunks": len(chunks),
+            "total_vectorized_chunks": total_vectorized,
+            "binary_encoded_chunks": binary_count,
+            "indexed_vectors": index.size,
+            "index_loaded": index.is_loaded,
+            "ann_indexes": {
+                name: ann.size for name, ann in vector_search.ann_indexes.items()
+            },
+            "keyword_index": {
+                "chunks": vector_search.keyword_index.size,
+                "loaded": vector_search.keyword_index.is_loaded
+            },
+            "quantization": quantization,
+            "quantization_comparison": quantization_comparison,
+            "centroids": vector_search.centroids.stats(),
+            "two_stage_comparison": two_stage_comparison,
+            "result_cache": (
+                vector_search.result_cache.stats() if vector_search.result_cache else None
+            ),
+            "query_embedding_cache": (
+                embedding_service.query_cache.stats() if embedding_service.query_cache else None
+            ),
+            "embedding_batcher": (
+                embedding_service.batcher.stats() if embedding_service.batcher else None
+            ),
+            "embedding_pool": (
+                embedding_service.process_pool.stats() if embedding_service.process_pool else None
+            ),
+            "remote_embedding": (
+                embedding_service.remote_client.stats() if embedding_service.remote_client else None
+            ),
+            "embedding_jobs": {
+                **await queue_stats(db),
+                "worker": get_embedding_job_worker().stats()
+            },
             "storage_method": "SQLite + Numpy",
             "embedding_model": "all-MiniLM-L6-v2",
             "embedding_dimension": 384
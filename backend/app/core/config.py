@@ -36,6 +36,87 @@ class Settings(BaseSettings):
     REFRESH_TOKEN_EXPIRE_DAYS: int = Field(default=7, description="刷新令牌过期时间(天)")
     ALGORITHM: str = Field(default="HS256", description="JWT算法")
     
+    # 向量存储配置
+    EMBEDDING_WRITE_JSON: bool = Field(
+        default=True,
+        description="双读迁移期间同时写入JSON文本向量，迁移完成后可关闭"
+    )
+    EMBEDDING_CONTENT_CACHE_ENABLED: bool = Field(
+        default=True,
+        description="按 (模型名, 规范化chunk文本SHA-256) 持久化缓存chunk向量，重新分块/重复文本不再重复推理"
+    )
+    EMBEDDING_WRITE_BATCH_SIZE: int = Field(default=500, description="文档向量化每批编码并批量写回（一次executemany并提交）的chunk数")
+    EMBEDDING_JOB_WORKER_ENABLED: bool = Field(default=True, description="在应用进程内运行向量化任务worker（关闭时任务由其他进程的worker处理）")
+    EMBEDDING_JOB_POLL_INTERVAL: float = Field(default=2.0, description="向量化任务worker空闲时轮询任务表的间隔（秒）")
+    EMBEDDING_JOB_STALE_SECONDS: int = Field(default=300, description="运行中任务超过该秒数未更新心跳视为worker已崩溃，可被重新认领并从检查点续跑")
+    EMBEDDING_JOB_MAX_ATTEMPTS: int = Field(default=3, description="向量化任务最多被认领的次数，超过后标记为失败")
+    VECTOR_SHARED_STORE: Optional[bool] = Field(
+        default=None,
+        description="多worker共享的内存映射向量存储，默认在 WORKERS > 1 时启用（需要fcntl，Windows上回退为进程内索引）"
+    )
+    
+    # ANN向量索引配置
+    VECTOR_DEFAULT_INDEX: str = Field(default="flat", description="默认搜索索引: flat, ivf, hnsw")
+    VECTOR_ANN_INDEXES: List[str] = Field(default=[], description="启动时加载/构建的ANN索引，如 [\"ivf\"]")
+    VECTOR_INDEX_DIR: Optional[str] = Field(default=None, description="ANN索引持久化目录（默认与SQLite数据库同目录）")
+    VECTOR_IVF_NLIST: int = Field(default=0, description="IVF簇数量，0表示按sqrt(N)自动选择")
+    VECTOR_IVF_NPROBE: int = Field(default=8, description="IVF默认扫描簇数量")
+    VECTOR_HNSW_M: int = Field(default=16, description="HNSW每个节点的邻居数")
+    VECTOR_HNSW_EF_CONSTRUCTION: int = Field(default=200, description="HNSW构建时的候选队列长度")
+    VECTOR_HNSW_EF_SEARCH: int = Field(default=64, description="HNSW默认搜索候选队列长度")
+    
+    # 向量量化配置
+    VECTOR_QUANTIZATION: str = Field(default="none", description="常驻索引量化模式: none, float16, int8, pq")
+    VECTOR_RESCORE_FACTOR: int = Field(default=4, description="量化搜索短名单倍数（top_k * factor 个候选精确重打分）")
+    VECTOR_QUANTIZATION_MIN_TRAIN: int = Field(default=1024, description="向量数达到该值后才训练量化器，此前使用精确搜索")
+    VECTOR_QUANTIZATION_RETRAIN_GROWTH: float = Field(default=2.0, description="向量数增长到上次训练时的该倍数后重新训练量化器并重新编码")
+    
+    # 语义搜索配置
+    EMBEDDING_BACKEND: str = Field(
+        default="sentence-transformers",
+        description="本地Embedding推理后端: sentence-transformers, onnx（动态int8量化，与原向量余弦相似度≥0.99，可混用）"
+    )
+    EMBEDDING_ONNX_DIR: Optional[str] = Field(default=None, description="导出的ONNX模型目录（默认 MODEL_CACHE_DIR/onnx/<模型名>，不存在时首次加载自动导出）")
+    EMBEDDING_ONNX_THREADS: int = Field(default=0, description="ONNX Runtime intra-op线程数，0表示默认（进程池worker使用 EMBEDDING_WORKER_THREADS）")
+    EMBEDDING_BATCH_TOKEN_BUDGET: int = Field(default=8192, description="本地编码每批填充后的token数上限（批内最长长度 × 条数），按长度分桶组批")
+    EMBEDDING_BATCH_MAX_TEXTS: int = Field(default=256, description="本地编码每批最多文本数")
+    EMBEDDING_WARMUP_ENABLED: bool = Field(default=False, description="启动时后台加载Embedding模型并编码预热批次，完成前 /health 返回未就绪(503)")
+    EMBEDDING_PROCESS_WORKERS: int = Field(default=0, description="本地模型多进程编码的worker数，0表示在进程内线程池中编码")
+    EMBEDDING_WORKER_THREADS: int = Field(default=1, description="每个编码worker进程的torch intra-op线程数")
+    EMBEDDING_REMOTE_API_URL: Optional[str] = Field(default=None, description="远程Embedding API地址（默认内网Qwen3-Embedding接口，可指向本地桩服务测试）")
+    EMBEDDING_REMOTE_API_KEY: Optional[str] = Field(default=None, description="远程Embedding API密钥（默认使用内置密钥）")
+    EMBEDDING_REMOTE_CONCURRENCY: int = Field(default=4, description="远程Embedding同时在途的批次数（连接池大小）")
+    EMBEDDING_REMOTE_MAX_RETRIES: int = Field(default=4, description="远程Embedding失败批次的最大重试轮数（每轮拆分批次）")
+    EMBEDDING_REMOTE_BACKOFF_BASE: float = Field(default=0.5, description="远程Embedding重试退避基数（秒），按 2^重试次数 增长并加抖动")
+    EMBEDDING_REMOTE_BACKOFF_MAX: float = Field(default=30.0, description="远程Embedding单次退避上限（秒）")
+    EMBEDDING_REMOTE_RATE_LIMIT: float = Field(default=0.0, description="远程Embedding请求速率上限（次/秒，令牌桶），0表示不限速")
+    EMBEDDING_REMOTE_HTTP2: bool = Field(default=True, description="远程Embedding客户端启用HTTP/2（需要安装h2，未安装时回退HTTP/1.1）")
+    EMBEDDING_MICRO_BATCH_ENABLED: bool = Field(default=True, description="并发查询向量化合并为微批（单次encode）")
+    EMBEDDING_MICRO_BATCH_MAX_SIZE: int = Field(default=32, description="微批最大文本数，攒满立即执行")
+    EMBEDDING_MICRO_BATCH_MAX_WAIT_MS: float = Field(default=5.0, description="微批最长等待时间（毫秒，从批内第一个文本入队算起）")
+    SEARCH_BATCH_MAX_QUERIES: int = Field(default=50, description="批量语义搜索单次最多查询数")
+    SEARCH_MAX_TOP_K: int = Field(default=100, description="搜索接口 top_k 的上限")
+    QUERY_EMBEDDING_CACHE_SIZE: int = Field(default=10000, description="查询向量LRU缓存容量，0表示禁用")
+    QUERY_EMBEDDING_CACHE_TTL: int = Field(default=0, description="查询向量缓存过期时间(秒)，0表示进程内缓存不过期（仅受容量限制），Redis缓存使用 QUERY_EMBEDDING_REDIS_TTL")
+    QUERY_EMBEDDING_REDIS_TTL: int = Field(default=86400, description="QUERY_EMBEDDING_CACHE_TTL为0时Redis查询向量缓存的过期时间(秒)，Redis缓存没有容量上限，必须过期")
+    QUERY_EMBEDDING_CACHE_BACKEND: str = Field(default="auto", description="查询向量缓存后端: auto（启用Redis时用Redis）, memory, redis")
+    SEARCH_RESULT_CACHE_SIZE: int = Field(default=1024, description="语义结果缓存的查询数，0表示禁用")
+    SEARCH_RESULT_CACHE_MAX_DISTANCE: float = Field(default=0.05, description="命中语义结果缓存的最大余弦距离（1 - 相似度）")
+    SEARCH_HYBRID_CANDIDATES: int = Field(default=50, description="混合检索时向量/BM25各自召回的候选数")
+    SEARCH_RRF_K: int = Field(default=60, description="倒数排名融合平滑常数")
+    SEARCH_DIVERSIFY_CANDIDATES: int = Field(default=100, description="结果多样化（MMR/每文档上限）的候选池大小")
+    SEARCH_CENTROID_DOCUMENTS: int = Field(default=20, description="两阶段检索第一阶段按文档质心选取的文档数")
+    BM25_K1: float = Field(default=1.2, description="BM25词频饱和参数")
+    BM25_B: float = Field(default=0.75, description="BM25文档长度归一化参数")
+    
+    # 重排序配置
+    MODEL_CACHE_DIR: Optional[str] = Field(default="./models/transformers", description="本地模型缓存目录（与Embedding模型共用）")
+    RERANK_ENABLED: bool = Field(default=False, description="语义搜索默认是否启用cross-encoder重排序")
+    RERANK_MODEL: str = Field(default="cross-encoder/ms-marco-MiniLM-L-6-v2", description="重排序cross-encoder模型")
+    RERANK_CANDIDATES: int = Field(default=100, description="参与重排序的第一阶段候选数")
+    RERANK_MAX_LENGTH: int = Field(default=256, description="重排序输入的最大token数（查询+候选）")
+    RERANK_BUDGET_MS: float = Field(default=500.0, description="单次搜索请求的延迟预算（毫秒），超出时返回第一阶段顺序")
+    
     # 文件上传配置
     UPLOAD_DIR: str = Field(default="./uploads", description="文件上传目录")
     MAX_FILE_SIZE: int = Field(default=104857600, description="最大文件大小(字节)")  # 100MB
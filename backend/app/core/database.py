@@ -6,7 +6,7 @@ from typing import AsyncGenerator, Optional
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.pool import StaticPool
-from sqlalchemy import text
+from sqlalchemy import text, inspect
 import structlog
 
 from app.core.config import get_settings
@@ -176,6 +176,27 @@ class DatabaseManager:
 db_manager = DatabaseManager()
 
 
+def _add_missing_columns(sync_conn) -> None:
+    """为已存在的表补充模型中新增的可空列（create_all 不会修改已有表）"""
+    inspector = inspect(sync_conn)
+    existing_tables = set(inspector.get_table_names())
+    
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns or not column.nullable:
+                continue
+            
+            column_type = column.type.compile(dialect=sync_conn.dialect)
+            sync_conn.execute(text(
+                f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+            ))
+            logger.info("数据库表新增列", table=table.name, column=column.name)
+
+
 async def create_tables():
     """创建数据库表"""
     global engine
@@ -186,6 +207,7 @@ async def create_tables():
     try:
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(_add_missing_columns)
         logger.info("数据库表创建成功")
     except Exception as e:
         logger.error("数据库表创建失败", error=str(e))
@@ -3,6 +3,7 @@ AI Context System Backend
 基于FastAPI的AI上下文增强系统后端服务
 """
 
+import os
 import uvicorn
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, status
@@ -16,6 +17,10 @@ from app.core.config import get_settings
 from app.core.database import create_tables
 from app.core.redis import init_redis, close_redis
 from app.core.logging import get_logger
+from app.services.vector_search import init_vector_index, close_vector_index
+from app.services.embedding_service import close_embedding_service, get_embedding_service
+from app.services.embedding_jobs import close_embedding_job_worker, get_embedding_job_worker
+from app.services.rerank_service import close_rerank_service
 from app.core.exceptions import (
     DatabaseError, ValidationError, NotFoundError,
     AuthenticationError, AuthorizationError, BusinessLogicError,
@@ -31,6 +36,7 @@ logger = get_logger(__name__)
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     logger.info("启动 AI Context System Backend...")
+    warmup_task = None
     
     try:
         # 初始化数据库表
@@ -41,6 +47,17 @@ async def lifespan(app: FastAPI):
         await init_redis()
         logger.info("Redis连接初始化完成")
         
+        # 构建常驻内存向量索引
+        await init_vector_index()
+        
+        # 后台预热Embedding模型，完成前 /health 报告未就绪
+        if settings.EMBEDDING_WARMUP_ENABLED:
+            warmup_task = get_embedding_service().start_warm_up()
+        
+        # 后台向量化任务worker（续跑上次未完成的任务）
+        if settings.EMBEDDING_JOB_WORKER_ENABLED:
+            get_embedding_job_worker().start()
+        
         logger.info("应用启动完成")
         yield
         
@@ -49,6 +66,12 @@ async def lifespan(app: FastAPI):
         raise
     finally:
         # 清理资源
+        if warmup_task is not None and not warmup_task.done():
+            warmup_task.cancel()
+        await close_embedding_job_worker()
+        await close_vector_index()
+        await close_embedding_service()
+        close_rerank_service()
         await close_redis()
         logger.info("应用已关闭")
 
@@ -162,12 +185,17 @@ async def general_exception_handler(request: Request, exc: Exception):
 # 健康检查端点
 @app.get("/health")
 async def health_check():
-    """健康检查端点"""
-    return {
-        "status": "healthy",
+    """健康检查端点（Embedding模型预热完成前返回503）"""
+    embedding = get_embedding_service().readiness()
+    content = {
+        "status": "healthy" if embedding["ready"] else "starting",
         "service": "ai-context-system",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "embedding": embedding
     }
+    if not embedding["ready"]:
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=content)
+    return content
 
 
 # 根端点
@@ -210,6 +238,11 @@ app.openapi = custom_openapi
 
 
 if __name__ == "__main__":
+    if os.name == "posix":
+        from app.services.shared_vector_store import ensure_server_id
+        
+        # worker继承主进程生成的实例标识，共享向量存储据此判断文件是否属于本次启动
+        ensure_server_id()
     uvicorn.run(
         "app.main:app",
         host=settings.HOST,
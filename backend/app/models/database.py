@@ -5,7 +5,7 @@
 from typing import List, Optional
 from sqlalchemy import (
     Column, String, Text, Integer, BigInteger, Boolean, DateTime, Float,
-    ForeignKey, JSON, Enum as SQLEnum
+    ForeignKey, JSON, LargeBinary, Enum as SQLEnum
 )
 from sqlalchemy.orm import relationship, Mapped
 from sqlalchemy.sql import func
@@ -42,6 +42,13 @@ class ProcessingStatus(str, enum.Enum):
     FAILED = "failed"
 
 
+class EmbeddingJobStatus(str, enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
 class AuditAction(str, enum.Enum):
     CREATE = "create"
     READ = "read"
@@ -181,7 +188,10 @@ class DocumentChunk(Base):
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     document_id = Column(String(36), ForeignKey("documents.id"), nullable=False)
     content = Column(Text, nullable=False)
-    embedding = Column(Text)  # 存储序列化的向量
+    embedding = Column(Text)  # 存储序列化的向量（JSON，迁移期间保留双读）
+    embedding_blob = Column(LargeBinary)  # 小端float32原始字节
+    embedding_dim = Column(Integer)  # 向量维度
+    embedding_model = Column(String(100))  # 生成向量的模型
     chunk_index = Column(Integer, nullable=False)
     chunk_size = Column(Integer, nullable=False)
     chunk_overlap = Column(Integer, default=0)
@@ -190,6 +200,41 @@ class DocumentChunk(Base):
     created_at = Column(DateTime, server_default=func.now())
 
 
+# chunk向量内容缓存 (按模型名 + 规范化文本的SHA-256去重)
+class EmbeddingCacheEntry(Base):
+    __tablename__ = "embedding_cache"
+
+    model_name = Column(String(100), primary_key=True)
+    content_hash = Column(String(64), primary_key=True)  # 规范化文本的SHA-256
+    embedding_blob = Column(LargeBinary, nullable=False)  # 小端float32原始字节
+    embedding_dim = Column(Integer, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+
+
+# 文档向量化任务 (持久化队列，按chunk_index检查点断点续跑)
+class EmbeddingJob(Base):
+    __tablename__ = "embedding_jobs"
+
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    document_id = Column(String(36), ForeignKey("documents.id"), nullable=False, index=True)
+    status = Column(SQLEnum(EmbeddingJobStatus), default=EmbeddingJobStatus.PENDING, nullable=False, index=True)
+    total_chunks = Column(Integer, default=0, nullable=False)
+    processed_chunks = Column(Integer, default=0, nullable=False)
+    checkpoint_index = Column(Integer, default=-1, nullable=False)  # 已写回并提交的最大chunk_index
+    success_count = Column(Integer, default=0, nullable=False)
+    failed_count = Column(Integer, default=0, nullable=False)
+    skipped_count = Column(Integer, default=0, nullable=False)
+    cache_hits = Column(Integer, default=0, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)  # 被worker认领的次数
+    worker_id = Column(String(100))
+    error = Column(Text)
+    heartbeat_at = Column(DateTime)  # 超过 EMBEDDING_JOB_STALE_SECONDS 未更新视为worker已崩溃
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+
 # 实体模型 (知识图谱)
 class Entity(Base):
     __tablename__ = "entities"
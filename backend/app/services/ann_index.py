@@ -0,0 +1,680 @@
+"""
+近似最近邻（ANN）向量索引
+- IVFFlatIndex: 纯Numpy实现的倒排文件索引，k-means聚类后只扫描 nprobe 个最近的簇，
+  持久化为 .npy 文件，启动时以 mmap 方式加载
+- HNSWIndex: 基于可选依赖 hnswlib 的HNSW图索引，通过 ef_search 调节召回率/延迟
+
+两种索引都支持增量写入和按文档删除，以常驻内存的 VectorIndex 为准在启动时对账
+"""
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import structlog
+
+from app.core.config import get_settings
+from app.services.vector_index import normalize_rows, select_top_k
+
+logger = structlog.get_logger(__name__)
+
+
+def get_vector_index_dir() -> Path:
+    """ANN索引持久化目录：默认放在SQLite数据库文件旁边"""
+    settings = get_settings()
+    if settings.VECTOR_INDEX_DIR:
+        return Path(settings.VECTOR_INDEX_DIR)
+
+    database_url = settings.DATABASE_URL
+    if database_url.startswith("sqlite") and ":///" in database_url:
+        db_path = Path(database_url.split(":///", 1)[1])
+        return db_path.parent / "vector_index"
+    return Path("./data/vector_index")
+
+
+@contextmanager
+def ann_index_lock(directory: Path, name: str):
+    """
+    某个ANN索引目录的跨进程文件锁
+
+    多个worker共用同一持久化目录，加载/构建/保存都持锁进行，
+    避免一个worker读到另一个worker写了一半的文件组合；无fcntl的平台不加锁
+    """
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / f"{name}.lock", "a+b") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _temp_path(path: Path) -> Path:
+    """与目标同目录、每次唯一的临时文件路径"""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    os.close(fd)
+    return Path(tmp_path)
+
+
+def _atomic_save_npy(path: Path, array: np.ndarray) -> None:
+    """先写临时文件再rename，已有的mmap映射不受影响"""
+    tmp_path = _temp_path(path)
+    try:
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _atomic_save_json(path: Path, data: dict) -> None:
+    tmp_path = _temp_path(path)
+    try:
+        tmp_path.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+class AnnIndex:
+    """ANN索引基类"""
+
+    name = "ann"
+
+    @property
+    def size(self) -> int:
+        raise NotImplementedError
+
+    @property
+    def is_built(self) -> bool:
+        return self.size > 0
+
+    def chunk_id_set(self) -> np.ndarray:
+        """当前有效的chunk id（用于启动对账）"""
+        raise NotImplementedError
+
+    def build(self, chunk_ids: Sequence[str], document_ids: Sequence[str], matrix: np.ndarray) -> None:
+        raise NotImplementedError
+
+    def add(self, chunk_ids: Sequence[str], document_ids: Sequence[str], vectors: np.ndarray) -> None:
+        raise NotImplementedError
+
+    def remove_chunks(self, chunk_ids: Sequence[str]) -> int:
+        raise NotImplementedError
+
+    def remove_document(self, document_id: str) -> int:
+        raise NotImplementedError
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int,
+        document_id: str = None,
+        min_similarity: float = 0.0,
+        **params
+    ) -> List[Tuple[str, float]]:
+        raise NotImplementedError
+
+    def save(self, directory: Path) -> None:
+        raise NotImplementedError
+
+    def load(self, directory: Path) -> bool:
+        raise NotImplementedError
+
+    def reconcile(
+        self,
+        chunk_ids: np.ndarray,
+        document_ids: np.ndarray,
+        matrix: np.ndarray
+    ) -> Dict[str, int]:
+        """
+        与权威的常驻索引对账：删除多余的chunk，补充缺失的chunk
+
+        Args:
+            chunk_ids / document_ids / matrix: VectorIndex 的当前内容（已归一化）
+        """
+        current = self.chunk_id_set()
+        stale = current[~np.isin(current, chunk_ids)]
+        missing = ~np.isin(chunk_ids, current)
+
+        removed = self.remove_chunks(stale) if len(stale) else 0
+        if np.any(missing):
+            self.add(chunk_ids[missing], document_ids[missing], matrix[missing])
+
+        return {"removed": removed, "added": int(np.count_nonzero(missing))}
+
+
+class IVFFlatIndex(AnnIndex):
+    """
+    IVF-Flat 倒排索引（纯Numpy）
+
+    - 主段: 按簇排序的向量矩阵 + 每个簇的起止偏移，可mmap只读加载
+    - 增量段: 新写入的向量，暴力扫描，达到阈值后合并进主段
+    - 删除: 主段使用墓碑掩码，增量段直接移除
+    """
+
+    name = "ivf"
+
+    # 增量段超过主段的该比例时合并
+    DELTA_COMPACT_RATIO = 0.1
+    # 训练/分配时每块的行数，控制临时矩阵内存
+    BLOCK_ROWS = 8192
+
+    def __init__(self, nlist: int = 0, nprobe: int = 8, iterations: int = 8):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.dimension: Optional[int] = None
+        # 训练簇中心时的向量数，数据量增长过多后重新训练
+        self._trained_size = 0
+
+        self._centroids = np.empty((0, 0), dtype=np.float32)
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._chunk_ids = np.empty(0, dtype=str)
+        self._document_ids = np.empty(0, dtype=str)
+        self._alive = np.empty(0, dtype=bool)
+
+        self._delta_vectors = np.empty((0, 0), dtype=np.float32)
+        self._delta_chunk_ids = np.empty(0, dtype=object)
+        self._delta_document_ids = np.empty(0, dtype=object)
+
+    @property
+    def size(self) -> int:
+        return int(np.count_nonzero(self._alive)) + len(self._delta_chunk_ids)
+
+    def chunk_id_set(self) -> np.ndarray:
+        main = np.asarray(self._chunk_ids[self._alive], dtype=object)
+        return np.concatenate([main, self._delta_chunk_ids])
+
+    def _assign(self, vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """分块计算每个向量最近的簇"""
+        assign = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), self.BLOCK_ROWS):
+            block = vectors[start:start + self.BLOCK_ROWS]
+            assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return assign
+
+    def _train(self, matrix: np.ndarray, nlist: int) -> np.ndarray:
+        """球面k-means训练簇中心（在采样子集上进行）"""
+        rng = np.random.default_rng(0)
+        n = len(matrix)
+        sample_size = min(n, max(nlist * 64, 10000), 262144)
+        sample = matrix[np.sort(rng.choice(n, sample_size, replace=False))]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(self.iterations):
+            assign = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=nlist)
+            empty = counts == 0
+            if np.any(empty):
+                # 空簇用随机样本重新初始化
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()), replace=False)]
+            centroids = normalize_rows(sums)
+
+        return np.ascontiguousarray(centroids, dtype=np.float32)
+
+    def _set_main(
+        self,
+        centroids: np.ndarray,
+        matrix: np.ndarray,
+        chunk_ids: np.ndarray,
+        document_ids: np.ndarray,
+        assign: np.ndarray
+    ) -> None:
+        """按簇排序写入主段"""
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=len(centroids))
+
+        self._centroids = centroids
+        self._vectors = np.ascontiguousarray(matrix[order], dtype=np.float32)
+        self._offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self._chunk_ids = np.asarray(chunk_ids, dtype=str)[order]
+        self._document_ids = np.asarray(document_ids, dtype=str)[order]
+        self._alive = np.ones(len(order), dtype=bool)
+
+        self._delta_vectors = np.empty((0, self.dimension), dtype=np.float32)
+        self._delta_chunk_ids = np.empty(0, dtype=object)
+        self._delta_document_ids = np.empty(0, dtype=object)
+
+    def build(self, chunk_ids: Sequence[str], document_ids: Sequence[str], matrix: np.ndarray) -> None:
+        n = len(chunk_ids)
+        if n == 0:
+            return
+
+        self.dimension = matrix.shape[1]
+        nlist = self.nlist or int(np.sqrt(n))
+        nlist = max(1, min(nlist, n))
+
+        centroids = self._train(matrix, nlist)
+        assign = self._assign(matrix, centroids)
+        self._set_main(centroids, matrix, np.asarray(chunk_ids), np.asarray(document_ids), assign)
+        self._trained_size = n
+
+        logger.info("IVF索引构建完成", vectors=n, nlist=nlist)
+
+    def compact(self) -> None:
+        """
+        把增量段合并进主段并清理墓碑
+
+        复用已有簇中心；数据量超过训练时的4倍则重新训练
+        """
+        if not len(self._centroids):
+            return
+
+        alive = self._alive
+        matrix = np.vstack([self._vectors[alive], self._delta_vectors])
+        chunk_ids = np.concatenate([self._chunk_ids[alive], np.asarray(self._delta_chunk_ids, dtype=str)])
+        document_ids = np.concatenate([self._document_ids[alive], np.asarray(self._delta_document_ids, dtype=str)])
+
+        if len(matrix) > 4 * max(self._trained_size, 1):
+            self.build(chunk_ids, document_ids, matrix)
+            return
+
+        assign = self._assign(matrix, self._centroids)
+        self._set_main(self._centroids, matrix, chunk_ids, document_ids, assign)
+
+    def add(self, chunk_ids: Sequence[str], document_ids: Sequence[str], vectors: np.ndarray) -> None:
+        if len(chunk_ids) == 0:
+            return
+        if not len(self._centroids):
+            self.build(chunk_ids, document_ids, vectors)
+            return
+
+        self.remove_chunks(chunk_ids)
+        self._delta_vectors = np.vstack([self._delta_vectors, vectors.astype(np.float32, copy=False)])
+        self._delta_chunk_ids = np.concatenate([self._delta_chunk_ids, np.asarray(chunk_ids, dtype=object)])
+        self._delta_document_ids = np.concatenate([self._delta_document_ids, np.asarray(document_ids, dtype=object)])
+
+        if len(self._delta_chunk_ids) > max(1000, self.DELTA_COMPACT_RATIO * len(self._chunk_ids)):
+            self.compact()
+
+    def remove_chunks(self, chunk_ids: Sequence[str]) -> int:
+        ids = [str(c) for c in chunk_ids]
+        main_hit = self._alive & np.isin(self._chunk_ids, np.asarray(ids, dtype=str))
+        delta_keep = ~np.isin(self._delta_chunk_ids, np.asarray(ids, dtype=object))
+        return self._drop(main_hit, delta_keep)
+
+    def remove_document(self, document_id: str) -> int:
+        main_hit = self._alive & (self._document_ids == document_id)
+        delta_keep = self._delta_document_ids != document_id
+        return self._drop(main_hit, delta_keep)
+
+    def _drop(self, main_hit: np.ndarray, delta_keep: np.ndarray) -> int:
+        removed = int(np.count_nonzero(main_hit)) + int(len(delta_keep) - np.count_nonzero(delta_keep))
+        if np.any(main_hit):
+            self._alive = self._alive & ~main_hit
+        if not np.all(delta_keep):
+            self._delta_vectors = self._delta_vectors[delta_keep]
+            self._delta_chunk_ids = self._delta_chunk_ids[delta_keep]
+            self._delta_document_ids = self._delta_document_ids[delta_keep]
+        return removed
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int,
+        document_id: str = None,
+        min_similarity: float = 0.0,
+        nprobe: int = None,
+        **params
+    ) -> List[Tuple[str, float]]:
+        """
+        Args:
+            query: 已归一化的查询向量
+            nprobe: 扫描的簇数量，越大召回越高、延迟越高
+        """
+        if not self.size or top_k <= 0:
+            return []
+
+        candidate_ids: List[np.ndarray] = []
+        candidate_scores: List[np.ndarray] = []
+
+        if len(self._centroids):
+            nprobe = max(1, min(nprobe or self.nprobe, len(self._centroids)))
+            centroid_scores = self._centroids @ query
+            probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+            rows = np.concatenate([
+                np.arange(self._offsets[c], self._offsets[c + 1]) for c in probe
+            ]).astype(np.int64)
+            keep = self._alive[rows]
+            if document_id:
+                keep &= self._document_ids[rows] == document_id
+            rows = rows[keep]
+
+            if len(rows):
+                candidate_scores.append(self._vectors[rows] @ query)
+                candidate_ids.append(np.asarray(self._chunk_ids[rows], dtype=object))
+
+        if len(self._delta_chunk_ids):
+            delta_mask = np.ones(len(self._delta_chunk_ids), dtype=bool)
+            if document_id:
+                delta_mask = self._delta_document_ids == document_id
+            if np.any(delta_mask):
+                candidate_scores.append(self._delta_vectors[delta_mask] @ query)
+                candidate_ids.append(self._delta_chunk_ids[delta_mask])
+
+        if not candidate_scores:
+            return []
+
+        scores = np.concatenate(candidate_scores)
+        ids = np.concatenate(candidate_ids)
+        order = select_top_k(scores, top_k, min_similarity)
+        return [(str(ids[i]), float(scores[i])) for i in order]
+
+    def save(self, directory: Path) -> None:
+        """合并增量段后持久化（逐文件原子替换，meta最后写入）"""
+        if not len(self._centroids):
+            return
+
+        self.compact()
+        directory = Path(directory) / self.name
+        directory.mkdir(parents=True, exist_ok=True)
+
+        _atomic_save_npy(directory / "centroids.npy", self._centroids)
+        _atomic_save_npy(directory / "vectors.npy", self._vectors)
+        _atomic_save_npy(directory / "offsets.npy", self._offsets)
+        _atomic_save_npy(directory / "chunk_ids.npy", self._chunk_ids)
+        _atomic_save_npy(directory / "document_ids.npy", self._document_ids)
+        _atomic_save_json(directory / "meta.json", {
+            "type": self.name,
+            "dimension": self.dimension,
+            "nlist": len(self._centroids),
+            "size": len(self._chunk_ids),
+            "trained_size": self._trained_size
+        })
+        logger.info("IVF索引已保存", path=str(directory), vectors=len(self._chunk_ids))
+
+    def load(self, directory: Path) -> bool:
+        """以mmap只读方式加载主段，返回是否加载成功"""
+        directory = Path(directory) / self.name
+        meta_path = directory / "meta.json"
+        if not meta_path.exists():
+            return False
+
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            vectors = np.load(directory / "vectors.npy", mmap_mode="r")
+            chunk_ids = np.load(directory / "chunk_ids.npy", mmap_mode="r")
+            if len(vectors) != meta["size"] or len(chunk_ids) != meta["size"]:
+                raise ValueError("索引文件与meta不一致")
+
+            self.dimension = meta["dimension"]
+            self._trained_size = meta.get("trained_size", meta["size"])
+            self._centroids = np.load(directory / "centroids.npy")
+            self._offsets = np.load(directory / "offsets.npy")
+            self._vectors = vectors
+            self._chunk_ids = chunk_ids
+            self._document_ids = np.load(directory / "document_ids.npy", mmap_mode="r")
+            self._alive = np.ones(len(vectors), dtype=bool)
+            self._delta_vectors = np.empty((0, self.dimension), dtype=np.float32)
+            self._delta_chunk_ids = np.empty(0, dtype=object)
+            self._delta_document_ids = np.empty(0, dtype=object)
+
+            logger.info("IVF索引已加载(mmap)", path=str(directory), vectors=meta["size"], nlist=meta["nlist"])
+            return True
+        except Exception as e:
+            logger.error("IVF索引加载失败，将重新构建", error=str(e))
+            return False
+
+
+class HNSWIndex(AnnIndex):
+    """
+    HNSW图索引（可选依赖 hnswlib）
+
+    hnswlib 使用整数label，这里维护 label -> chunk_id/document_id 的映射；
+    删除使用 mark_deleted，被删除的label不再复用。墓碑数超过存活数的 COMPACT_RATIO 倍时
+    （以及每次保存前）用存活向量重建图，label重新从0编号，图和映射的大小与存活数成正比
+    """
+
+    name = "hnsw"
+
+    # 墓碑超过存活向量的该比例时重建
+    COMPACT_RATIO = 0.5
+
+    def __init__(self, m: int = 16, ef_construction: int = 200, ef_search: int = 64):
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.dimension: Optional[int] = None
+
+        self._index = None
+        self._labels: Dict[str, int] = {}
+        self._chunk_ids: List[Optional[str]] = []
+        self._document_ids: List[Optional[str]] = []
+
+    @staticmethod
+    def _hnswlib():
+        try:
+            import hnswlib
+            return hnswlib
+        except ImportError:
+            raise ImportError("需要安装 hnswlib: pip install hnswlib")
+
+    @property
+    def size(self) -> int:
+        return len(self._labels)
+
+    @property
+    def deleted(self) -> int:
+        """已标记删除、尚未回收的label数"""
+        return len(self._chunk_ids) - len(self._labels)
+
+    def chunk_id_set(self) -> np.ndarray:
+        return np.asarray(list(self._labels.keys()), dtype=object)
+
+    def compact(self) -> None:
+        """用存活向量重建图，回收已删除的label"""
+        if self._index is None or not self.deleted:
+            return
+
+        labels = list(self._labels.values())
+        if not labels:
+            self._index = None
+            self._labels = {}
+            self._chunk_ids = []
+            self._document_ids = []
+            return
+
+        deleted = self.deleted
+        vectors = np.asarray(self._index.get_items(labels), dtype=np.float32)
+        chunk_ids = [self._chunk_ids[label] for label in labels]
+        document_ids = [self._document_ids[label] for label in labels]
+        self.build(chunk_ids, document_ids, vectors)
+        logger.info("HNSW索引已回收删除的label", vectors=len(labels), reclaimed=deleted)
+
+    def _maybe_compact(self) -> None:
+        if self.deleted > self.COMPACT_RATIO * max(self.size, 1):
+            self.compact()
+
+    def _new_index(self, capacity: int):
+        index = self._hnswlib().Index(space="ip", dim=self.dimension)
+        index.init_index(
+            max_elements=capacity,
+            M=self.m,
+            ef_construction=self.ef_construction,
+            allow_replace_deleted=True
+        )
+        index.set_ef(self.ef_search)
+        return index
+
+    def build(self, chunk_ids: Sequence[str], document_ids: Sequence[str], matrix: np.ndarray) -> None:
+        if len(chunk_ids) == 0:
+            return
+        self.dimension = matrix.shape[1]
+        self._index = self._new_index(max(1024, len(chunk_ids) * 2))
+        self._labels = {}
+        self._chunk_ids = []
+        self._document_ids = []
+        self.add(chunk_ids, document_ids, matrix)
+        logger.info("HNSW索引构建完成", vectors=len(chunk_ids))
+
+    def add(self, chunk_ids: Sequence[str], document_ids: Sequence[str], vectors: np.ndarray) -> None:
+        if len(chunk_ids) == 0:
+            return
+        if self._index is None:
+            self.build(chunk_ids, document_ids, vectors)
+            return
+
+        self.remove_chunks(chunk_ids)
+
+        start = len(self._chunk_ids)
+        needed = start + len(chunk_ids)
+        if needed > self._index.get_max_elements():
+            self._index.resize_index(max(needed, self._index.get_max_elements() * 2))
+
+        labels = np.arange(start, needed)
+        self._index.add_items(vectors.astype(np.float32, copy=False), labels)
+        for label, chunk_id, document_id in zip(labels, chunk_ids, document_ids):
+            self._labels[str(chunk_id)] = int(label)
+        self._chunk_ids.extend(str(c) for c in chunk_ids)
+        self._document_ids.extend(str(d) for d in document_ids)
+        self._maybe_compact()
+
+    def _mark_deleted(self, labels: List[int]) -> int:
+        for label in labels:
+            self._index.mark_deleted(label)
+            self._labels.pop(self._chunk_ids[label], None)
+            self._chunk_ids[label] = None
+            self._document_ids[label] = None
+        return len(labels)
+
+    def remove_chunks(self, chunk_ids: Sequence[str]) -> int:
+        if self._index is None:
+            return 0
+        labels = [self._labels[c] for c in map(str, chunk_ids) if c in self._labels]
+        return self._mark_deleted(labels)
+
+    def remove_document(self, document_id: str) -> int:
+        if self._index is None:
+            return 0
+        labels = [i for i, d in enumerate(self._document_ids) if d == document_id]
+        removed = self._mark_deleted(labels)
+        self._maybe_compact()
+        return removed
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int,
+        document_id: str = None,
+        min_similarity: float = 0.0,
+        ef_search: int = None,
+        **params
+    ) -> List[Tuple[str, float]]:
+        """
+        Args:
+            query: 已归一化的查询向量
+            ef_search: 搜索时的候选队列长度，越大召回越高、延迟越高
+        """
+        if not self.size or top_k <= 0:
+            return []
+
+        k = min(top_k, self.size)
+        self._index.set_ef(max(ef_search or self.ef_search, k))
+
+        filter_fn = None
+        if document_id:
+            document_ids = self._document_ids
+            filter_fn = lambda label: document_ids[label] == document_id
+
+        try:
+            labels, distances = self._index.knn_query(query, k=k, filter=filter_fn)
+        except RuntimeError:
+            # 过滤后候选不足k个
+            return []
+
+        results = []
+        for label, distance in zip(labels[0], distances[0]):
+            similarity = 1.0 - float(distance)
+            if similarity >= min_similarity:
+                results.append((self._chunk_ids[label], similarity))
+        return results
+
+    def save(self, directory: Path) -> None:
+        """回收删除的label后持久化，加载到的图不含墓碑"""
+        self.compact()
+        if self._index is None:
+            return
+        directory = Path(directory) / self.name
+        directory.mkdir(parents=True, exist_ok=True)
+
+        tmp_path = _temp_path(directory / "graph.bin")
+        try:
+            self._index.save_index(str(tmp_path))
+            os.replace(tmp_path, directory / "graph.bin")
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        _atomic_save_npy(directory / "chunk_ids.npy", np.asarray(
+            [c or "" for c in self._chunk_ids], dtype=str
+        ))
+        _atomic_save_npy(directory / "document_ids.npy", np.asarray(
+            [d or "" for d in self._document_ids], dtype=str
+        ))
+        _atomic_save_json(directory / "meta.json", {
+            "type": self.name,
+            "dimension": self.dimension,
+            "labels": len(self._chunk_ids),
+            "size": self.size
+        })
+        logger.info("HNSW索引已保存", path=str(directory), vectors=self.size)
+
+    def load(self, directory: Path) -> bool:
+        directory = Path(directory) / self.name
+        meta_path = directory / "meta.json"
+        if not meta_path.exists():
+            return False
+
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            self.dimension = meta["dimension"]
+            chunk_ids = np.load(directory / "chunk_ids.npy").tolist()
+            document_ids = np.load(directory / "document_ids.npy").tolist()
+
+            index = self._hnswlib().Index(space="ip", dim=self.dimension)
+            index.load_index(
+                str(directory / "graph.bin"),
+                max_elements=max(1024, len(chunk_ids) * 2),
+                allow_replace_deleted=True
+            )
+            index.set_ef(self.ef_search)
+
+            self._index = index
+            self._chunk_ids = [c or None for c in chunk_ids]
+            self._document_ids = [d or None for d in document_ids]
+            self._labels = {c: i for i, c in enumerate(self._chunk_ids) if c}
+
+            logger.info("HNSW索引已加载", path=str(directory), vectors=self.size)
+            return True
+        except ImportError:
+            raise
+        except Exception as e:
+            logger.error("HNSW索引加载失败，将重新构建", error=str(e))
+            return False
+
+
+def create_ann_index(name: str) -> AnnIndex:
+    """按名称创建ANN索引（参数来自配置）"""
+    settings = get_settings()
+    if name == IVFFlatIndex.name:
+        return IVFFlatIndex(nlist=settings.VECTOR_IVF_NLIST, nprobe=settings.VECTOR_IVF_NPROBE)
+    if name == HNSWIndex.name:
+        return HNSWIndex(
+            m=settings.VECTOR_HNSW_M,
+            ef_construction=settings.VECTOR_HNSW_EF_CONSTRUCTION,
+            ef_search=settings.VECTOR_HNSW_EF_SEARCH
+        )
+    raise ValueError(f"未知的ANN索引类型: {name}")
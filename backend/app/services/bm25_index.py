@@ -0,0 +1,266 @@
+"""
+BM25关键词索引
+常驻内存的倒排索引（DocumentChunk.content），弥补语义搜索对函数名、错误码等
+精确标识符的召回不足；与向量结果通过倒数排名融合（RRF）合并
+"""
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import structlog
+
+from app.models.database import Document, DocumentChunk
+from app.services.vector_index import select_top_k
+
+logger = structlog.get_logger(__name__)
+
+# ASCII标识符 / 连续的CJK字符（中日韩统一表意文字、假名、韩文音节）
+_TOKEN_PATTERN = re.compile(
+    r"[A-Za-z0-9_]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+"
+)
+_CAMEL_PATTERN = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    CJK感知的分词
+
+    - 标识符整体保留（小写），含下划线或驼峰时额外拆出子词，
+      如 getUserName -> getusername, get, user, name
+    - CJK连续字符切分为二元组（单字保留单字），无需词典
+
+    Args:
+        text: 输入文本
+
+    Returns:
+        词项列表（保留重复，用于词频统计）
+    """
+    tokens: List[str] = []
+    if not text:
+        return tokens
+
+    for match in _TOKEN_PATTERN.finditer(text):
+        run = match.group()
+        if run[0].isascii():
+            tokens.append(run.lower())
+            parts = [p for piece in run.split("_") for p in _CAMEL_PATTERN.findall(piece)]
+            if len(parts) > 1:
+                tokens.extend(p.lower() for p in parts)
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[str]],
+    k: int = 60
+) -> List[Tuple[str, float]]:
+    """
+    倒数排名融合: score(d) = Σ 1 / (k + rank_i(d))，rank从1开始
+
+    Args:
+        rankings: 多路检索结果的id列表（按相关度降序）
+        k: 平滑常数
+
+    Returns:
+        [(id, score)]，按融合分数降序
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """
+    增量维护的BM25倒排索引
+
+    - _postings: 词项 -> {槽位: 词频}
+    - _lengths: 每个槽位的文档长度（词项数），删除后置0并回收槽位
+    - _slot_terms: 每个槽位包含的词项，用于删除时清理倒排表
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._reset()
+        self._loaded = False
+
+    def _reset(self) -> None:
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._lengths = np.zeros(0, dtype=np.float32)
+        self._chunk_ids: List[Optional[str]] = []
+        self._document_ids: List[Optional[str]] = []
+        self._slot_terms: List[Optional[List[str]]] = []
+        self._slots_by_document: Dict[str, List[int]] = {}
+        self._slot_by_chunk: Dict[str, int] = {}
+        self._free_slots: List[int] = []
+        self._total_length = 0.0
+
+    @property
+    def size(self) -> int:
+        """索引中的chunk数量"""
+        return len(self._slot_by_chunk)
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded
+
+    async def load(self, db: AsyncSession) -> None:
+        """从数据库全量构建索引（跳过已删除文档遗留的chunks）"""
+        result = await db.execute(
+            select(
+                DocumentChunk.id,
+                DocumentChunk.document_id,
+                DocumentChunk.content
+            ).join(
+                Document, Document.id == DocumentChunk.document_id
+            )
+        )
+        self._reset()
+        for chunk_id, document_id, content in result.all():
+            self._add(chunk_id, document_id, content)
+        self._loaded = True
+
+        logger.info("BM25索引构建完成", chunks=self.size, terms=len(self._postings))
+
+    async def ensure_loaded(self, db: AsyncSession) -> None:
+        """索引未构建时延迟构建"""
+        if not self._loaded:
+            await self.load(db)
+
+    def _add(self, chunk_id: str, document_id: str, content: Optional[str]) -> None:
+        if chunk_id in self._slot_by_chunk:
+            self._remove_slot(self._slot_by_chunk[chunk_id])
+
+        term_counts = Counter(tokenize(content or ""))
+
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            self._chunk_ids[slot] = chunk_id
+            self._document_ids[slot] = document_id
+            self._slot_terms[slot] = list(term_counts)
+        else:
+            slot = len(self._chunk_ids)
+            self._chunk_ids.append(chunk_id)
+            self._document_ids.append(document_id)
+            self._slot_terms.append(list(term_counts))
+            if slot >= len(self._lengths):
+                lengths = np.zeros(max(1024, 2 * len(self._lengths)), dtype=np.float32)
+                lengths[:len(self._lengths)] = self._lengths
+                self._lengths = lengths
+
+        length = sum(term_counts.values())
+        self._lengths[slot] = length
+        self._total_length += length
+        for term, count in term_counts.items():
+            self._postings.setdefault(term, {})[slot] = count
+
+        self._slot_by_chunk[chunk_id] = slot
+        self._slots_by_document.setdefault(document_id, []).append(slot)
+
+    def _remove_slot(self, slot: int) -> None:
+        for term in self._slot_terms[slot] or []:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(slot, None)
+                if not postings:
+                    del self._postings[term]
+
+        document_slots = self._slots_by_document.get(self._document_ids[slot])
+        if document_slots is not None:
+            document_slots.remove(slot)
+            if not document_slots:
+                del self._slots_by_document[self._document_ids[slot]]
+
+        self._total_length -= float(self._lengths[slot])
+        self._lengths[slot] = 0.0
+        del self._slot_by_chunk[self._chunk_ids[slot]]
+        self._chunk_ids[slot] = None
+        self._document_ids[slot] = None
+        self._slot_terms[slot] = None
+        self._free_slots.append(slot)
+
+    def add_chunks(
+        self,
+        document_id: str,
+        chunks: Iterable[Tuple[str, Optional[str]]]
+    ) -> None:
+        """
+        写入/覆盖某个文档的chunks
+
+        Args:
+            document_id: 文档ID
+            chunks: [(chunk_id, content)]
+        """
+        count = 0
+        for chunk_id, content in chunks:
+            self._add(chunk_id, document_id, content)
+            count += 1
+        logger.info("BM25索引已同步文档", document_id=document_id, chunks=count)
+
+    def remove_document(self, document_id: str) -> int:
+        """
+        移除某个文档的所有chunks
+
+        Returns:
+            移除的chunk数量
+        """
+        slots = list(self._slots_by_document.get(document_id, []))
+        for slot in slots:
+            self._remove_slot(slot)
+        return len(slots)
+
+    def search(
+        self,
+        query_text: str,
+        top_k: int = 10,
+        document_ids: Optional[Set[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        BM25检索
+
+        Args:
+            query_text: 查询文本
+            top_k: 返回结果数量
+            document_ids: 允许的文档ID集合（元数据预过滤结果），None 表示不过滤
+
+        Returns:
+            [(chunk_id, bm25_score)]，按分数降序
+        """
+        n_docs = self.size
+        terms = set(tokenize(query_text))
+        if not n_docs or not terms or top_k <= 0:
+            return []
+
+        avg_length = self._total_length / n_docs if self._total_length else 1.0
+        norm = self.k1 * (1.0 - self.b + self.b * self._lengths / avg_length)
+        scores = np.zeros(len(self._lengths), dtype=np.float32)
+
+        for term in terms:
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            slots = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+            tf = np.fromiter(postings.values(), dtype=np.float32, count=len(postings))
+            idf = math.log(1.0 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            scores[slots] += idf * tf * (self.k1 + 1.0) / (tf + norm[slots])
+
+        mask = scores > 0
+        if document_ids is not None:
+            allowed = [
+                slot for doc_id in document_ids for slot in self._slots_by_document.get(doc_id, ())
+            ]
+            allowed_mask = np.zeros(len(scores), dtype=bool)
+            allowed_mask[allowed] = True
+            mask &= allowed_mask
+
+        order = select_top_k(scores, top_k, mask=mask)
+        return [(self._chunk_ids[slot], float(scores[slot])) for slot in order]
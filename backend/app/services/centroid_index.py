@@ -0,0 +1,222 @@
+"""
+文档质心索引
+每个文档的chunk向量均值（再归一化）作为文档向量，用于:
+- 两阶段检索: 先按质心选出最相关的M个文档，再只对这些文档的chunks精确打分
+- “相似文档”推荐: 直接在质心上检索
+"""
+import time
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import structlog
+
+from app.services.vector_index import VectorIndex, normalize_rows, select_top_k
+
+logger = structlog.get_logger(__name__)
+
+
+class DocumentCentroidIndex:
+    """
+    常驻内存的文档质心
+
+    - _matrix: (M, D) 已归一化的质心矩阵
+    - _document_ids: 与矩阵行对应的文档ID
+    - _chunk_counts: 每个文档参与计算的chunk数
+
+    与 VectorIndex 一样，写操作构建新数组后整体替换
+    """
+
+    def __init__(self):
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._document_ids = np.empty(0, dtype=object)
+        self._chunk_counts = np.empty(0, dtype=np.int64)
+        self._rows: Dict[str, int] = {}
+        self._built = False
+
+    @property
+    def size(self) -> int:
+        """质心（文档）数量"""
+        return len(self._document_ids)
+
+    @property
+    def is_built(self) -> bool:
+        return self._built
+
+    def build(self, document_ids: Sequence[str], matrix: np.ndarray) -> None:
+        """
+        从chunk向量全量构建
+
+        Args:
+            document_ids: 与矩阵行对应的文档ID
+            matrix: (N, D) 已归一化的chunk向量
+        """
+        document_ids = np.asarray(document_ids, dtype=object)
+        if not len(document_ids):
+            dimension = matrix.shape[1] if matrix.ndim == 2 else 0
+            self._set_arrays(
+                np.empty((0, dimension), dtype=np.float32),
+                np.empty(0, dtype=object),
+                np.empty(0, dtype=np.int64)
+            )
+        else:
+            # 按文档排序后分段求和，一次完成所有文档的聚合
+            uniques, inverse = np.unique(document_ids, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            order = np.argsort(inverse, kind="stable")
+            counts = np.bincount(inverse, minlength=len(uniques))
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            sums = np.add.reduceat(np.asarray(matrix[order], dtype=np.float32), starts, axis=0)
+            self._set_arrays(normalize_rows(sums), uniques, counts)
+
+        self._built = True
+        logger.info("文档质心构建完成", documents=self.size)
+
+    def _set_arrays(self, matrix: np.ndarray, document_ids: np.ndarray, counts: np.ndarray) -> None:
+        self._matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self._document_ids = document_ids
+        self._chunk_counts = counts
+        self._rows = {document_id: row for row, document_id in enumerate(document_ids.tolist())}
+
+    def set_document(self, document_id: str, matrix: Optional[np.ndarray]) -> None:
+        """按文档最新的chunk向量更新质心（无向量时移除）"""
+        if matrix is None or not len(matrix):
+            self.remove_document(document_id)
+            return
+
+        centroid = normalize_rows(np.asarray(matrix, dtype=np.float32).sum(axis=0, keepdims=True))
+        row = self._rows.get(document_id)
+        if row is not None and self._matrix.shape[1] == centroid.shape[1]:
+            new_matrix = self._matrix.copy()
+            new_matrix[row] = centroid[0]
+            counts = self._chunk_counts.copy()
+            counts[row] = len(matrix)
+            self._set_arrays(new_matrix, self._document_ids, counts)
+            return
+
+        self.remove_document(document_id)
+        base = self._matrix if self.size else np.empty((0, centroid.shape[1]), dtype=np.float32)
+        self._set_arrays(
+            np.vstack([base, centroid]),
+            np.concatenate([self._document_ids, np.asarray([document_id], dtype=object)]),
+            np.concatenate([self._chunk_counts, [len(matrix)]])
+        )
+
+    def remove_document(self, document_id: str) -> bool:
+        row = self._rows.get(document_id)
+        if row is None:
+            return False
+        keep = np.ones(self.size, dtype=bool)
+        keep[row] = False
+        self._set_arrays(self._matrix[keep], self._document_ids[keep], self._chunk_counts[keep])
+        return True
+
+    def chunk_counts(self) -> Dict[str, int]:
+        """每个文档参与计算质心的chunk数"""
+        return dict(zip(self._document_ids.tolist(), self._chunk_counts.tolist()))
+
+    def get(self, document_id: str) -> Optional[np.ndarray]:
+        """文档的质心向量"""
+        row = self._rows.get(document_id)
+        return self._matrix[row] if row is not None else None
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_m: int,
+        allowed_documents: Optional[Set[str]] = None,
+        exclude: Optional[str] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        按质心相似度选择文档
+
+        Args:
+            query: 已归一化的查询向量
+            top_m: 返回文档数量
+            allowed_documents: 允许的文档ID集合（元数据预过滤结果），None 表示不过滤
+            exclude: 排除的文档ID（相似文档推荐时排除自身）
+
+        Returns:
+            [(document_id, similarity)]，按相似度降序
+        """
+        matrix, document_ids = self._matrix, self._document_ids
+        if not len(document_ids) or matrix.shape[1] != query.shape[0]:
+            return []
+
+        mask = None
+        if allowed_documents is not None:
+            mask = np.isin(document_ids, list(allowed_documents))
+        if exclude is not None and exclude in self._rows:
+            if mask is None:
+                mask = np.ones(len(document_ids), dtype=bool)
+            mask[self._rows[exclude]] = False
+
+        scores = matrix @ query
+        order = select_top_k(scores, top_m, mask=mask)
+        return [(document_ids[i], float(scores[i])) for i in order]
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "documents": self.size,
+            "built": self._built,
+            "avg_chunks_per_document": round(float(self._chunk_counts.mean()), 2) if self.size else 0.0,
+            "memory_mb": round(self._matrix.nbytes / 1024 / 1024, 3)
+        }
+
+
+def evaluate_two_stage(
+    index: VectorIndex,
+    centroids: DocumentCentroidIndex,
+    top_k: int = 10,
+    documents: int = 20,
+    queries: int = 20,
+    seed: int = 0
+) -> Dict[str, float]:
+    """
+    评估两阶段检索相对精确搜索的recall@k和延迟：以索引中的随机向量为查询
+
+    Args:
+        documents: 第一阶段选取的文档数
+
+    Returns:
+        recall@k、平均打分的chunk占比及两种方式的平均耗时（毫秒）
+    """
+    _, _, matrix = index.snapshot()
+    n = len(matrix)
+    if n == 0 or not centroids.size:
+        return {"recall_at_k": 0.0, "k": top_k, "documents": documents, "queries": 0}
+
+    k = min(top_k, n)
+    rng = np.random.default_rng(seed)
+    query_rows = rng.choice(n, min(queries, n), replace=False)
+    chunk_counts = centroids.chunk_counts()
+
+    recall = 0.0
+    scanned = 0.0
+    exact_ms = 0.0
+    two_stage_ms = 0.0
+    for row in query_rows:
+        query = np.asarray(matrix[row])
+
+        start = time.perf_counter()
+        exact = index.search(query, top_k=k, min_similarity=-1.0)
+        exact_ms += time.perf_counter() - start
+
+        start = time.perf_counter()
+        selected = [document_id for document_id, _ in centroids.search(query, documents)]
+        approx = index.search(query, top_k=k, min_similarity=-1.0, filters={"document_id": selected})
+        two_stage_ms += time.perf_counter() - start
+
+        exact_ids = {chunk_id for chunk_id, _ in exact}
+        recall += len(exact_ids.intersection(chunk_id for chunk_id, _ in approx)) / max(1, len(exact_ids))
+        scanned += sum(chunk_counts.get(document_id, 0) for document_id in selected) / n
+
+    count = len(query_rows)
+    return {
+        "recall_at_k": round(recall / count, 4),
+        "scanned_fraction": round(scanned / count, 4),
+        "exact_ms": round(exact_ms * 1000 / count, 3),
+        "two_stage_ms": round(two_stage_ms * 1000 / count, 3),
+        "k": k,
+        "documents": documents,
+        "queries": int(count)
+    }
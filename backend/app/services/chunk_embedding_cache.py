@@ -0,0 +1,93 @@
+"""
+chunk向量内容缓存
+重新分块会删除并重建文档的全部chunk，许可证头、import、检查项等样板文本也在大量文档间重复；
+以 (模型名, 规范化文本的SHA-256) 为键把chunk向量持久化到数据库，向量化时只把未命中的文本交给模型
+"""
+import hashlib
+from typing import Dict, Iterable, List, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import structlog
+
+from app.models.database import EmbeddingCacheEntry
+from app.services.embedding_cache import normalize_query
+from app.services.embedding_codec import decode_embedding_blob, encode_embedding
+
+logger = structlog.get_logger(__name__)
+
+# 单条 IN 查询的最大参数数（低于SQLite的变量数上限）
+LOOKUP_BATCH_SIZE = 500
+
+
+def content_hash(text: str) -> str:
+    """规范化文本（NFKC + 空白折叠）的SHA-256摘要"""
+    return hashlib.sha256(normalize_query(text).encode("utf-8")).hexdigest()
+
+
+async def lookup_embeddings(
+    db: AsyncSession,
+    model_name: str,
+    hashes: Iterable[str]
+) -> Dict[str, List[float]]:
+    """
+    按内容摘要批量查询缓存的向量
+
+    Returns:
+        {content_hash: 向量}，只包含命中的摘要
+    """
+    unique = list(dict.fromkeys(hashes))
+    found: Dict[str, List[float]] = {}
+    for start in range(0, len(unique), LOOKUP_BATCH_SIZE):
+        batch = unique[start:start + LOOKUP_BATCH_SIZE]
+        result = await db.execute(
+            select(EmbeddingCacheEntry.content_hash, EmbeddingCacheEntry.embedding_blob).where(
+                EmbeddingCacheEntry.model_name == model_name,
+                EmbeddingCacheEntry.content_hash.in_(batch)
+            )
+        )
+        for hash_value, blob in result.all():
+            found[hash_value] = decode_embedding_blob(blob).tolist()
+    return found
+
+
+async def store_embeddings(
+    db: AsyncSession,
+    model_name: str,
+    entries: Dict[str, Sequence[float]]
+) -> int:
+    """
+    写入新生成的向量（随调用方的事务提交）
+
+    并发向量化相同文本时可能已有其他请求写入，SQLite/PostgreSQL 使用冲突忽略写入，
+    其他数据库跳过已存在的摘要
+
+    Returns:
+        写入的条目数
+    """
+    if not entries:
+        return 0
+
+    rows = [
+        {
+            "model_name": model_name,
+            "content_hash": hash_value,
+            "embedding_blob": encode_embedding(embedding),
+            "embedding_dim": len(embedding)
+        }
+        for hash_value, embedding in entries.items()
+    ]
+
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        await db.execute(insert(EmbeddingCacheEntry).on_conflict_do_nothing(), rows)
+    else:
+        existing = await lookup_embeddings(db, model_name, entries.keys())
+        db.add_all(EmbeddingCacheEntry(**row) for row in rows if row["content_hash"] not in existing)
+
+    return len(rows)
+
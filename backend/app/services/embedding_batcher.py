@@ -0,0 +1,150 @@
+"""
+查询向量动态微批
+高并发时每个搜索请求单独调用 model.encode([text])，无法利用模型的批处理能力；
+调用方把文本放入队列并等待future，单个后台worker在攒满批次或等待超时后合并为一次encode调用
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+EmbedFunction = Callable[[List[str]], Awaitable[List[Optional[List[float]]]]]
+
+
+class EmbeddingMicroBatcher:
+    """
+    异步微批器
+
+    - submit(): 入队并等待结果
+    - 后台worker: 取到第一个文本后最多再等待 max_wait_ms 或攒满 max_batch_size，
+      批内相同文本只编码一次
+    - worker在首次提交时于当前事件循环中启动，事件循环变化时重新启动
+    """
+
+    def __init__(self, embed_fn: EmbedFunction, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.embed_fn = embed_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: Deque[Tuple[str, asyncio.Future, float]] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # 指标
+        self.submitted = 0
+        self.batches = 0
+        self.batched_texts = 0
+        self.encoded_texts = 0
+        self.failed_batches = 0
+        self.max_queue_depth = 0
+        self.largest_batch = 0
+        self._total_wait = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """当前等待编码的文本数"""
+        return len(self._queue)
+
+    def _ensure_worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._worker is not None and not self._worker.done() and self._loop is loop:
+            return
+        if self._loop is not loop:
+            # 旧事件循环中遗留的请求无法再被唤醒，直接丢弃
+            self._queue.clear()
+            self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._worker = loop.create_task(self._run())
+
+    async def submit(self, text: str) -> Optional[List[float]]:
+        """提交文本并等待所在批次完成"""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((text, future, time.perf_counter()))
+        self.submitted += 1
+        self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+        self._wakeup.set()
+        return await future
+
+    async def _run(self) -> None:
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            # 攒批: 满批立即执行，否则等到第一个文本入队后 max_wait
+            deadline = self._queue[0][2] + self.max_wait
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            batch = [self._queue.popleft() for _ in range(min(self.max_batch_size, len(self._queue)))]
+            await self._encode(batch)
+
+    async def _encode(self, batch: List[Tuple[str, asyncio.Future, float]]) -> None:
+        start = time.perf_counter()
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        try:
+            embeddings = await self.embed_fn(texts)
+        except asyncio.CancelledError:
+            for _, future, _ in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            self.failed_batches += 1
+            logger.error("微批向量化失败", error=str(e), batch_size=len(batch))
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        by_text = dict(zip(texts, embeddings))
+        for text, future, enqueued_at in batch:
+            self._total_wait += start - enqueued_at
+            if not future.done():
+                future.set_result(by_text.get(text))
+
+        self.batches += 1
+        self.batched_texts += len(batch)
+        self.encoded_texts += len(texts)
+        self.largest_batch = max(self.largest_batch, len(batch))
+
+    async def close(self) -> None:
+        """停止worker，未完成的请求以取消结束"""
+        worker, self._worker = self._worker, None
+        if worker is not None and not worker.done():
+            worker.cancel()
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+        while self._queue:
+            _, future, _ = self._queue.popleft()
+            if not future.done():
+                future.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """队列深度与批次统计"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": round(self.max_wait * 1000, 3),
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "submitted": self.submitted,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "encoded_texts": self.encoded_texts,
+            "largest_batch": self.largest_batch,
+            "avg_batch_size": round(self.batched_texts / self.batches, 2) if self.batches else 0.0,
+            "avg_queue_wait_ms": round(self._total_wait * 1000 / self.batched_texts, 3) if self.batched_texts else 0.0
+        }
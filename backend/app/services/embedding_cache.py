@@ -0,0 +1,182 @@
+"""
+查询向量缓存
+Agent会反复提交相同的查询，缓存查询文本的向量以跳过重复的模型推理
+
+- QueryEmbeddingCache: 进程内有界LRU，可选TTL
+- RedisQueryEmbeddingCache: Redis共享缓存（REDIS_ENABLED时可用），所有uvicorn worker共享
+
+缓存键由模型名和规范化后的查询文本（NFKC + 空白折叠）组成
+"""
+import hashlib
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import structlog
+
+from app.core.config import get_settings
+from app.services.embedding_codec import decode_embedding_blob, encode_embedding
+
+logger = structlog.get_logger(__name__)
+
+
+def normalize_query(text: str) -> str:
+    """规范化查询文本：Unicode NFKC，折叠连续空白并去除首尾空白"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def make_cache_key(model_name: str, text: str) -> str:
+    """缓存键: 模型名 + 规范化文本的摘要"""
+    digest = hashlib.sha1(normalize_query(text).encode("utf-8")).hexdigest()
+    return f"{model_name}:{digest}"
+
+
+class QueryEmbeddingCache:
+    """进程内LRU查询向量缓存"""
+
+    backend = "memory"
+
+    def __init__(self, model_name: str, max_size: int = 10000, ttl: Optional[float] = None):
+        self.model_name = model_name
+        self.max_size = max_size
+        self.ttl = ttl or None
+        self._entries: "OrderedDict[str, Tuple[List[float], Optional[float]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(self, text: str) -> Optional[List[float]]:
+        """查询缓存，过期的条目视为未命中"""
+        key = make_cache_key(self.model_name, text)
+        entry = self._entries.get(key)
+        if entry is not None:
+            embedding, expires_at = entry
+            if expires_at is None or expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    async def set(self, text: str, embedding: List[float]) -> None:
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        key = make_cache_key(self.model_name, text)
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        self._entries[key] = (embedding, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        total = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "model": self.model_name,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+class RedisQueryEmbeddingCache:
+    """
+    Redis共享查询向量缓存
+
+    向量以小端float32字节存储；Redis不可用时按未命中处理，不影响搜索。
+    键空间没有容量上限，每个条目都带过期时间（未指定时为 DEFAULT_TTL）。
+    命中统计为当前worker进程的计数
+    """
+
+    backend = "redis"
+
+    KEY_PREFIX = "ai_context:query_embedding"
+
+    DEFAULT_TTL = 86400
+
+    def __init__(self, model_name: str, ttl: Optional[float] = None):
+        self.model_name = model_name
+        self.ttl = int(ttl) if ttl and ttl > 0 else self.DEFAULT_TTL
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _key(self, text: str) -> str:
+        return f"{self.KEY_PREFIX}:{make_cache_key(self.model_name, text)}"
+
+    async def get(self, text: str) -> Optional[List[float]]:
+        from app.core.redis import get_redis
+
+        try:
+            client = await get_redis()
+            value = await client.get(self._key(text))
+        except Exception as e:
+            self.errors += 1
+            logger.warning("读取查询向量缓存失败", error=str(e))
+            value = None
+
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return decode_embedding_blob(value).tolist()
+
+    async def set(self, text: str, embedding: List[float]) -> None:
+        from app.core.redis import get_redis
+
+        try:
+            client = await get_redis()
+            await client.set(self._key(text), encode_embedding(embedding), ex=self.ttl)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("写入查询向量缓存失败", error=str(e))
+
+    async def clear(self) -> None:
+        from app.core.redis import get_redis
+
+        client = await get_redis()
+        async for key in client.scan_iter(match=f"{self.KEY_PREFIX}:{self.model_name}:*"):
+            await client.delete(key)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "model": self.model_name,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+def create_query_embedding_cache(model_name: str):
+    """
+    按配置创建查询向量缓存
+
+    QUERY_EMBEDDING_CACHE_SIZE 为0时禁用；启用Redis时默认使用Redis共享缓存，
+    未设置 QUERY_EMBEDDING_CACHE_TTL 时Redis条目按 QUERY_EMBEDDING_REDIS_TTL 过期
+
+    Returns:
+        缓存实例，禁用时返回 None
+    """
+    settings = get_settings()
+    if settings.QUERY_EMBEDDING_CACHE_SIZE <= 0:
+        return None
+
+    ttl = settings.QUERY_EMBEDDING_CACHE_TTL or None
+    backend = settings.QUERY_EMBEDDING_CACHE_BACKEND
+    if backend == "redis" or (backend == "auto" and settings.REDIS_ENABLED):
+        return RedisQueryEmbeddingCache(model_name, ttl=ttl or settings.QUERY_EMBEDDING_REDIS_TTL)
+    return QueryEmbeddingCache(model_name, max_size=settings.QUERY_EMBEDDING_CACHE_SIZE, ttl=ttl)
@@ -0,0 +1,156 @@
+"""
+向量二进制编解码
+向量以小端float32原始字节存储在 DocumentChunk.embedding_blob 中，
+384维向量仅占1.5KB（JSON文本约8KB），解码为 np.frombuffer 零拷贝视图
+
+迁移期间采用双读：优先读取二进制列，未迁移的行回退到JSON文本列
+"""
+import json
+from typing import Optional, Sequence
+
+import numpy as np
+from sqlalchemy import select, update, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+import structlog
+
+from app.models.database import DocumentChunk
+
+logger = structlog.get_logger(__name__)
+
+# 小端float32，与平台字节序无关
+EMBEDDING_DTYPE = np.dtype("<f4")
+
+
+def encode_embedding(embedding: Sequence[float]) -> bytes:
+    """
+    编码向量为原始小端float32字节
+
+    Args:
+        embedding: 向量
+
+    Returns:
+        字节串，长度为 4 * 维度
+    """
+    return np.asarray(embedding, dtype=EMBEDDING_DTYPE).tobytes()
+
+
+def decode_embedding_blob(blob: bytes) -> np.ndarray:
+    """
+    零拷贝解码二进制向量（返回只读视图）
+
+    Args:
+        blob: encode_embedding 产生的字节串
+
+    Returns:
+        一维float32数组
+    """
+    if len(blob) % EMBEDDING_DTYPE.itemsize:
+        raise ValueError(f"向量字节长度非法: {len(blob)}")
+    return np.frombuffer(blob, dtype=EMBEDDING_DTYPE)
+
+
+def decode_embedding(blob: Optional[bytes], text: Optional[str]) -> Optional[np.ndarray]:
+    """
+    双读解码：优先二进制列，回退到JSON文本列
+
+    Args:
+        blob: embedding_blob 列的值
+        text: embedding 列的值（JSON）
+
+    Returns:
+        一维float32数组，两列都不可用时返回 None
+    """
+    if blob:
+        try:
+            return decode_embedding_blob(blob)
+        except ValueError as e:
+            logger.warning("二进制向量解码失败，回退JSON", error=str(e))
+    if text:
+        try:
+            return np.asarray(json.loads(text), dtype=np.float32)
+        except Exception as e:
+            logger.error(f"反序列化向量失败: {str(e)}")
+    return None
+
+
+def has_embedding():
+    """chunk已向量化的过滤条件（兼容两种存储格式）"""
+    return or_(
+        DocumentChunk.embedding_blob.isnot(None),
+        DocumentChunk.embedding.isnot(None)
+    )
+
+
+async def migrate_embeddings_to_binary(
+    db: AsyncSession,
+    batch_size: int = 500,
+    model_name: Optional[str] = None,
+    drop_json: bool = False
+) -> dict:
+    """
+    一次性迁移：把JSON文本向量转换为二进制列
+
+    按主键分批处理并逐批提交，可重复执行（只处理尚未迁移的行）
+
+    Args:
+        db: 数据库会话
+        batch_size: 每批处理的行数
+        model_name: 写入 embedding_model 的模型名（未知时留空）
+        drop_json: 迁移后清空JSON文本列（双读期结束后使用）
+
+    Returns:
+        迁移统计
+    """
+    stats = {"converted": 0, "failed": 0, "json_dropped": 0}
+    last_id = ""
+
+    while True:
+        result = await db.execute(
+            select(DocumentChunk.id, DocumentChunk.embedding)
+            .filter(
+                DocumentChunk.embedding_blob.is_(None),
+                DocumentChunk.embedding.isnot(None),
+                DocumentChunk.id > last_id
+            )
+            .order_by(DocumentChunk.id)
+            .limit(batch_size)
+        )
+        rows = result.all()
+        if not rows:
+            break
+
+        updates = []
+        for chunk_id, text in rows:
+            vector = decode_embedding(None, text)
+            if vector is None or vector.size == 0:
+                stats["failed"] += 1
+                continue
+            updates.append({
+                "id": chunk_id,
+                "embedding_blob": encode_embedding(vector),
+                "embedding_dim": int(vector.size),
+                "embedding_model": model_name
+            })
+
+        if updates:
+            await db.execute(update(DocumentChunk), updates)
+        await db.commit()
+
+        stats["converted"] += len(updates)
+        last_id = rows[-1][0]
+        logger.info("向量迁移进度", **stats)
+
+    if drop_json:
+        result = await db.execute(
+            update(DocumentChunk)
+            .where(
+                DocumentChunk.embedding_blob.isnot(None),
+                DocumentChunk.embedding.isnot(None)
+            )
+            .values(embedding=None)
+        )
+        await db.commit()
+        stats["json_dropped"] = result.rowcount or 0
+
+    logger.info("向量迁移完成", **stats)
+    return stats
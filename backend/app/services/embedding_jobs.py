@@ -0,0 +1,520 @@
+"""
+文档向量化任务队列
+同步的 /embed 接口在整个向量化期间占住HTTP请求，进程崩溃时进度全部丢失；
+任务持久化在 embedding_jobs 表中，后台worker原子认领任务，按 chunk_index 顺序
+每批编码、写回并提交检查点，崩溃后（心跳超时）由任意worker从检查点续跑
+"""
+import asyncio
+import os
+import socket
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import structlog
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import get_settings
+from app.models.database import Document, DocumentChunk, EmbeddingJob, EmbeddingJobStatus
+
+logger = structlog.get_logger(__name__)
+
+ACTIVE_STATUSES = (EmbeddingJobStatus.PENDING, EmbeddingJobStatus.RUNNING)
+
+# 吞吐统计的滑动窗口（秒）
+THROUGHPUT_WINDOW = 60.0
+
+
+async def enqueue_embedding_job(db: AsyncSession, document_id: str) -> Tuple[EmbeddingJob, bool]:
+    """
+    为文档创建向量化任务（已有未完成任务时直接返回该任务）
+
+    Returns:
+        (任务, 是否新建)
+    """
+    existing = (await db.execute(
+        select(EmbeddingJob).filter(
+            EmbeddingJob.document_id == document_id,
+            EmbeddingJob.status.in_(ACTIVE_STATUSES)
+        ).order_by(EmbeddingJob.created_at).limit(1)
+    )).scalar_one_or_none()
+    if existing is not None:
+        return existing, False
+
+    total = (await db.execute(
+        select(func.count()).select_from(DocumentChunk).filter(DocumentChunk.document_id == document_id)
+    )).scalar() or 0
+    job = EmbeddingJob(document_id=document_id, total_chunks=total)
+    db.add(job)
+    await db.commit()
+    return job, True
+
+
+async def reset_embedding_jobs(db: AsyncSession, document_id: str, total_chunks: int) -> int:
+    """
+    文档重新分块后重置其未完成的任务（由调用方随新chunks一起提交）
+
+    检查点和进度清零后任务回到排队状态，从第一个新chunk开始处理；
+    正在运行的worker租约随之失效，在下一次写检查点或心跳时停止
+
+    Returns:
+        被重置的任务数
+    """
+    result = await db.execute(
+        update(EmbeddingJob)
+        .where(
+            EmbeddingJob.document_id == document_id,
+            EmbeddingJob.status.in_(ACTIVE_STATUSES)
+        )
+        .values(
+            status=EmbeddingJobStatus.PENDING,
+            worker_id=None,
+            checkpoint_index=-1,
+            total_chunks=total_chunks,
+            processed_chunks=0,
+            success_count=0,
+            failed_count=0,
+            skipped_count=0,
+            cache_hits=0,
+            error=None,
+            heartbeat_at=None
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def job_to_dict(job: EmbeddingJob) -> Dict[str, Any]:
+    """任务状态与进度"""
+    progress = job.processed_chunks / job.total_chunks if job.total_chunks else 0.0
+    result = {
+        "job_id": job.id,
+        "document_id": job.document_id,
+        "status": job.status.value,
+        "total_chunks": job.total_chunks,
+        "processed_chunks": job.processed_chunks,
+        "progress": round(min(1.0, progress), 4),
+        "checkpoint_index": job.checkpoint_index,
+        "success": job.success_count,
+        "failed": job.failed_count,
+        "skipped": job.skipped_count,
+        "cache_hits": job.cache_hits,
+        "attempts": job.attempts,
+        "worker_id": job.worker_id,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "heartbeat_at": job.heartbeat_at.isoformat() if job.heartbeat_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+    if job.started_at is not None:
+        end = job.finished_at or datetime.utcnow()
+        elapsed = (end - job.started_at).total_seconds()
+        result["elapsed_s"] = round(elapsed, 3)
+        result["chunks_per_second"] = round(job.processed_chunks / elapsed, 2) if elapsed > 0 else 0.0
+    return result
+
+
+async def queue_stats(db: AsyncSession) -> Dict[str, Any]:
+    """积压统计: 各状态任务数、待处理chunk数、最早排队任务的等待时间"""
+    counts = {status.value: 0 for status in EmbeddingJobStatus}
+    rows = await db.execute(
+        select(EmbeddingJob.status, func.count()).group_by(EmbeddingJob.status)
+    )
+    for status, count in rows.all():
+        counts[status.value] = count
+
+    backlog_chunks = (await db.execute(
+        select(func.sum(EmbeddingJob.total_chunks - EmbeddingJob.processed_chunks)).filter(
+            EmbeddingJob.status.in_(ACTIVE_STATUSES)
+        )
+    )).scalar() or 0
+    oldest_pending = (await db.execute(
+        select(func.min(EmbeddingJob.created_at)).filter(EmbeddingJob.status == EmbeddingJobStatus.PENDING)
+    )).scalar()
+
+    return {
+        "jobs": counts,
+        "backlog_chunks": int(max(0, backlog_chunks)),
+        "oldest_pending_age_s": (
+            round((datetime.utcnow() - oldest_pending).total_seconds(), 3) if oldest_pending else 0.0
+        )
+    }
+
+
+class EmbeddingJobWorker:
+    """
+    向量化任务worker
+
+    - 认领: 按创建时间取排队中的任务，或心跳超过 stale_seconds 的运行中任务（原worker已崩溃），
+      以带状态条件的UPDATE原子认领，多进程同时运行时同一任务只会被一个worker拿到
+    - 执行: 从 checkpoint_index 之后按 chunk_index 顺序每批 batch_size 个chunk，
+      编码并批量写回后提交检查点与心跳；检查点之前的chunk不会重复处理，
+      崩溃时最多重做一批（内容缓存命中，不重复推理）
+    - 租约: 进度、心跳和结束状态只在 (worker_id, attempts) 仍与本次认领一致时写入，
+      任务被重新分块重置或被其他worker接管后本worker停止处理；批次内另有心跳任务定期续约
+    - 失败: 认领次数未超过 max_attempts 时放回队列，否则标记为失败
+    - 停止: 当前任务放回队列，不计入认领次数
+    """
+
+    def __init__(
+        self,
+        poll_interval: float = 2.0,
+        stale_seconds: float = 300.0,
+        max_attempts: int = 3,
+        batch_size: int = 500
+    ):
+        self.poll_interval = max(0.05, poll_interval)
+        self.stale_seconds = max(1.0, stale_seconds)
+        self.max_attempts = max(1, max_attempts)
+        self.batch_size = max(1, batch_size)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.current_job_id: Optional[str] = None
+
+        # 指标
+        self.jobs_completed = 0
+        self.jobs_failed = 0
+        self.jobs_retried = 0
+        self.chunks_processed = 0
+        self._recent: Deque[Tuple[float, int]] = deque()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> asyncio.Task:
+        """在当前事件循环中启动worker"""
+        if not self.running:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            logger.info("向量化任务worker已启动", worker_id=self.worker_id)
+        return self._task
+
+    def notify(self) -> None:
+        """有新任务入队时唤醒空闲的worker"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                job_id = await self._claim()
+            except Exception as e:
+                logger.error("认领向量化任务失败", error=str(e))
+                job_id = None
+
+            if job_id is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self.current_job_id = job_id
+            try:
+                await self._process(job_id)
+            except Exception as e:
+                # 任务停在运行中，心跳超时后会被重新认领
+                logger.error("处理向量化任务异常", job_id=job_id, error=str(e))
+            finally:
+                self.current_job_id = None
+
+    def _claimable(self, now: datetime):
+        return or_(
+            EmbeddingJob.status == EmbeddingJobStatus.PENDING,
+            and_(
+                EmbeddingJob.status == EmbeddingJobStatus.RUNNING,
+                EmbeddingJob.heartbeat_at < now - timedelta(seconds=self.stale_seconds)
+            )
+        )
+
+    async def _claim(self) -> Optional[str]:
+        """原子认领一个任务，没有可认领任务时返回 None"""
+        from app.core import database as db_module
+
+        if db_module.async_session is None:
+            await db_module.init_db()
+        async with db_module.async_session() as db:
+            now = datetime.utcnow()
+            candidates = (await db.execute(
+                select(EmbeddingJob.id).filter(self._claimable(now)).order_by(EmbeddingJob.created_at).limit(8)
+            )).scalars().all()
+
+            for job_id in candidates:
+                result = await db.execute(
+                    update(EmbeddingJob)
+                    .where(EmbeddingJob.id == job_id, self._claimable(now))
+                    .values(
+                        status=EmbeddingJobStatus.RUNNING,
+                        worker_id=self.worker_id,
+                        heartbeat_at=now,
+                        started_at=func.coalesce(EmbeddingJob.started_at, now),
+                        attempts=EmbeddingJob.attempts + 1
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+                if result.rowcount == 1:
+                    return job_id
+        return None
+
+    def _lease(self, job_id: str, attempt: int):
+        """本次认领仍然有效的条件（任务被重新分块重置或被其他worker接管后失效）"""
+        return and_(
+            EmbeddingJob.id == job_id,
+            EmbeddingJob.worker_id == self.worker_id,
+            EmbeddingJob.attempts == attempt,
+            EmbeddingJob.status == EmbeddingJobStatus.RUNNING
+        )
+
+    async def _update_leased(self, db: AsyncSession, job_id: str, attempt: int, **values) -> bool:
+        """持有租约时更新任务并提交，租约已失效时返回 False"""
+        result = await db.execute(
+            update(EmbeddingJob)
+            .where(self._lease(job_id, attempt))
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return result.rowcount == 1
+
+    async def _heartbeat(self, job_id: str, attempt: int, lost: asyncio.Event) -> None:
+        """批次耗时较长时也按 stale_seconds/3 刷新心跳，发现租约失效时通知主循环停止"""
+        from app.core import database as db_module
+
+        while True:
+            await asyncio.sleep(self.stale_seconds / 3)
+            try:
+                async with db_module.async_session() as db:
+                    if not await self._update_leased(db, job_id, attempt, heartbeat_at=datetime.utcnow()):
+                        lost.set()
+                        return
+            except Exception as e:
+                logger.warning("更新向量化任务心跳失败", job_id=job_id, error=str(e))
+
+    async def _process(self, job_id: str) -> None:
+        from app.core import database as db_module
+        from app.services.embedding_service import get_embedding_service
+        from app.services.vector_search import get_vector_search
+
+        async with db_module.async_session() as db:
+            job = await db.get(EmbeddingJob, job_id)
+            if job is None:
+                return
+            attempt = job.attempts
+            document_id = job.document_id
+            checkpoint = job.checkpoint_index
+            progress = {
+                "processed_chunks": job.processed_chunks,
+                "success_count": job.success_count,
+                "failed_count": job.failed_count,
+                "skipped_count": job.skipped_count,
+                "cache_hits": job.cache_hits
+            }
+            if attempt > self.max_attempts:
+                await self._finish(db, job_id, attempt, EmbeddingJobStatus.FAILED, f"超过最大尝试次数 {self.max_attempts}")
+                return
+            logger.info(
+                "开始处理向量化任务",
+                job_id=job_id,
+                document_id=document_id,
+                checkpoint_index=checkpoint,
+                attempt=attempt
+            )
+
+            lost = asyncio.Event()
+            heartbeat = asyncio.create_task(self._heartbeat(job_id, attempt, lost))
+            try:
+                if await db.get(Document, document_id) is None:
+                    await self._finish(db, job_id, attempt, EmbeddingJobStatus.FAILED, "文档不存在")
+                    return
+
+                total = (await db.execute(
+                    select(func.count()).select_from(DocumentChunk).filter(
+                        DocumentChunk.document_id == document_id
+                    )
+                )).scalar() or 0
+                if not await self._update_leased(db, job_id, attempt, total_chunks=total):
+                    lost.set()
+                embedding_service = get_embedding_service()
+
+                while not lost.is_set():
+                    rows = (await db.execute(
+                        select(DocumentChunk.id, DocumentChunk.content, DocumentChunk.chunk_index).filter(
+                            DocumentChunk.document_id == document_id,
+                            DocumentChunk.chunk_index > checkpoint
+                        ).order_by(DocumentChunk.chunk_index).limit(self.batch_size)
+                    )).all()
+                    if not rows:
+                        break
+
+                    # 一批chunk的向量写回在 embed_chunks_for_document 内提交，随后在租约下提交检查点
+                    stats = await embedding_service.embed_chunks_for_document(
+                        chunks=[
+                            {"id": row.id, "content": row.content, "chunk_index": row.chunk_index}
+                            for row in rows
+                        ],
+                        db=db
+                    )
+                    checkpoint = rows[-1].chunk_index
+                    progress["processed_chunks"] = min(total, progress["processed_chunks"] + len(rows))
+                    progress["success_count"] += stats["success"]
+                    progress["failed_count"] += stats["failed"]
+                    progress["skipped_count"] += stats["skipped"]
+                    progress["cache_hits"] += stats["cache_hits"]
+                    if not await self._update_leased(
+                        db, job_id, attempt,
+                        checkpoint_index=checkpoint,
+                        heartbeat_at=datetime.utcnow(),
+                        **progress
+                    ):
+                        lost.set()
+                        break
+                    self._record(len(rows))
+                    logger.info(
+                        "向量化任务进度",
+                        job_id=job_id,
+                        processed=progress["processed_chunks"],
+                        total=total
+                    )
+
+                if lost.is_set():
+                    logger.warning("向量化任务已被重置或由其他worker接管，停止处理", job_id=job_id)
+                    return
+
+                # 同步常驻向量索引
+                await get_vector_search().refresh_document(db, document_id)
+                await self._finish(
+                    db, job_id, attempt, EmbeddingJobStatus.COMPLETED,
+                    processed_chunks=total
+                )
+
+            except asyncio.CancelledError:
+                await self._release(job_id, attempt)
+                raise
+            except Exception as e:
+                await db.rollback()
+                retry = attempt < self.max_attempts
+                logger.error(
+                    "向量化任务失败",
+                    job_id=job_id,
+                    error=str(e),
+                    attempt=attempt,
+                    retry=retry
+                )
+                if not retry:
+                    await self._finish(db, job_id, attempt, EmbeddingJobStatus.FAILED, str(e))
+                elif await self._update_leased(
+                    db, job_id, attempt,
+                    status=EmbeddingJobStatus.PENDING,
+                    worker_id=None,
+                    error=str(e)
+                ):
+                    self.jobs_retried += 1
+            finally:
+                heartbeat.cancel()
+
+    async def _finish(
+        self,
+        db: AsyncSession,
+        job_id: str,
+        attempt: int,
+        status: EmbeddingJobStatus,
+        error: Optional[str] = None,
+        **values
+    ) -> None:
+        now = datetime.utcnow()
+        if not await self._update_leased(
+            db, job_id, attempt,
+            status=status,
+            error=error,
+            finished_at=now,
+            heartbeat_at=now,
+            **values
+        ):
+            logger.warning("向量化任务租约已失效，不更新结束状态", job_id=job_id)
+            return
+        if status == EmbeddingJobStatus.FAILED:
+            self.jobs_failed += 1
+        else:
+            self.jobs_completed += 1
+        logger.info("向量化任务结束", job_id=job_id, status=status.value, error=error)
+
+    async def _release(self, job_id: str, attempt: int) -> None:
+        """停止时把当前任务放回队列，其他worker或重启后可立即从检查点续跑"""
+        from app.core import database as db_module
+
+        try:
+            async with db_module.async_session() as db:
+                await self._update_leased(
+                    db, job_id, attempt,
+                    status=EmbeddingJobStatus.PENDING,
+                    worker_id=None,
+                    attempts=EmbeddingJob.attempts - 1
+                )
+            logger.info("向量化任务已放回队列", job_id=job_id)
+        except Exception as e:
+            logger.warning("放回向量化任务失败，将在心跳超时后被重新认领", job_id=job_id, error=str(e))
+
+    def _record(self, chunks: int) -> None:
+        now = time.monotonic()
+        self.chunks_processed += chunks
+        self._recent.append((now, chunks))
+        while self._recent and self._recent[0][0] < now - THROUGHPUT_WINDOW:
+            self._recent.popleft()
+
+    async def close(self) -> None:
+        """停止worker（当前任务放回队列）"""
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        """worker状态与吞吐（最近 THROUGHPUT_WINDOW 秒）"""
+        now = time.monotonic()
+        recent = sum(chunks for at, chunks in self._recent if at >= now - THROUGHPUT_WINDOW)
+        return {
+            "worker_id": self.worker_id,
+            "running": self.running,
+            "current_job_id": self.current_job_id,
+            "jobs_completed": self.jobs_completed,
+            "jobs_failed": self.jobs_failed,
+            "jobs_retried": self.jobs_retried,
+            "chunks_processed": self.chunks_processed,
+            "chunks_per_second": round(recent / THROUGHPUT_WINDOW, 2)
+        }
+
+
+# 全局单例
+_embedding_job_worker = None
+
+
+def get_embedding_job_worker() -> EmbeddingJobWorker:
+    """获取向量化任务worker单例"""
+    global _embedding_job_worker
+    if _embedding_job_worker is None:
+        settings = get_settings()
+        _embedding_job_worker = EmbeddingJobWorker(
+            poll_interval=settings.EMBEDDING_JOB_POLL_INTERVAL,
+            stale_seconds=settings.EMBEDDING_JOB_STALE_SECONDS,
+            max_attempts=settings.EMBEDDING_JOB_MAX_ATTEMPTS,
+            batch_size=settings.EMBEDDING_WRITE_BATCH_SIZE
+        )
+    return _embedding_job_worker
+
+
+async def close_embedding_job_worker() -> None:
+    """停止向量化任务worker（应用关闭时调用）"""
+    if _embedding_job_worker is not None:
+        await _embedding_job_worker.close()
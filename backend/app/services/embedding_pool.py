@@ -0,0 +1,163 @@
+"""
+多进程Embedding引擎
+默认线程池中的 model.encode 受GIL和torch内部线程争用限制，批量入库只能用到一个核；
+进程池中每个worker加载一次本地模型并固定intra-op线程数，批次按分片分发到各worker并行编码
+"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+# worker进程内的模型实例
+_worker_model = None
+
+
+def _init_worker(
+    model_name: str,
+    cache_folder: Optional[str],
+    threads: int,
+    backend: str,
+    onnx_dir: Optional[str]
+) -> None:
+    """worker初始化：先限制数学库线程数再导入torch，然后按后端加载模型"""
+    global _worker_model
+
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[variable] = str(threads)
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+    from app.services.onnx_embedder import load_local_model
+    _worker_model = load_local_model(
+        model_name,
+        backend=backend,
+        cache_folder=cache_folder,
+        onnx_dir=onnx_dir,
+        threads=threads
+    )
+
+
+def _encode_shard(texts: List[str]) -> np.ndarray:
+    """在worker中编码一个分片，返回 (n, D) float32 数组（比嵌套列表序列化更紧凑）"""
+    embeddings = _worker_model.encode(
+        texts,
+        batch_size=len(texts),
+        convert_to_numpy=True,
+        show_progress_bar=False
+    )
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+class EmbeddingProcessPool:
+    """
+    进程池Embedding引擎
+
+    - 使用spawn启动worker，避免fork后torch线程池状态异常
+    - 每个worker在初始化时按后端加载一次模型（MODEL_CACHE_DIR本地缓存）
+    - encode() 把文本切成 shard_size 大小的分片提交到进程池，空闲worker依次领取
+    - worker崩溃时重建进程池，本次调用抛出异常
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        workers: int,
+        threads_per_worker: int = 1,
+        cache_folder: Optional[str] = None,
+        backend: str = "sentence-transformers",
+        onnx_dir: Optional[str] = None,
+        shard_size: int = 128
+    ):
+        self.model_name = model_name
+        self.workers = max(1, workers)
+        self.threads_per_worker = max(1, threads_per_worker)
+        self.cache_folder = cache_folder
+        self.backend = backend
+        self.onnx_dir = onnx_dir
+        self.shard_size = max(1, shard_size)
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+        self.encoded_texts = 0
+        self.shards = 0
+        self.restarts = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_name, self.cache_folder, self.threads_per_worker, self.backend, self.onnx_dir)
+            )
+            logger.info(
+                "Embedding进程池已创建",
+                workers=self.workers,
+                threads_per_worker=self.threads_per_worker,
+                model=self.model_name,
+                backend=self.backend
+            )
+        return self._executor
+
+    async def encode(self, texts: List[str]) -> List[List[float]]:
+        """
+        并行编码文本（调用方保证文本非空）
+
+        Returns:
+            与输入顺序一致的向量列表
+        """
+        if not texts:
+            return []
+
+        executor = self._get_executor()
+        loop = asyncio.get_running_loop()
+        shards = [texts[start:start + self.shard_size] for start in range(0, len(texts), self.shard_size)]
+        try:
+            results = await asyncio.gather(*(
+                loop.run_in_executor(executor, _encode_shard, shard) for shard in shards
+            ))
+        except BrokenProcessPool:
+            self.restarts += 1
+            logger.error("Embedding进程池worker异常退出，下次调用时重建")
+            self.shutdown()
+            raise
+
+        self.shards += len(shards)
+        self.encoded_texts += len(texts)
+        return np.concatenate(results).tolist()
+
+    async def warm_up(self) -> None:
+        """每个worker各提交一个小分片，提前启动进程并加载模型"""
+        executor = self._get_executor()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(executor, _encode_shard, ["warm up"]) for _ in range(self.workers)
+        ))
+
+    def shutdown(self) -> None:
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "backend": self.backend,
+            "threads_per_worker": self.threads_per_worker,
+            "shard_size": self.shard_size,
+            "started": self._executor is not None,
+            "encoded_texts": self.encoded_texts,
+            "shards": self.shards,
+            "restarts": self.restarts
+        }
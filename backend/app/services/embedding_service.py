@@ -5,12 +5,32 @@ Embedding向量化服务
 
 import asyncio
 import json
+import threading
+import time
 import numpy as np
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from sqlalchemy import bindparam, update
+from sqlalchemy.ext.asyncio import AsyncSession
 import structlog
 
+from app.core.config import get_settings
+from app.models.database import DocumentChunk
+from app.services.chunk_embedding_cache import content_hash, lookup_embeddings, store_embeddings
+from app.services.embedding_batcher import EmbeddingMicroBatcher
+from app.services.embedding_cache import create_query_embedding_cache
+from app.services.embedding_pool import EmbeddingProcessPool
+from app.services.length_bucketing import estimate_token_lengths, plan_batches
+from app.services.remote_embedding_client import RemoteEmbeddingClient
+from app.services.onnx_embedder import load_local_model
+from app.services.embedding_codec import encode_embedding
+
 logger = structlog.get_logger(__name__)
 
+# 按chunk id写回向量的批量UPDATE，SET的列取自参数字典中除 chunk_id 外的键
+CHUNK_EMBEDDING_UPDATE = update(DocumentChunk.__table__).where(
+    DocumentChunk.__table__.c.id == bindparam("chunk_id")
+)
+
 
 class EmbeddingService:
     """文本向量化服务"""
@@ -30,6 +50,7 @@ class EmbeddingService:
             self.model_name = "all-MiniLM-L6-v2"  # 384维，80MB
             self.embedding_dimension = 384
             self._model = None  # 延迟加载
+            self._model_lock = threading.Lock()  # 并发的首次调用只加载一次
             logger.info(f"使用本地Embedding模型: {self.model_name}")
         else:
             # 使用远程API（内网环境）
@@ -41,24 +62,121 @@ class EmbeddingService:
             logger.info(f"使用远程Embedding API: {self.model_name}")
         
         self.max_batch_size = 32  # 本地模型可以处理更大批量
+        
+        settings = get_settings()
+        
+        # 远程API长连接客户端（仅远程模式）
+        self.remote_client = RemoteEmbeddingClient(
+            api_url=settings.EMBEDDING_REMOTE_API_URL or self.api_url,
+            api_key=settings.EMBEDDING_REMOTE_API_KEY or self.api_key,
+            model_name=self.model_name,
+            timeout=self.timeout,
+            batch_size=self.max_batch_size,
+            max_concurrency=settings.EMBEDDING_REMOTE_CONCURRENCY,
+            max_retries=settings.EMBEDDING_REMOTE_MAX_RETRIES,
+            backoff_base=settings.EMBEDDING_REMOTE_BACKOFF_BASE,
+            backoff_max=settings.EMBEDDING_REMOTE_BACKOFF_MAX,
+            rate_limit=settings.EMBEDDING_REMOTE_RATE_LIMIT,
+            http2=settings.EMBEDDING_REMOTE_HTTP2
+        ) if not use_local_model else None
+        
+        # 查询向量缓存（按模型名隔离，禁用时为 None）
+        self.query_cache = create_query_embedding_cache(self.model_name)
+        
+        # 批量入库的多进程编码引擎（仅本地模型，禁用时为 None）
+        self.process_pool = EmbeddingProcessPool(
+            self.model_name,
+            workers=settings.EMBEDDING_PROCESS_WORKERS,
+            threads_per_worker=settings.EMBEDDING_WORKER_THREADS,
+            cache_folder=settings.MODEL_CACHE_DIR,
+            backend=settings.EMBEDDING_BACKEND,
+            onnx_dir=settings.EMBEDDING_ONNX_DIR,
+            shard_size=self.max_batch_size * 4
+        ) if use_local_model and settings.EMBEDDING_PROCESS_WORKERS > 0 else None
+        
+        # 并发查询向量化的微批器（禁用时为 None）
+        self.batcher = EmbeddingMicroBatcher(
+            self.embed_batch,
+            max_batch_size=settings.EMBEDDING_MICRO_BATCH_MAX_SIZE,
+            max_wait_ms=settings.EMBEDDING_MICRO_BATCH_MAX_WAIT_MS
+        ) if settings.EMBEDDING_MICRO_BATCH_ENABLED else None
+        
+        # 启动预热状态: not_started / running / ready / failed
+        self.warmup_state = "not_started"
+        self.warmup_error: Optional[str] = None
+        self.warmup_seconds: Optional[float] = None
     
     def _load_local_model(self):
-        """延迟加载本地模型"""
-        if self._model is None:
+        """延迟加载本地模型（EMBEDDING_BACKEND 选择 sentence-transformers 或 ONNX int8）"""
+        if self._model is not None:
+            return self._model
+        with self._model_lock:
+            if self._model is not None:
+                return self._model
+            settings = get_settings()
             try:
-                from sentence_transformers import SentenceTransformer
-                logger.info(f"正在加载本地模型: {self.model_name}...")
-                self._model = SentenceTransformer(self.model_name)
+                logger.info(f"正在加载本地模型: {self.model_name}...", backend=settings.EMBEDDING_BACKEND)
+                self._model = load_local_model(
+                    self.model_name,
+                    backend=settings.EMBEDDING_BACKEND,
+                    cache_folder=settings.MODEL_CACHE_DIR,
+                    onnx_dir=settings.EMBEDDING_ONNX_DIR,
+                    threads=settings.EMBEDDING_ONNX_THREADS
+                )
                 logger.info(f"本地模型加载成功，向量维度: {self.embedding_dimension}")
-            except ImportError:
+            except ImportError as e:
+                if settings.EMBEDDING_BACKEND == "onnx":
+                    raise
                 raise ImportError(
                     "需要安装 sentence-transformers: pip install sentence-transformers"
-                )
+                ) from e
         return self._model
     
+    async def warm_up(self) -> None:
+        """
+        启动预热：从本地缓存加载模型，并编码一批长短不一的示例文本，
+        让首次推理的初始化和缓冲区分配在接收请求前完成
+        """
+        self.warmup_state = "running"
+        start = time.perf_counter()
+        try:
+            if self.use_local_model:
+                await asyncio.get_running_loop().run_in_executor(None, self._load_local_model)
+                if self.process_pool is not None:
+                    await self.process_pool.warm_up()
+            samples = ["warm up", "预热示例文本 " * 8, "def warm_up():\n    return None\n" * 16]
+            embeddings = await self.embed_batch(samples)
+            if any(embedding is None for embedding in embeddings):
+                raise RuntimeError("预热批次未返回向量")
+            self.warmup_state = "ready"
+        except Exception as e:
+            self.warmup_state = "failed"
+            self.warmup_error = str(e)
+            logger.error("Embedding模型预热失败", error=str(e))
+        finally:
+            self.warmup_seconds = round(time.perf_counter() - start, 3)
+        
+        if self.warmup_state == "ready":
+            logger.info("Embedding模型预热完成", model=self.model_name, seconds=self.warmup_seconds)
+    
+    def start_warm_up(self) -> asyncio.Task:
+        """在后台启动预热（立即标记为未就绪）"""
+        self.warmup_state = "running"
+        return asyncio.create_task(self.warm_up())
+    
+    def readiness(self) -> Dict[str, Any]:
+        """预热状态（未启用预热时视为就绪）"""
+        return {
+            "ready": self.warmup_state in ("not_started", "ready"),
+            "warmup": self.warmup_state,
+            "warmup_seconds": self.warmup_seconds,
+            "error": self.warmup_error,
+            "model": self.model_name
+        }
+    
     async def embed_text(self, text: str) -> Optional[List[float]]:
         """
-        为单个文本生成向量
+        为单个查询文本生成向量（优先读取查询向量缓存，未命中时经微批器与并发请求合并编码）
         
         Args:
             text: 输入文本
@@ -71,14 +189,53 @@ class EmbeddingService:
             return None
         
         try:
-            result = await self.embed_batch([text])
-            if result and len(result) > 0:
-                return result[0]
-            return None
+            if self.query_cache is not None:
+                cached = await self.query_cache.get(text)
+                if cached is not None:
+                    return cached
+            
+            if self.batcher is not None:
+                embedding = await self.batcher.submit(text)
+            else:
+                result = await self.embed_batch([text])
+                embedding = result[0] if result else None
+            if self.query_cache is not None and embedding is not None:
+                await self.query_cache.set(text, embedding)
+            return embedding
         except Exception as e:
             logger.error(f"单文本向量化失败: {str(e)}", text_length=len(text))
             return None
     
+    async def embed_queries(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        批量生成查询向量：命中缓存的直接返回，其余一次 embed_batch 调用
+        
+        Args:
+            texts: 查询文本列表
+            
+        Returns:
+            与输入对应的向量列表（失败时为 None）
+        """
+        if self.query_cache is None:
+            return await self.embed_batch(texts)
+        
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        missing = []
+        for i, text in enumerate(texts):
+            if text and text.strip():
+                embeddings[i] = await self.query_cache.get(text)
+                if embeddings[i] is None:
+                    missing.append(i)
+        
+        if missing:
+            computed = await self.embed_batch([texts[i] for i in missing])
+            for i, embedding in zip(missing, computed):
+                embeddings[i] = embedding
+                if embedding is not None:
+                    await self.query_cache.set(texts[i], embedding)
+        
+        return embeddings
+    
     async def embed_batch(
         self,
         texts: List[str],
@@ -121,35 +278,60 @@ class EmbeddingService:
         all_embeddings: List[Optional[List[float]]],
         show_progress: bool
     ) -> List[Optional[List[float]]]:
-        """使用本地模型批量向量化"""
+        """
+        使用本地模型批量向量化
+        
+        按token长度分桶：长度相近的文本组成一批，每批填充后的token数不超过
+        EMBEDDING_BATCH_TOKEN_BUDGET，结果写回原位置；至少一个分片时交给进程池并行编码
+        """
         try:
-            model = self._load_local_model()
+            if self.process_pool is not None and len(valid_texts) >= self.process_pool.shard_size:
+                # 按字符长度排序后切分片，每个分片内长度相近
+                ordered = sorted(valid_texts, key=lambda item: len(item[1]))
+                embeddings = await self.process_pool.encode([text for _, text in ordered])
+                for (original_idx, _), embedding in zip(ordered, embeddings):
+                    all_embeddings[original_idx] = embedding
+                if show_progress:
+                    logger.info(f"向量化进度: {len(valid_texts)}/{len(valid_texts)}")
+                return all_embeddings
             
-            # sentence-transformers 是同步的，在线程池中运行
+            settings = get_settings()
+            
+            # sentence-transformers 是同步的，在线程池中运行（首次加载也不阻塞事件循环）
             loop = asyncio.get_event_loop()
+            model = self._model if self._model is not None else await loop.run_in_executor(None, self._load_local_model)
+            
+            lengths = await loop.run_in_executor(
+                None,
+                lambda: estimate_token_lengths(model, [text for _, text in valid_texts])
+            )
+            batches = plan_batches(
+                lengths,
+                token_budget=settings.EMBEDDING_BATCH_TOKEN_BUDGET,
+                max_batch_size=settings.EMBEDDING_BATCH_MAX_TEXTS
+            )
             
-            for batch_start in range(0, len(valid_texts), self.max_batch_size):
-                batch = valid_texts[batch_start:batch_start + self.max_batch_size]
-                batch_indices = [idx for idx, _ in batch]
-                batch_texts = [text for _, text in batch]
+            processed = 0
+            for batch in batches:
+                batch_texts = [valid_texts[i][1] for i in batch]
                 
-                # 在线程池中执行同步操作
+                # 在线程池中执行同步操作（整批一次前向，不再由模型按固定条数切分）
                 embeddings = await loop.run_in_executor(
                     None,
                     lambda: model.encode(
                         batch_texts,
+                        batch_size=len(batch_texts),
                         convert_to_numpy=True,
                         show_progress_bar=False
                     ).tolist()
                 )
                 
                 # 将结果放回原位置
-                for i, embedding in enumerate(embeddings):
-                    original_idx = batch_indices[i]
-                    all_embeddings[original_idx] = embedding
+                for i, embedding in zip(batch, embeddings):
+                    all_embeddings[valid_texts[i][0]] = embedding
                 
+                processed += len(batch)
                 if show_progress:
-                    processed = min(batch_start + self.max_batch_size, len(valid_texts))
                     logger.info(f"向量化进度: {processed}/{len(valid_texts)}")
             
             return all_embeddings
@@ -165,88 +347,20 @@ class EmbeddingService:
         all_embeddings: List[Optional[List[float]]],
         show_progress: bool
     ) -> List[Optional[List[float]]]:
-        """使用远程API批量向量化"""
-        import httpx
+        """使用远程API批量向量化（并发批次，失败批次拆分重试，重试耗尽的位置保持 None）"""
+        embeddings = await self.remote_client.embed(
+            [text for _, text in valid_texts],
+            show_progress=show_progress
+        )
+        for (original_idx, _), embedding in zip(valid_texts, embeddings):
+            all_embeddings[original_idx] = embedding
         
-        for batch_start in range(0, len(valid_texts), self.max_batch_size):
-            batch = valid_texts[batch_start:batch_start + self.max_batch_size]
-            batch_indices = [idx for idx, _ in batch]
-            batch_texts = [text for _, text in batch]
-            
-            try:
-                embeddings = await self._call_embedding_api(batch_texts)
-                
-                # 将结果放回原位置
-                for i, embedding in enumerate(embeddings):
-                    original_idx = batch_indices[i]
-                    all_embeddings[original_idx] = embedding
-                
-                if show_progress:
-                    processed = min(batch_start + self.max_batch_size, len(valid_texts))
-                    logger.info(f"向量化进度: {processed}/{len(valid_texts)}")
-                    
-            except Exception as e:
-                logger.error(f"批量向量化失败: {str(e)}", batch_size=len(batch))
-                # 批次失败，对应位置保持 None
+        failed = sum(1 for embedding in embeddings if embedding is None)
+        if failed:
+            logger.error("远程向量化部分失败", failed=failed, total=len(valid_texts))
         
         return all_embeddings
     
-    async def _call_embedding_api(self, texts: List[str]) -> List[List[float]]:
-        """
-        调用远程 Embedding API（内网环境）
-        
-        Args:
-            texts: 文本列表（已验证非空）
-            
-        Returns:
-            向量列表
-            
-        Raises:
-            Exception: API 调用失败
-        """
-        import httpx
-        
-        try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    self.api_url,
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": self.model_name,
-                        "input": texts,
-                        "encoding_format": "float"
-                    }
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    
-                    if "data" in result:
-                        embeddings = []
-                        for item in sorted(result["data"], key=lambda x: x["index"]):
-                            embedding = item["embedding"]
-                            embeddings.append(embedding)
-                        
-                        logger.info(
-                            f"远程API向量化成功",
-                            texts_count=len(texts),
-                            embedding_dim=len(embeddings[0]) if embeddings else 0
-                        )
-                        
-                        return embeddings
-                    else:
-                        raise Exception(f"API响应格式错误: {result}")
-                else:
-                    error_msg = response.text
-                    raise Exception(f"API错误 {response.status_code}: {error_msg}")
-                    
-        except Exception as e:
-            logger.error(f"远程Embedding API调用失败: {str(e)}")
-            raise
-    
     def serialize_embedding(self, embedding: List[float]) -> str:
         """
         序列化向量为字符串（用于存储到数据库）
@@ -311,48 +425,113 @@ class EmbeddingService:
             logger.error(f"计算相似度失败: {str(e)}")
             return 0.0
     
+    async def _embed_with_content_cache(
+        self,
+        texts: List[str],
+        db: Optional[AsyncSession]
+    ) -> Tuple[List[Optional[List[float]]], int, int]:
+        """
+        按内容摘要复用已缓存的chunk向量，未命中的文本（去重后）交给 embed_batch
+
+        Returns:
+            (与输入对应的向量列表, 命中数, 未命中数)，空文本不计入命中统计
+        """
+        if db is None or not get_settings().EMBEDDING_CONTENT_CACHE_ENABLED:
+            return await self.embed_batch(texts, show_progress=True), 0, 0
+
+        hashes = [content_hash(text) if text and text.strip() else None for text in texts]
+        try:
+            cached = await lookup_embeddings(db, self.model_name, (h for h in hashes if h))
+        except Exception as e:
+            logger.warning("查询chunk向量缓存失败，全部重新生成", error=str(e))
+            return await self.embed_batch(texts, show_progress=True), 0, 0
+
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        miss_positions: Dict[str, List[int]] = {}
+        hits = misses = 0
+        for i, hash_value in enumerate(hashes):
+            if hash_value is None:
+                continue
+            if hash_value in cached:
+                embeddings[i] = cached[hash_value]
+                hits += 1
+            else:
+                miss_positions.setdefault(hash_value, []).append(i)
+                misses += 1
+
+        if miss_positions:
+            miss_hashes = list(miss_positions)
+            generated = await self.embed_batch(
+                [texts[positions[0]] for positions in miss_positions.values()],
+                show_progress=True
+            )
+            new_entries = {}
+            for hash_value, embedding in zip(miss_hashes, generated):
+                if embedding is None:
+                    continue
+                new_entries[hash_value] = embedding
+                for i in miss_positions[hash_value]:
+                    embeddings[i] = embedding
+            try:
+                await store_embeddings(db, self.model_name, new_entries)
+            except Exception as e:
+                logger.warning("写入chunk向量缓存失败", error=str(e))
+
+        logger.info("chunk向量缓存", hits=hits, misses=misses, embedded=len(miss_positions))
+        return embeddings, hits, misses
+    
     async def embed_chunks_for_document(
         self,
         chunks: List[Dict[str, Any]],
-        update_callback: Optional[callable] = None
+        update_callback: Optional[callable] = None,
+        db: Optional[AsyncSession] = None
     ) -> Dict[str, Any]:
         """
         为文档的所有chunks生成向量
         
         Args:
             chunks: Chunk列表，每个chunk需要包含 'id' 和 'content'
-            update_callback: 更新回调函数，用于更新数据库
+            update_callback: 更新回调函数，用于更新数据库，参数为
+                chunk_id, embedding(JSON或None), embedding_blob, embedding_dim, embedding_model
+            db: 数据库会话，提供时先查询内容缓存，只对未命中的文本调用模型，
+                新向量随调用方的事务写入缓存；未提供 update_callback 时按
+                EMBEDDING_WRITE_BATCH_SIZE 分批编码，每批一次批量UPDATE写回并提交
             
         Returns:
-            统计信息
+            统计信息（含内容缓存命中数与命中率；skipped 包括空内容及批量写回时已被删除的chunk）
         """
-        if not chunks:
-            return {
-                "total": 0,
-                "success": 0,
-                "failed": 0,
-                "skipped": 0
-            }
-        
-        logger.info(f"开始为 {len(chunks)} 个chunks生成向量")
-        
-        # 提取文本
-        chunk_texts = [chunk.get("content", "") for chunk in chunks]
-        
-        # 批量生成向量
-        embeddings = await self.embed_batch(chunk_texts, show_progress=True)
-        
-        # 统计
         stats = {
             "total": len(chunks),
             "success": 0,
             "failed": 0,
-            "skipped": 0
+            "skipped": 0,
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "cache_hit_ratio": 0.0
         }
+        if not chunks:
+            return stats
+        
+        logger.info(f"开始为 {len(chunks)} 个chunks生成向量")
+        
+        settings = get_settings()
+        write_json = settings.EMBEDDING_WRITE_JSON
+        bulk_write = db is not None and update_callback is None
+        window_size = max(1, settings.EMBEDDING_WRITE_BATCH_SIZE) if bulk_write else len(chunks)
         
-        # 更新数据库（如果提供了回调）
-        if update_callback:
-            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
+        for window_start in range(0, len(chunks), window_size):
+            window = chunks[window_start:window_start + window_size]
+            
+            # 批量生成向量（先查内容缓存）
+            embeddings, cache_hits, cache_misses = await self._embed_with_content_cache(
+                [chunk.get("content", "") for chunk in window],
+                db
+            )
+            stats["cache_hits"] += cache_hits
+            stats["cache_misses"] += cache_misses
+            
+            updates = []
+            for chunk, embedding in zip(window, embeddings):
                 if embedding is None:
                     if not chunk.get("content", "").strip():
                         stats["skipped"] += 1
@@ -360,29 +539,47 @@ class EmbeddingService:
                         stats["failed"] += 1
                     continue
                 
+                if not bulk_write and not update_callback:
+                    # 没有写回目标，只统计
+                    stats["success"] += 1
+                    continue
+                
+                # 序列化向量：二进制为主，双读迁移期间同时写JSON
+                values = {
+                    "embedding": self.serialize_embedding(embedding) if write_json else None,
+                    "embedding_blob": encode_embedding(embedding),
+                    "embedding_dim": len(embedding),
+                    "embedding_model": self.model_name
+                }
+                if bulk_write:
+                    updates.append({"chunk_id": chunk["id"], **values})
+                    continue
+                
                 try:
-                    # 序列化向量
-                    embedding_str = self.serialize_embedding(embedding)
-                    
                     # 调用更新回调
-                    await update_callback(
-                        chunk_id=chunk["id"],
-                        embedding=embedding_str,
-                        embedding_dim=len(embedding)
-                    )
-                    
+                    await update_callback(chunk_id=chunk["id"], **values)
                     stats["success"] += 1
-                    
                 except Exception as e:
                     logger.error(f"更新chunk向量失败: {str(e)}", chunk_id=chunk.get("id"))
                     stats["failed"] += 1
-        else:
-            # 没有回调，只统计
-            for embedding in embeddings:
-                if embedding is None:
-                    stats["failed"] += 1
-                else:
-                    stats["success"] += 1
+            
+            if bulk_write:
+                # 按主键批量UPDATE（Core executemany），逐批提交以限制内存和事务大小；
+                # 编码期间被删除的chunk（如重新分块）匹配不到行，计入跳过而不是像ORM批量更新那样抛 StaleDataError
+                written = 0
+                if updates:
+                    result = await db.execute(CHUNK_EMBEDDING_UPDATE, updates)
+                    written = len(updates)
+                    if db.get_bind().dialect.supports_sane_multi_rowcount:
+                        written = result.rowcount
+                await db.commit()
+                stats["success"] += written
+                stats["skipped"] += len(updates) - written
+                logger.info(f"向量写回进度: {window_start + len(window)}/{len(chunks)}")
+        
+        cache_lookups = stats["cache_hits"] + stats["cache_misses"]
+        if cache_lookups:
+            stats["cache_hit_ratio"] = round(stats["cache_hits"] / cache_lookups, 4)
         
         logger.info(
             "向量化完成",
@@ -409,3 +606,15 @@ def get_embedding_service(use_local_model: bool = True) -> EmbeddingService:
         _embedding_service = EmbeddingService(use_local_model=use_local_model)
     return _embedding_service
 
+
+async def close_embedding_service() -> None:
+    """停止微批worker、编码进程池并关闭远程API连接池（应用关闭时调用）"""
+    if _embedding_service is None:
+        return
+    if _embedding_service.batcher is not None:
+        await _embedding_service.batcher.close()
+    if _embedding_service.process_pool is not None:
+        _embedding_service.process_pool.shutdown()
+    if _embedding_service.remote_client is not None:
+        await _embedding_service.remote_client.close()
+
@@ -0,0 +1,63 @@
+"""
+按长度分桶的批次规划
+按到达顺序每32条切一批时，一个2000字符的chunk会让同批的短检查项全部填充到它的长度；
+按token长度排序后贪心分组，每批的填充后token数（批内最长 × 条数）不超过预算，
+短文本可以组成大批次，长文本组成小批次，结果再按原位置写回
+"""
+from typing import Any, List, Sequence
+
+# 无法获取分词器时按字符数估算token数
+CHARS_PER_TOKEN = 4
+
+
+def estimate_token_lengths(model: Any, texts: Sequence[str], max_seq_length: int = 256) -> List[int]:
+    """
+    估算截断后的token数（含特殊token）
+
+    依次尝试: 编码器自带的 token_lengths（ONNX后端）、sentence-transformers 的快速分词器、按字符数估算
+    """
+    if hasattr(model, "token_lengths"):
+        return list(model.token_lengths(list(texts)))
+
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is not None:
+        max_length = getattr(model, "max_seq_length", None) or max_seq_length
+        encoded = tokenizer(list(texts), truncation=True, max_length=max_length, add_special_tokens=True)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    return [min(max_seq_length, len(text) // CHARS_PER_TOKEN + 2) for text in texts]
+
+
+def plan_batches(lengths: Sequence[int], token_budget: int, max_batch_size: int) -> List[List[int]]:
+    """
+    按长度降序贪心分组（最长的批次最先执行，内存峰值尽早暴露）
+
+    Args:
+        lengths: 每条文本的token数
+        token_budget: 每批填充后的token数上限（批内最长长度 × 条数），单条超出预算时独占一批
+        max_batch_size: 每批最多条数
+
+    Returns:
+        批次列表，每批为原始下标列表
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_max = 0
+    for index in order:
+        length = max(1, lengths[index])
+        # 降序遍历，批内最长长度就是第一条的长度
+        longest = current_max or length
+        if current and (len(current) + 1 > max_batch_size or longest * (len(current) + 1) > token_budget):
+            batches.append(current)
+            current, longest = [], length
+        current.append(index)
+        current_max = longest
+    if current:
+        batches.append(current)
+    return batches
+
+
+def padded_tokens(lengths: Sequence[int], batches: Sequence[Sequence[int]]) -> int:
+    """批次规划下实际送入模型的token数（含填充）"""
+    return sum(max(lengths[i] for i in batch) * len(batch) for batch in batches if batch)
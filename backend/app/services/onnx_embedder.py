@@ -0,0 +1,243 @@
+"""
+ONNX Runtime int8 Embedding后端
+在纯CPU节点上，PyTorch推理 all-MiniLM-L6-v2 是入库瓶颈；
+把同一模型导出为ONNX图并做动态int8量化，配合 tokenizers 快速分词器推理，
+池化方式与 sentence-transformers 一致（mask均值池化 + L2归一化），输出可与已有向量混用
+
+兼容性: 与 sentence-transformers 输出的余弦相似度不低于 ONNX_MIN_COSINE（见 scripts/benchmark_embedding_backends.py）
+"""
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Any, List, Optional
+
+import numpy as np
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+# 可选的本地编码后端
+EMBEDDING_BACKENDS = ("sentence-transformers", "onnx")
+
+# int8量化向量与原始fp32向量的最小余弦相似度（兼容性容差）
+ONNX_MIN_COSINE = 0.99
+
+ONNX_FP32_FILE = "model.onnx"
+ONNX_INT8_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+
+def _hub_model_id(model_name: str) -> str:
+    """sentence-transformers 短名称对应的Hugging Face模型ID"""
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+
+def default_onnx_dir(model_name: str, cache_folder: Optional[str]) -> str:
+    """默认导出目录: <MODEL_CACHE_DIR>/onnx/<模型名>"""
+    return os.path.join(cache_folder or "./models", "onnx", model_name.replace("/", "--"))
+
+
+def export_onnx_model(model_name: str, output_dir: str, cache_folder: Optional[str] = None) -> str:
+    """
+    导出ONNX图并动态量化为int8（需要 torch、transformers、onnxruntime）
+
+    Args:
+        model_name: 模型名，如 all-MiniLM-L6-v2
+        output_dir: 导出目录，写入 model.onnx、model.int8.onnx 和 tokenizer.json
+        cache_folder: 本地模型缓存目录
+
+    Returns:
+        int8模型路径
+    """
+    try:
+        import torch
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        from transformers import AutoModel, AutoTokenizer
+    except ImportError:
+        raise ImportError(
+            "导出ONNX模型需要安装 torch、transformers 和 onnxruntime: pip install onnxruntime"
+        )
+
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    hub_id = _hub_model_id(model_name)
+    logger.info("正在导出ONNX模型", model=hub_id, output_dir=output_dir)
+
+    # 先导出到同一文件系统上的临时目录，完成后逐个rename进目标目录，int8模型最后发布：
+    # 读方只要看到 model.int8.onnx，其余文件都已完整
+    staging_dir = tempfile.mkdtemp(prefix=".export-", dir=os.path.dirname(output_dir))
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(hub_id, cache_dir=cache_folder, use_fast=True)
+        model = AutoModel.from_pretrained(hub_id, cache_dir=cache_folder).eval()
+        dummy = tokenizer(["示例文本 example text"], return_tensors="pt")
+        input_names = ["input_ids", "attention_mask", "token_type_ids"]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+
+        fp32_path = os.path.join(staging_dir, ONNX_FP32_FILE)
+        with torch.inference_mode():
+            torch.onnx.export(
+                model,
+                tuple(dummy[name] for name in input_names),
+                fp32_path,
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=14
+            )
+
+        quantize_dynamic(fp32_path, os.path.join(staging_dir, ONNX_INT8_FILE), weight_type=QuantType.QInt8)
+        tokenizer.save_pretrained(staging_dir)
+
+        for name in sorted(os.listdir(staging_dir), key=lambda name: name == ONNX_INT8_FILE):
+            os.replace(os.path.join(staging_dir, name), os.path.join(output_dir, name))
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    int8_path = os.path.join(output_dir, ONNX_INT8_FILE)
+    logger.info("ONNX模型导出完成", path=int8_path, size_mb=round(os.path.getsize(int8_path) / 1024 / 1024, 2))
+    return int8_path
+
+
+@contextmanager
+def _export_lock(model_dir: str):
+    """同一导出目录的跨进程文件锁（编码进程池的worker同时启动时只导出一次）；无fcntl的平台不加锁"""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+
+    lock_path = os.path.abspath(model_dir).rstrip(os.sep) + ".lock"
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, "a+b") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def ensure_onnx_model(model_name: str, model_dir: str, cache_folder: Optional[str] = None) -> str:
+    """
+    目录中没有int8模型时导出（持锁后再检查一次，其他进程已导出时直接返回）
+
+    Returns:
+        int8模型路径
+    """
+    int8_path = os.path.join(model_dir, ONNX_INT8_FILE)
+    if os.path.exists(int8_path):
+        return int8_path
+    with _export_lock(model_dir):
+        if os.path.exists(int8_path):
+            return int8_path
+        return export_onnx_model(model_name, model_dir, cache_folder)
+
+
+class OnnxEmbedder:
+    """
+    ONNX Runtime 编码器
+
+    encode() 的签名与 SentenceTransformer.encode 兼容，可直接替换 EmbeddingService 中的本地模型
+    """
+
+    def __init__(
+        self,
+        model_dir: str,
+        max_seq_length: int = 256,
+        threads: int = 0,
+        quantized: bool = True
+    ):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise ImportError("需要安装 onnxruntime 和 tokenizers: pip install onnxruntime tokenizers")
+
+        self.model_dir = model_dir
+        self.max_seq_length = max_seq_length
+        model_path = os.path.join(model_dir, ONNX_INT8_FILE if quantized else ONNX_FP32_FILE)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self._session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {item.name for item in self._session.get_inputs()}
+
+        self._tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self._tokenizer.enable_truncation(max_length=max_seq_length)
+        pad_id = self._tokenizer.token_to_id("[PAD]") or 0
+        self._tokenizer.enable_padding(pad_id=pad_id, pad_token="[PAD]")
+
+    def get_max_seq_length(self) -> int:
+        return self.max_seq_length
+
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        """截断后的token数（不含padding）"""
+        return [sum(encoding.attention_mask) for encoding in self._tokenizer.encode_batch(texts)]
+
+    def encode(
+        self,
+        texts: List[str],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        show_progress_bar: bool = False,
+        **kwargs: Any
+    ) -> np.ndarray:
+        """
+        编码文本，返回 (n, D) 已归一化的float32向量
+
+        每个批次只填充到批内最长文本
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self._tokenizer.encode_batch(texts[start:start + batch_size])
+            attention_mask = np.asarray([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+            feeds = {
+                "input_ids": np.asarray([encoding.ids for encoding in encodings], dtype=np.int64),
+                "attention_mask": attention_mask,
+                "token_type_ids": np.asarray([encoding.type_ids for encoding in encodings], dtype=np.int64)
+            }
+            hidden = self._session.run(
+                None,
+                {name: value for name, value in feeds.items() if name in self._input_names}
+            )[0]
+
+            # mask均值池化 + L2归一化（与 sentence-transformers 的 Pooling + Normalize 模块一致）
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+            outputs.append(pooled / np.clip(norms, 1e-12, None))
+
+        return np.concatenate(outputs).astype(np.float32)
+
+
+def load_local_model(
+    model_name: str,
+    backend: str = "sentence-transformers",
+    cache_folder: Optional[str] = None,
+    onnx_dir: Optional[str] = None,
+    threads: int = 0
+):
+    """
+    按配置加载本地编码模型（服务进程与编码进程池worker共用）
+
+    Args:
+        backend: sentence-transformers 或 onnx；onnx 目录中没有导出的模型时先导出
+        threads: ONNX Runtime intra-op线程数，0表示使用默认值
+    """
+    if backend == "onnx":
+        model_dir = onnx_dir or default_onnx_dir(model_name, cache_folder)
+        ensure_onnx_model(model_name, model_dir, cache_folder)
+        return OnnxEmbedder(model_dir, threads=threads)
+
+    if backend != "sentence-transformers":
+        raise ValueError(f"不支持的Embedding后端: {backend}，可选: {', '.join(EMBEDDING_BACKENDS)}")
+
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, cache_folder=cache_folder)
@@ -0,0 +1,260 @@
+"""
+远程Embedding API客户端（Qwen3-Embedding 等 OpenAI 兼容接口）
+每批新建 httpx.AsyncClient 并串行等待时，入库速度受往返延迟限制；
+长连接池（可用时启用HTTP/2）+ 有界并发 + 令牌桶限速，失败批次按指数退避拆分重试，
+重试耗尽的文本保持 None
+"""
+import asyncio
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+# 可重试的HTTP状态码（限流、网关错误、服务不可用）
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class RemoteEmbeddingError(Exception):
+    """远程API调用失败"""
+
+    def __init__(self, message: str, retryable: bool = True, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    异步令牌桶: 以 rate 个/秒补充，最多积累 capacity 个
+
+    rate 为 0 时不限速
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.waited = 0.0
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                delay = (tokens - self._tokens) / self.rate
+                self.waited += delay
+                await asyncio.sleep(delay)
+
+
+class RemoteEmbeddingClient:
+    """
+    池化、并发、可重试的远程Embedding客户端
+
+    - 长期复用一个 httpx.AsyncClient（安装 h2 时使用HTTP/2多路复用）
+    - 同时在途的批次数不超过 max_concurrency
+    - 每个请求先从令牌桶取令牌（rate_limit 次/秒）
+    - 可重试的失败（限流、5xx、网络错误）按指数退避加抖动重试，多条文本的批次拆成两半分别重试；
+      不可重试的失败（如400、413）不消耗重试次数，只拆分定位问题文本，单条失败即放弃
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        api_key: str,
+        model_name: str,
+        timeout: float = 60.0,
+        batch_size: int = 32,
+        max_concurrency: int = 4,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        rate_limit: float = 0.0,
+        http2: bool = True,
+        transport: Any = None
+    ):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.model_name = model_name
+        self.timeout = timeout
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.http2 = http2
+        self.transport = transport  # 测试时可注入 httpx.MockTransport / ASGITransport
+
+        self.rate_limiter = TokenBucket(rate_limit)
+        self._client = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.requests = 0
+        self.retries = 0
+        self.splits = 0
+        self.failed_texts = 0
+
+    def _get_client(self):
+        """按事件循环懒加载连接池（httpx客户端不能跨事件循环使用）"""
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            http2 = self.http2
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    logger.warning("未安装h2，远程Embedding客户端使用HTTP/1.1连接池")
+                    http2 = False
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                ),
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                },
+                transport=self.transport
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client
+
+    async def _post(self, texts: List[str]) -> List[List[float]]:
+        """发送一次请求，失败时抛出 RemoteEmbeddingError"""
+        import httpx
+
+        client = self._get_client()
+        await self.rate_limiter.acquire()
+        async with self._semaphore:
+            self.requests += 1
+            try:
+                response = await client.post(
+                    self.api_url,
+                    json={
+                        "model": self.model_name,
+                        "input": texts,
+                        "encoding_format": "float"
+                    }
+                )
+            except httpx.HTTPError as e:
+                raise RemoteEmbeddingError(f"请求失败: {type(e).__name__} {e}")
+
+        if response.status_code != 200:
+            retry_after = response.headers.get("Retry-After")
+            raise RemoteEmbeddingError(
+                f"API错误 {response.status_code}: {response.text[:200]}",
+                retryable=response.status_code in RETRYABLE_STATUS,
+                retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None
+            )
+
+        try:
+            data = response.json()["data"]
+            if len(data) != len(texts):
+                raise ValueError(f"返回 {len(data)} 条向量，请求 {len(texts)} 条")
+            return [item["embedding"] for item in sorted(data, key=lambda x: x["index"])]
+        except (ValueError, KeyError, TypeError) as e:
+            raise RemoteEmbeddingError(f"API响应格式错误: {e}")
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(self.backoff_max, retry_after)
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * (0.5 + random.random() / 2)
+
+    async def _embed_with_retry(self, texts: List[str], attempt: int = 0) -> List[Optional[List[float]]]:
+        """
+        编码一个批次；失败时拆分重试，返回与输入对应的向量（放弃的位置为 None）
+
+        只有可重试的失败消耗重试次数并退避；不可重试的失败直接二分（不计次数），
+        直到定位出问题文本，同批的其他文本不受影响
+        """
+        try:
+            return await self._post(texts)
+        except RemoteEmbeddingError as e:
+            error = e
+
+        if not error.retryable:
+            if len(texts) == 1:
+                logger.error("远程向量化失败（不可重试）", error=str(error))
+                self.failed_texts += 1
+                return [None]
+            return await self._split(texts, attempt)
+
+        if attempt >= self.max_retries:
+            logger.error("远程向量化重试耗尽", error=str(error), batch_size=len(texts), attempts=attempt + 1)
+            self.failed_texts += len(texts)
+            return [None] * len(texts)
+
+        self.retries += 1
+        delay = self._backoff(attempt, error.retry_after)
+        logger.warning("远程向量化失败，退避后重试", error=str(error), batch_size=len(texts), delay_s=round(delay, 3))
+        await asyncio.sleep(delay)
+
+        if len(texts) == 1:
+            return await self._embed_with_retry(texts, attempt + 1)
+        return await self._split(texts, attempt + 1)
+
+    async def _split(self, texts: List[str], attempt: int) -> List[Optional[List[float]]]:
+        """批次拆成两半并发重试"""
+        self.splits += 1
+        middle = len(texts) // 2
+        left, right = await asyncio.gather(
+            self._embed_with_retry(texts[:middle], attempt),
+            self._embed_with_retry(texts[middle:], attempt)
+        )
+        return left + right
+
+    async def embed(self, texts: List[str], show_progress: bool = False) -> List[Optional[List[float]]]:
+        """
+        并发编码全部文本（调用方保证文本非空）
+
+        Returns:
+            与输入对应的向量列表，重试耗尽的位置为 None
+        """
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        completed = 0
+
+        async def run(batch: List[str]) -> List[Optional[List[float]]]:
+            nonlocal completed
+            embeddings = await self._embed_with_retry(batch)
+            completed += len(batch)
+            if show_progress:
+                logger.info(f"向量化进度: {completed}/{len(texts)}")
+            return embeddings
+
+        results = await asyncio.gather(*(run(batch) for batch in batches))
+        return [embedding for batch in results for embedding in batch]
+
+    async def close(self) -> None:
+        client, self._client = self._client, None
+        if client is not None:
+            await client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "api_url": self.api_url,
+            "max_concurrency": self.max_concurrency,
+            "batch_size": self.batch_size,
+            "rate_limit": self.rate_limiter.rate,
+            "requests": self.requests,
+            "retries": self.retries,
+            "splits": self.splits,
+            "failed_texts": self.failed_texts,
+            "rate_limited_wait_s": round(self.rate_limiter.waited, 3)
+        }
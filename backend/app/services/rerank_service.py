@@ -0,0 +1,176 @@
+"""
+Cross-Encoder重排序服务
+对第一阶段检索的候选做精排：查询与候选拼接后由小型cross-encoder打分，
+CPU上一次前向计算所有 (查询, 候选) 对，并受单次请求的延迟预算约束
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import structlog
+
+from app.core.config import get_settings
+
+logger = structlog.get_logger(__name__)
+
+
+class RerankService:
+    """本地CPU cross-encoder重排序"""
+
+    def __init__(self):
+        settings = get_settings()
+        self.model_name = settings.RERANK_MODEL
+        self.max_length = settings.RERANK_MAX_LENGTH
+        self.cache_dir = settings.MODEL_CACHE_DIR
+        self._model = None  # 延迟加载
+        self._tokenizer = None
+        self._model_lock = threading.Lock()  # 并发的首次调用只加载一次
+        # 专用单线程执行器：CPU上前向计算串行执行，超出预算被放弃的计算不占用默认线程池；
+        # 排队中尚未开始的计算在调用方超时后直接取消
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._model is not None
+
+    def _load_model(self):
+        """延迟加载本地模型（与Embedding模型共用 MODEL_CACHE_DIR 缓存）"""
+        if self._model is not None:
+            return self._model
+        with self._model_lock:
+            if self._model is not None:
+                return self._model
+            try:
+                import torch
+                from transformers import AutoModelForSequenceClassification, AutoTokenizer
+            except ImportError:
+                raise ImportError(
+                    "需要安装 transformers 和 torch: pip install transformers torch"
+                )
+            logger.info("正在加载重排序模型", model=self.model_name, cache_dir=self.cache_dir)
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_name, cache_dir=self.cache_dir)
+            model = AutoModelForSequenceClassification.from_pretrained(
+                self.model_name,
+                cache_dir=self.cache_dir
+            )
+            model.eval()
+            self._model = model.to(torch.device("cpu"))
+            logger.info("重排序模型加载成功", model=self.model_name)
+            return self._model
+
+    def score(self, query: str, passages: List[str]) -> np.ndarray:
+        """
+        一次前向计算所有 (查询, 候选) 对的相关度
+
+        Args:
+            query: 查询文本
+            passages: 候选文本
+
+        Returns:
+            与 passages 对应的相关度分数
+        """
+        import torch
+
+        model = self._load_model()
+        # 先按字符粗截断，避免超长chunk的分词开销；再按token精确截断（优先截断较长的候选）
+        char_limit = self.max_length * 4
+        features = self._tokenizer(
+            [query[:char_limit]] * len(passages),
+            [passage[:char_limit] for passage in passages],
+            padding=True,
+            truncation="longest_first",
+            max_length=self.max_length,
+            return_tensors="pt"
+        )
+        with torch.inference_mode():
+            logits = model(**features).logits
+
+        # 单输出模型直接取logit，多分类模型取“相关”类
+        scores = logits[:, 0] if logits.shape[1] == 1 else logits[:, -1]
+        return scores.float().numpy()
+
+    async def rerank(
+        self,
+        query: str,
+        candidates: List[Dict[str, Any]],
+        top_k: int,
+        budget_ms: Optional[float] = None
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        重排序候选
+
+        超出延迟预算或模型不可用时返回第一阶段顺序（已开始的计算不会中断，但结果被丢弃；
+        尚在执行器队列中的计算被取消）
+
+        Args:
+            query: 查询文本
+            candidates: 第一阶段结果（含 chunk），按第一阶段分数降序
+            top_k: 返回结果数量
+            budget_ms: 剩余的延迟预算（毫秒），None 表示不限制
+
+        Returns:
+            (结果列表, 重排序统计)
+        """
+        info: Dict[str, Any] = {
+            "applied": False,
+            "candidates": len(candidates),
+            "rerank_ms": 0.0,
+            "timed_out": False
+        }
+        if not candidates:
+            return candidates, info
+        if budget_ms is not None and budget_ms <= 0:
+            info["timed_out"] = True
+            return candidates[:top_k], info
+
+        passages = [item["chunk"].content or "" for item in candidates]
+        start = time.perf_counter()
+        try:
+            scores = await asyncio.wait_for(
+                asyncio.wrap_future(self._executor.submit(self.score, query, passages)),
+                timeout=budget_ms / 1000.0 if budget_ms is not None else None
+            )
+        except asyncio.TimeoutError:
+            info["timed_out"] = True
+            info["rerank_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            logger.warning("重排序超出延迟预算，返回第一阶段结果", **info)
+            return candidates[:top_k], info
+        except Exception as e:
+            info["error"] = str(e)
+            logger.error("重排序失败，返回第一阶段结果", error=str(e))
+            return candidates[:top_k], info
+
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        reranked = []
+        for position in order:
+            item = dict(candidates[position])
+            item["rerank_score"] = float(scores[position])
+            reranked.append(item)
+
+        info["applied"] = True
+        info["rerank_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        logger.info("重排序完成", **info)
+        return reranked, info
+
+
+# 全局单例
+_rerank_service = None
+
+
+def get_rerank_service() -> RerankService:
+    """获取重排序服务单例"""
+    global _rerank_service
+    if _rerank_service is None:
+        _rerank_service = RerankService()
+    return _rerank_service
+
+
+def close_rerank_service() -> None:
+    """关闭重排序执行器，取消排队中的计算（应用关闭时调用）"""
+    global _rerank_service
+    if _rerank_service is not None:
+        _rerank_service._executor.shutdown(wait=False, cancel_futures=True)
+        _rerank_service = None
@@ -0,0 +1,118 @@
+"""
+语义结果缓存
+缓存近期查询向量及其top-k结果；新查询与某个缓存查询的余弦距离在阈值内、
+且过滤条件等搜索参数完全一致时，直接返回缓存结果而不扫描索引
+
+缓存与向量索引的 generation 绑定，chunk向量化或删除导致 generation 变化时整体失效
+"""
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+
+class SemanticResultCache:
+    """
+    按查询向量相似度命中的结果缓存
+
+    - _vectors: (capacity, D) 已归一化的缓存查询向量，环形覆盖最旧的条目
+    - _entries: 与 _vectors 行对应的 (参数键, top_k, 结果)
+    """
+
+    def __init__(self, max_entries: int = 1024, max_distance: float = 0.05):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._vectors: Optional[np.ndarray] = None
+        self._entries: List[Optional[Tuple[Hashable, int, List[Tuple[str, float]]]]] = []
+        self._count = 0
+        self._next = 0
+        self._generation: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _reset(self, generation: int, dimension: int) -> None:
+        if self._generation is not None and self._count:
+            self.invalidations += 1
+        self._vectors = np.zeros((self.max_entries, dimension), dtype=np.float32)
+        self._entries = [None] * self.max_entries
+        self._count = 0
+        self._next = 0
+        self._generation = generation
+
+    def _check_generation(self, generation: int, dimension: int) -> None:
+        if (
+            self._generation != generation
+            or self._vectors is None
+            or self._vectors.shape[1] != dimension
+        ):
+            self._reset(generation, dimension)
+
+    def lookup(
+        self,
+        query: np.ndarray,
+        key: Hashable,
+        top_k: int,
+        generation: int
+    ) -> Optional[List[Tuple[str, float]]]:
+        """
+        查找缓存
+
+        Args:
+            query: 已归一化的查询向量
+            key: 除查询向量外的搜索参数（索引、过滤条件、阈值等）
+            top_k: 需要的结果数量，缓存条目的 top_k 不小于它才可复用
+            generation: 当前索引 generation
+
+        Returns:
+            缓存的 [(chunk_id, similarity)]（相似度为缓存查询的分数），未命中返回 None
+        """
+        self._check_generation(generation, query.shape[0])
+        if not self._count:
+            self.misses += 1
+            return None
+
+        similarities = self._vectors[:self._count] @ query
+        candidates = np.flatnonzero(similarities >= 1.0 - self.max_distance)
+        for row in candidates[np.argsort(-similarities[candidates])]:
+            entry_key, entry_top_k, hits = self._entries[row]
+            if entry_key == key and entry_top_k >= top_k:
+                self.hits += 1
+                return hits[:top_k]
+
+        self.misses += 1
+        return None
+
+    def store(
+        self,
+        query: np.ndarray,
+        key: Hashable,
+        top_k: int,
+        generation: int,
+        hits: List[Tuple[str, float]]
+    ) -> None:
+        """写入缓存（满时覆盖最旧的条目）"""
+        if not self.max_entries:
+            return
+        self._check_generation(generation, query.shape[0])
+        row = self._next
+        self._vectors[row] = query
+        self._entries[row] = (key, top_k, list(hits))
+        self._next = (row + 1) % self.max_entries
+        self._count = min(self._count + 1, self.max_entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        total = self.hits + self.misses
+        return {
+            "size": self._count,
+            "max_entries": self.max_entries,
+            "max_distance": self.max_distance,
+            "generation": self._generation,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
@@ -0,0 +1,591 @@
+"""
+多worker共享的内存映射向量存储
+WORKERS > 1 时每个uvicorn worker各持有一份常驻矩阵会使内存随worker数线性增长；
+SharedVectorIndex 把向量矩阵和id列写入同一组只追加的文件，所有worker以只读mmap
+映射，物理内存由页缓存共享，增加worker时常驻内存基本不变
+
+目录结构（第 g 代）:
+- vectors.<g>.f32: (N, D) 小端float32矩阵，每行已归一化
+- <列名>.<g>.ids: chunk_id 及元数据列，定长 S36 字节串（空串表示 None）
+- log.<g>.jsonl: 追加日志，数据写入后再追加 {"op": "add", "count": n} /
+  {"op": "delete", "rows": [...]}，日志行是写入的提交点
+- MANIFEST.json: 当前代号、维度、服务实例标识，临时文件 + rename 原子发布
+  （实例标识由主进程生成后经环境变量 VECTOR_STORE_SERVER_ID 传给worker，见 ensure_server_id()）
+- writer.lock: flock写锁，同一时刻只有一个worker写入
+
+删除只记录墓碑，墓碑过多时由写入方压缩为新的一代并发布，读方在下次访问时切换映射；
+BM25、ANN、文档质心等派生结构通过 SharedDocumentLog 按文档通知其他worker增量刷新
+"""
+import fcntl
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+import structlog
+
+from app.models.database import Document, DocumentChunk
+from app.services.embedding_codec import has_embedding
+from app.services.vector_index import METADATA_COLUMNS, VectorIndex, normalize_rows
+
+logger = structlog.get_logger(__name__)
+
+# 定长id列（UUID为36字节）
+ID_DTYPE = np.dtype("S36")
+
+# 写入文件的列: chunk_id + 元数据列（document_id 属于元数据列）
+STORED_COLUMNS = ("chunk_id",) + METADATA_COLUMNS
+
+# 墓碑数超过 max(COMPACT_MIN_TOMBSTONES, 总行数 * COMPACT_TOMBSTONE_RATIO) 时压缩
+COMPACT_MIN_TOMBSTONES = 1000
+COMPACT_TOMBSTONE_RATIO = 0.1
+
+# 压缩时分块复制，避免写入方临时持有整份矩阵
+COMPACT_BLOCK_ROWS = 65536
+
+
+# 按代编号的文件前缀（清理旧代时只匹配这些文件）
+GENERATION_FILE_PREFIXES = ("vectors", "log") + STORED_COLUMNS
+
+# 服务实例标识的环境变量，由主进程设置后被所有worker继承
+SERVER_ID_ENV = "VECTOR_STORE_SERVER_ID"
+
+
+def ensure_server_id() -> str:
+    """在主进程启动worker之前调用：生成随机的服务实例标识写入环境变量"""
+    return os.environ.setdefault(SERVER_ID_ENV, uuid.uuid4().hex)
+
+
+def _server_id() -> str:
+    """
+    服务实例标识：所有worker相同，服务重启后变化，首个启动的worker据此从数据库重建共享存储
+
+    优先取主进程写入的环境变量；未设置时（如直接用uvicorn命令行启动）取主进程PID及其启动时刻，
+    容器内主进程PID固定（如1）时重启后也能区分
+    """
+    server_id = os.environ.get(SERVER_ID_ENV)
+    if server_id:
+        return server_id
+
+    ppid = os.getppid()
+    try:
+        # /proc/<pid>/stat 第22个字段为进程启动时刻（开机后的时钟节拍数）
+        fields = Path(f"/proc/{ppid}/stat").read_text().rsplit(")", 1)[1].split()
+        return f"{ppid}-{fields[19]}"
+    except (OSError, IndexError):
+        return str(ppid)
+
+
+def _encode_ids(values: Sequence[Any]) -> np.ndarray:
+    """取值编码为定长字节串（None 记为空串）"""
+    encoded = [("" if value is None else str(value)).encode("utf-8") for value in values]
+    too_long = [value for value in encoded if len(value) > ID_DTYPE.itemsize]
+    if too_long:
+        raise ValueError(f"共享向量存储的id超出 {ID_DTYPE.itemsize} 字节: {too_long[0][:64]!r}")
+    return np.array(encoded, dtype=ID_DTYPE)
+
+
+def _decode_ids(values: np.ndarray) -> np.ndarray:
+    return np.array([value.decode("utf-8") for value in values], dtype=object)
+
+
+def _write_at(path: Path, offset: int, data: bytes) -> None:
+    """截断到 offset 后写入（丢弃上次写入失败遗留的未提交数据）"""
+    with open(path, "r+b" if path.exists() else "wb") as f:
+        f.truncate(offset)
+        f.seek(offset)
+        f.write(data)
+
+
+class SharedVectorIndex(VectorIndex):
+    """
+    基于内存映射文件的共享向量索引
+
+    - _matrix / _columns: 当前代文件的只读mmap视图，只映射日志已提交的行
+    - _chunk_ids / _document_ids: 定长字节串的mmap视图，返回结果时解码
+    - _metadata: 每个worker各自维护的int32类别编码（每行20字节），由id列增量编码
+    - _alive: 墓碑掩码，搜索时与过滤条件合并
+
+    每次读写前通过 sync() 检查清单和日志，追上其他worker的写入；
+    共享存储不使用量化
+    """
+
+    def __init__(self, directory: Path):
+        super().__init__()
+        self.directory = Path(directory)
+        self._columns: Dict[str, np.ndarray] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._live_count = 0
+        self._count = 0
+        self._store_generation: Optional[int] = None
+        self._store_dimension: Optional[int] = None  # 当前代清单记录的维度
+        self._manifest_signature: Optional[Tuple[int, int]] = None
+        self._log_offset = 0
+
+    # ---------- 文件布局 ----------
+
+    @property
+    def _manifest_path(self) -> Path:
+        return self.directory / "MANIFEST.json"
+
+    def _vectors_path(self, generation: int) -> Path:
+        return self.directory / f"vectors.{generation}.f32"
+
+    def _column_path(self, column: str, generation: int) -> Path:
+        return self.directory / f"{column}.{generation}.ids"
+
+    def _log_path(self, generation: int) -> Path:
+        return self.directory / f"log.{generation}.jsonl"
+
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(self._manifest_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    @contextmanager
+    def _writer(self):
+        """持有写锁并同步到最新状态"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / "writer.lock", "a+b") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self.sync()
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # ---------- 读方：映射与日志回放 ----------
+
+    @property
+    def size(self) -> int:
+        self.sync()
+        return self._live_count
+
+    def _live_mask(self) -> Optional[np.ndarray]:
+        if self._live_count == self._count:
+            return None
+        return self._alive
+
+    def sync(self) -> None:
+        """切换到清单发布的最新一代，并回放日志中新提交的写入"""
+        try:
+            stat = os.stat(self._manifest_path)
+        except FileNotFoundError:
+            return
+
+        signature = (stat.st_ino, stat.st_mtime_ns)
+        if signature != self._manifest_signature:
+            manifest = self._read_manifest()
+            if manifest is None:
+                return
+            self._manifest_signature = signature
+            if manifest["generation"] != self._store_generation:
+                self._open_generation(manifest)
+
+        self._tail_log()
+
+    def _open_generation(self, manifest: Dict[str, Any]) -> None:
+        self._store_generation = manifest["generation"]
+        self._store_dimension = manifest["dimension"]
+        self.dimension = manifest["dimension"]
+        self._count = 0
+        self._live_count = 0
+        self._log_offset = 0
+        self._alive = np.zeros(0, dtype=bool)
+        self._map_rows(0)
+        self._metadata = {column: np.empty(0, dtype=np.int32) for column in METADATA_COLUMNS}
+        self.generation += 1
+        logger.info("共享向量存储切换到新一代", generation=self._store_generation)
+
+    def _tail_log(self) -> None:
+        if self._store_generation is None:
+            return
+        try:
+            with open(self._log_path(self._store_generation), "rb") as f:
+                f.seek(self._log_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+
+        # 只处理完整的行，写到一半的行留到下次
+        end = data.rfind(b"\n") + 1
+        if not end:
+            return
+        # 连续的追加合并为一次重新映射；删除引用的行号总是指向已追加的行
+        added = 0
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record["op"] == "add":
+                added += record["count"]
+            elif record["op"] == "delete":
+                if added:
+                    self._append_rows(added)
+                    added = 0
+                self._delete_rows(record["rows"])
+        if added:
+            self._append_rows(added)
+        self._log_offset += end
+        self.generation += 1
+
+    def _map_rows(self, count: int) -> None:
+        """重新映射前 count 行（文件只追加，已映射部分的内容不会变化）"""
+        generation = self._store_generation
+        if count:
+            self._matrix = np.memmap(
+                self._vectors_path(generation), dtype="<f4", mode="r", shape=(count, self.dimension)
+            )
+            self._columns = {
+                column: np.memmap(self._column_path(column, generation), dtype=ID_DTYPE, mode="r", shape=(count,))
+                for column in STORED_COLUMNS
+            }
+        else:
+            self._matrix = np.empty((0, self.dimension or 0), dtype=np.float32)
+            self._columns = {column: np.empty(0, dtype=ID_DTYPE) for column in STORED_COLUMNS}
+        self._chunk_ids = self._columns["chunk_id"]
+        self._document_ids = self._columns["document_id"]
+
+    def _append_rows(self, added: int) -> None:
+        start, count = self._count, self._count + added
+        self._map_rows(count)
+        for column in METADATA_COLUMNS:
+            self._metadata[column] = np.concatenate([
+                self._metadata[column], self._encode_column(column, self._columns[column][start:count])
+            ])
+        self._alive = np.concatenate([self._alive, np.ones(added, dtype=bool)])
+        self._count = count
+        self._live_count += added
+
+    def _delete_rows(self, rows: List[int]) -> None:
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[self._alive[rows]]
+        self._alive[rows] = False
+        self._live_count -= len(rows)
+
+    def _encode_column(self, column: str, raw: np.ndarray) -> np.ndarray:
+        """字节串批量编码为int32类别编码（与 _encode_metadata 共用取值表）"""
+        uniques, inverse = np.unique(raw, return_inverse=True)
+        vocab = self._vocab[column]
+        vocab_values = self._vocab_values[column]
+        codes = np.empty(len(uniques), dtype=np.int32)
+        for i, value in enumerate(uniques):
+            value = value.decode("utf-8") or None
+            code = vocab.get(value)
+            if code is None:
+                code = vocab[value] = len(vocab_values)
+                vocab_values.append(value)
+            codes[i] = code
+        return codes[inverse.reshape(-1)]
+
+    # ---------- 写方 ----------
+
+    def _append_log(self, record: Dict[str, Any]) -> None:
+        with open(self._log_path(self._store_generation), "ab") as f:
+            f.write(json.dumps(record).encode("utf-8") + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _publish(self, columns: Dict[str, np.ndarray], blocks, count: int) -> None:
+        """
+        写出新一代文件并通过清单rename原子发布（调用方持有写锁）
+
+        Args:
+            columns: {列名: 定长字节串数组}
+            blocks: 归一化float32矩阵的分块迭代器
+            count: 总行数
+        """
+        generation = (self._store_generation or 0) + 1
+        vectors_path = self._vectors_path(generation)
+        with open(vectors_path, "wb") as f:
+            for block in blocks:
+                f.write(np.ascontiguousarray(block, dtype="<f4").tobytes())
+        for column in STORED_COLUMNS:
+            self._column_path(column, generation).write_bytes(columns[column].tobytes())
+        log_path = self._log_path(generation)
+        log_path.write_bytes(
+            (json.dumps({"op": "add", "count": count}) + "\n").encode("utf-8") if count else b""
+        )
+
+        manifest = {
+            "generation": generation,
+            "dimension": self.dimension,
+            "server_id": _server_id(),
+            "created_at": time.time()
+        }
+        tmp_path = self._manifest_path.with_name("MANIFEST.json.tmp")
+        tmp_path.write_text(json.dumps(manifest), encoding="utf-8")
+        os.replace(tmp_path, self._manifest_path)
+
+        self.sync()
+        self._remove_old_generations(generation)
+
+    def _remove_old_generations(self, current: int) -> None:
+        """删除早于上一代的文件（上一代可能仍被其他worker映射，已映射的文件删除后仍可读）"""
+        for path in self.directory.iterdir():
+            parts = path.name.split(".")
+            if (
+                len(parts) == 3
+                and parts[0] in GENERATION_FILE_PREFIXES
+                and parts[1].isdigit()
+                and int(parts[1]) < current - 1
+            ):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    def _maybe_compact(self) -> None:
+        tombstones = self._count - self._live_count
+        if tombstones <= max(COMPACT_MIN_TOMBSTONES, self._count * COMPACT_TOMBSTONE_RATIO):
+            return
+
+        live = np.flatnonzero(self._alive)
+        matrix = self._matrix
+        blocks = (
+            matrix[live[start:start + COMPACT_BLOCK_ROWS]]
+            for start in range(0, len(live), COMPACT_BLOCK_ROWS)
+        )
+        columns = {column: np.asarray(self._columns[column][live]) for column in STORED_COLUMNS}
+        self._publish(columns, blocks, len(live))
+        logger.info("共享向量存储压缩完成", vectors=len(live), removed=tombstones, generation=self._store_generation)
+
+    def _ensure_store(self, dimension: int) -> None:
+        """写入前确保存储已初始化，空存储按写入的向量确定维度（调用方持有写锁）"""
+        # 以清单中的维度判断：空库启动时清单维度为空，本进程的 dimension 可能已由数据库读取设置
+        if self._store_generation is None or (not self._count and self._store_dimension != dimension):
+            self.dimension = dimension
+            empty = {column: np.empty(0, dtype=ID_DTYPE) for column in STORED_COLUMNS}
+            self._publish(empty, [], 0)
+
+    async def load(self, db: AsyncSession) -> None:
+        """
+        连接共享存储；清单缺失、属于上一次服务实例或与数据库行数不一致时从数据库重建
+
+        数据库读取在写锁外进行，持锁后若发现其他worker已为本服务实例重建则直接复用
+        """
+        self.sync()
+        manifest = self._read_manifest()
+        stale = manifest is None or manifest.get("server_id") != _server_id()
+        if not stale:
+            result = await db.execute(
+                select(func.count(DocumentChunk.id)).join(
+                    Document, Document.id == DocumentChunk.document_id
+                ).filter(has_embedding())
+            )
+            stale = result.scalar() != self.size
+
+        if stale:
+            seen_generation = manifest.get("generation") if manifest else None
+            # 维度以数据库中的向量为准（模型更换后旧存储的维度作废）
+            self.dimension = None
+            chunk_ids, document_ids, matrix, metadata = await self._fetch_rows(db)
+            with self._writer():
+                current = self._read_manifest()
+                rebuilt = (
+                    current is not None
+                    and current.get("generation") != seen_generation
+                    and current.get("server_id") == _server_id()
+                )
+                if not rebuilt:
+                    self._rebuild(chunk_ids, document_ids, matrix, metadata)
+
+        self.sync()
+        self._loaded = True
+        logger.info(
+            "共享向量存储已加载",
+            vectors=self.size,
+            dimension=self.dimension,
+            generation=self._store_generation,
+            mapped_mb=round(self._matrix.nbytes / 1024 / 1024, 2),
+            directory=str(self.directory)
+        )
+
+    def _rebuild(
+        self,
+        chunk_ids: List[str],
+        document_ids: List[str],
+        matrix: Optional[np.ndarray],
+        metadata: Dict[str, List[Any]]
+    ) -> None:
+        columns = {"chunk_id": _encode_ids(chunk_ids), "document_id": _encode_ids(document_ids)}
+        for column in METADATA_COLUMNS[1:]:
+            columns[column] = _encode_ids(metadata.get(column) or [None] * len(chunk_ids))
+        self._publish(columns, [matrix] if matrix is not None else [], len(chunk_ids))
+
+    def upsert(
+        self,
+        chunk_ids: Sequence[str],
+        document_ids: Sequence[str],
+        vectors: np.ndarray,
+        metadata: Optional[Dict[str, Sequence[Any]]] = None
+    ) -> None:
+        """追加向量（已存在的chunk先记墓碑），参数同 VectorIndex.upsert()"""
+        if len(chunk_ids) == 0:
+            return
+
+        vectors = normalize_rows(np.array(vectors, dtype=np.float32, ndmin=2))
+        metadata = dict(metadata or {})
+        metadata["document_id"] = document_ids
+        columns = {"chunk_id": _encode_ids(chunk_ids)}
+        for column in METADATA_COLUMNS:
+            columns[column] = _encode_ids(metadata.get(column) or [None] * len(chunk_ids))
+
+        with self._writer():
+            self._ensure_store(vectors.shape[1])
+            if vectors.shape[1] != self.dimension:
+                raise ValueError(f"向量维度不匹配: {vectors.shape[1]} != {self.dimension}")
+
+            replaced = np.flatnonzero(self._alive & np.isin(self._chunk_ids, columns["chunk_id"]))
+            if len(replaced):
+                self._append_log({"op": "delete", "rows": replaced.tolist()})
+
+            generation = self._store_generation
+            _write_at(self._vectors_path(generation), self._count * self.dimension * 4, vectors.astype("<f4").tobytes())
+            for column in STORED_COLUMNS:
+                _write_at(
+                    self._column_path(column, generation),
+                    self._count * ID_DTYPE.itemsize,
+                    columns[column].tobytes()
+                )
+            self._append_log({"op": "add", "count": len(chunk_ids)})
+            self.sync()
+            self._maybe_compact()
+
+    def remove_document(self, document_id: str) -> int:
+        """记录该文档所有行的墓碑"""
+        with self._writer():
+            code = self._vocab["document_id"].get(document_id)
+            if code is None or not self._count:
+                return 0
+            rows = np.flatnonzero(self._alive & (self._metadata["document_id"] == code))
+            if len(rows):
+                self._append_log({"op": "delete", "rows": rows.tolist()})
+                self.sync()
+                self._maybe_compact()
+                logger.info("从共享向量存储移除文档", document_id=document_id, removed=len(rows))
+            return len(rows)
+
+    def document_rows(self, document_id: str) -> Tuple[List[str], List[str], Optional[np.ndarray]]:
+        """某个文档当前有效行的 (chunk_ids, document_ids, 归一化矩阵)，文档没有向量时矩阵为 None"""
+        self.sync()
+        code = self._vocab["document_id"].get(document_id)
+        if code is None or not self._count:
+            return [], [], None
+        rows = np.flatnonzero(self._alive & (self._metadata["document_id"] == code))
+        if not len(rows):
+            return [], [], None
+        chunk_ids = _decode_ids(self._chunk_ids[rows]).tolist()
+        return chunk_ids, [document_id] * len(chunk_ids), np.asarray(self._matrix[rows])
+
+    # ---------- 查询 ----------
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """有效行的 (chunk_ids, document_ids, 归一化矩阵)，id已解码"""
+        self.sync()
+        live = np.flatnonzero(self._alive)
+        return (
+            _decode_ids(self._chunk_ids[live]),
+            _decode_ids(self._document_ids[live]),
+            np.asarray(self._matrix[live])
+        )
+
+    def _id_keys(self, chunk_ids: Sequence[str]) -> np.ndarray:
+        return _encode_ids(chunk_ids)
+
+    def matching_documents(self, filters: Optional[Dict[str, Any]]) -> Optional[set]:
+        if not filters:
+            return None
+        self.sync()
+        return super().matching_documents(filters)
+
+    def search(self, query_embedding, *args, **kwargs) -> List[Tuple[str, float]]:
+        self.sync()
+        hits = super().search(query_embedding, *args, **kwargs)
+        return [(chunk_id.decode("utf-8"), similarity) for chunk_id, similarity in hits]
+
+    def search_batch(self, query_embeddings, *args, **kwargs) -> List[List[Tuple[str, float]]]:
+        self.sync()
+        results = super().search_batch(query_embeddings, *args, **kwargs)
+        return [
+            [(chunk_id.decode("utf-8"), similarity) for chunk_id, similarity in hits]
+            for hits in results
+        ]
+
+
+class SharedDocumentLog:
+    """
+    多worker间的文档变更日志
+
+    共享存储只共享向量矩阵，BM25倒排、ANN索引、文档质心仍由各worker独立维护；
+    写入方同步完自己的派生结构后追加 {"op": ..., "document_id": ..., "writer": pid}，
+    其他worker检索前回放新记录，按文档从共享矩阵/数据库增量刷新。
+    日志按服务实例命名，服务重启后各worker从数据库全量加载，旧日志作废
+    """
+
+    OPS = ("vectors", "chunks", "remove")
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.writer = str(os.getpid())
+        self._offset = 0
+
+    @property
+    def path(self) -> Path:
+        return self.directory / f"documents.{_server_id()}.jsonl"
+
+    def mark(self) -> None:
+        """
+        从当前末尾开始回放（全量加载之前调用，加载期间的变更会被重复回放，刷新是幂等的）
+
+        同时清理以前服务实例的日志
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        try:
+            self._offset = self.path.stat().st_size
+        except FileNotFoundError:
+            self._offset = 0
+        for path in self.directory.glob("documents.*.jsonl"):
+            if path != self.path:
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    def append(self, op: str, document_id: str) -> None:
+        record = json.dumps({"op": op, "document_id": document_id, "writer": self.writer})
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(record.encode("utf-8") + b"\n")
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def read_new(self) -> List[Dict[str, Any]]:
+        """读取其他worker追加的新记录（写到一半的行留到下次）"""
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return []
+
+        end = data.rfind(b"\n") + 1
+        self._offset += end
+        records = []
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("writer") != self.writer:
+                records.append(record)
+        return records
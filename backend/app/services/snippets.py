@@ -0,0 +1,77 @@
+"""
+搜索结果内容裁剪
+Agent通常只需要命中位置附近的片段，返回整段chunk内容会放大响应体积；
+支持截断、按查询词定位片段或完全不返回内容
+"""
+from typing import List, Tuple
+
+from app.services.bm25_index import tokenize
+
+# 内容模式: 完整内容 / 前N个字符 / 查询词最密集的N字符片段 / 不返回内容
+CONTENT_MODES = ("full", "truncate", "snippet", "none")
+
+ELLIPSIS = "…"
+
+# 定位片段时最多使用的匹配位置数
+MAX_MATCH_POSITIONS = 256
+
+
+def _match_positions(content: str, query: str) -> List[Tuple[int, int]]:
+    """查询词（与BM25相同的分词）在内容中出现的 (起始位置, 长度)，按位置排序"""
+    lowered = content.lower()
+    positions: List[Tuple[int, int]] = []
+    for term in set(tokenize(query)):
+        start = lowered.find(term)
+        while start != -1 and len(positions) < MAX_MATCH_POSITIONS:
+            positions.append((start, len(term)))
+            start = lowered.find(term, start + len(term))
+    positions.sort()
+    return positions
+
+
+def make_snippet(content: str, query: str, max_chars: int) -> str:
+    """
+    选取包含最多查询词匹配的 max_chars 字符窗口，窗口前留少量上下文
+
+    没有匹配时退化为截断
+    """
+    if len(content) <= max_chars:
+        return content
+
+    positions = _match_positions(content, query)
+    if not positions:
+        return content[:max_chars] + ELLIPSIS
+
+    # 以每个匹配位置为窗口起点，统计窗口内完整包含的匹配数，取最多者
+    best_start, best_count = positions[0][0], 0
+    end_index = 0
+    for i, (start, _) in enumerate(positions):
+        end_index = max(end_index, i)
+        while end_index < len(positions) and sum(positions[end_index]) <= start + max_chars:
+            end_index += 1
+        if end_index - i > best_count:
+            best_start, best_count = start, end_index - i
+
+    start = max(0, min(best_start - max_chars // 10, len(content) - max_chars))
+    end = start + max_chars
+    return (ELLIPSIS if start > 0 else "") + content[start:end] + (ELLIPSIS if end < len(content) else "")
+
+
+def shape_content(content: str, mode: str = "full", max_chars: int = 300, query: str = "") -> str:
+    """
+    按内容模式裁剪chunk内容
+
+    Args:
+        content: 完整内容
+        mode: full / truncate / snippet / none
+        max_chars: truncate / snippet 模式的最大字符数
+        query: snippet 模式用于定位片段的查询文本
+    """
+    content = content or ""
+    if mode == "none":
+        return ""
+    if mode == "truncate":
+        return content if len(content) <= max_chars else content[:max_chars] + ELLIPSIS
+    if mode == "snippet":
+        return make_snippet(content, query, max_chars)
+    return content
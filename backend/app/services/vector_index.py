@@ -0,0 +1,639 @@
+"""
+常驻内存向量索引
+启动时从数据库一次性加载所有chunk向量，预归一化为连续的float32矩阵，
+查询只需一次矩阵-向量乘法，不再逐条反序列化和计算
+"""
+import copy
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import structlog
+
+from app.models.database import DevType, Document, DocumentChunk
+from app.services.embedding_codec import decode_embedding, has_embedding
+from app.services.vector_quantization import Quantizer, evaluate_quantizer
+
+logger = structlog.get_logger(__name__)
+
+# 与矩阵行对应的列式元数据（按类别编码为int32），用于预过滤
+METADATA_COLUMNS = ("document_id", "dev_type", "team_id", "project_id", "access_level")
+
+# 过滤后候选占比低于该值时只抽取候选行打分，否则整体打分后掩码
+# （抽取行的单行开销约为连续矩阵乘法的数倍）
+PREFILTER_GATHER_RATIO = 0.15
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    按行L2归一化（零向量保持为零，其相似度恒为0）
+
+    Args:
+        matrix: 二维float32矩阵
+
+    Returns:
+        归一化后的矩阵（原地修改并返回）
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def select_top_k(
+    scores: np.ndarray,
+    top_k: int,
+    min_similarity: float = None,
+    mask: np.ndarray = None
+) -> np.ndarray:
+    """
+    向量化的过滤 + top-k选择
+
+    argpartition 以O(N)选出k个胜者，只对这k个排序，
+    阈值在选出后再过滤（结果与先过滤再取top-k一致）
+
+    Args:
+        scores: 一维相似度数组
+        top_k: 返回数量
+        min_similarity: 最小相似度阈值
+        mask: 候选掩码，False 的位置不参与选择
+
+    Returns:
+        按分数降序排列的位置下标
+    """
+    if mask is not None:
+        scores = np.where(mask, scores, -np.inf)
+
+    n = len(scores)
+    k = min(top_k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    if k < n:
+        winners = np.argpartition(scores, n - k)[n - k:]
+    else:
+        winners = np.arange(n)
+    order = winners[np.argsort(-scores[winners], kind="stable")]
+
+    keep = scores[order] > -np.inf
+    if min_similarity is not None:
+        keep &= scores[order] >= min_similarity
+    return order[keep]
+
+
+def prepare_query(query_embedding: Sequence[float], dimension: Optional[int]) -> Optional[np.ndarray]:
+    """
+    校验维度并归一化查询向量
+
+    Returns:
+        归一化后的float32向量，维度不一致或零向量时返回 None
+    """
+    query = np.asarray(query_embedding, dtype=np.float32)
+    if dimension is not None and query.shape[0] != dimension:
+        logger.error("查询向量维度与索引不一致", query_dim=query.shape[0], index_dim=dimension)
+        return None
+    norm = np.linalg.norm(query)
+    if norm == 0:
+        return None
+    return query / norm
+
+
+def _metadata_value(value: Any) -> Any:
+    """枚举取其值，其余原样保留"""
+    return getattr(value, "value", value)
+
+
+class VectorIndex:
+    """
+    常驻内存的向量索引
+
+    - _matrix: (N, D) 连续float32矩阵，每行已归一化
+    - _codes: 可选的量化编码（与矩阵行对应），搜索时先扫描编码再精确重打分；
+      向量数达到 min_train_size 后才训练量化器，此后每增长到上次训练时的 retrain_growth 倍
+      就在全量向量上重新训练并重新编码（训练量随规模翻倍，均摊开销为常数）
+    - _chunk_ids / _document_ids: 与矩阵行一一对应的id数组
+    - _metadata: 列式元数据，每列为与矩阵行对应的int32类别编码，
+      取值到编码的映射保存在 _vocab 中，编码到取值保存在 _vocab_values 中（只增不减）
+
+    写操作总是构建新数组后整体替换，读操作不会看到半更新的状态；
+    每次写操作递增 generation，供结果缓存判断失效
+    """
+
+    def __init__(
+        self,
+        quantizer: Optional[Quantizer] = None,
+        rescore_factor: int = 4,
+        min_train_size: int = 1024,
+        retrain_growth: float = 2.0
+    ):
+        self.dimension: Optional[int] = None
+        self.quantizer = quantizer
+        self.rescore_factor = max(1, rescore_factor)
+        self.min_train_size = max(1, min_train_size)
+        self.retrain_growth = max(1.0, retrain_growth)
+        # 量化器上次训练时的向量数，0 表示尚未训练
+        self._trained_size = 0
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._codes: Optional[np.ndarray] = None
+        self._chunk_ids = np.empty(0, dtype=object)
+        self._document_ids = np.empty(0, dtype=object)
+        self._metadata: Dict[str, np.ndarray] = {
+            column: np.empty(0, dtype=np.int32) for column in METADATA_COLUMNS
+        }
+        self._vocab: Dict[str, Dict[Any, int]] = {column: {} for column in METADATA_COLUMNS}
+        self._vocab_values: Dict[str, List[Any]] = {column: [] for column in METADATA_COLUMNS}
+        self._loaded = False
+        self.generation = 0
+        # 按chunk id排序的行号，供 get_vectors() 二分查找，generation 变化后惰性重建
+        self._id_order: Optional[np.ndarray] = None
+        self._sorted_ids: Optional[np.ndarray] = None
+        self._id_order_generation: Optional[int] = None
+
+    @property
+    def size(self) -> int:
+        """索引中的向量数量"""
+        return len(self._chunk_ids)
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded
+
+    async def _fetch_rows(
+        self,
+        db: AsyncSession,
+        document_id: str = None
+    ) -> Tuple[List[str], List[str], Optional[np.ndarray], Dict[str, List[Any]]]:
+        """
+        从数据库读取已向量化chunk的 (id, document_id, embedding, 元数据)
+
+        只查询需要的列，并关联Document以跳过已删除文档遗留的chunks；
+        二进制列零拷贝解码，未迁移的行回退到JSON文本
+        """
+        stmt = select(
+            DocumentChunk.id,
+            DocumentChunk.document_id,
+            DocumentChunk.embedding_blob,
+            DocumentChunk.embedding,
+            DevType.category,
+            Document.team_id,
+            Document.project_id,
+            Document.access_level
+        ).join(
+            Document, Document.id == DocumentChunk.document_id
+        ).outerjoin(
+            DevType, DevType.id == Document.dev_type_id
+        ).filter(
+            has_embedding()
+        )
+        if document_id:
+            stmt = stmt.filter(DocumentChunk.document_id == document_id)
+
+        result = await db.execute(stmt)
+        rows = result.all()
+
+        chunk_ids: List[str] = []
+        document_ids: List[str] = []
+        vectors: List[np.ndarray] = []
+        metadata: Dict[str, List[Any]] = {column: [] for column in METADATA_COLUMNS}
+        skipped = 0
+
+        for chunk_id, doc_id, blob, text, *attributes in rows:
+            vector = decode_embedding(blob, text)
+            if vector is None or not vector.size:
+                skipped += 1
+                continue
+            if self.dimension is None:
+                self.dimension = vector.size
+            if vector.size != self.dimension:
+                skipped += 1
+                continue
+            chunk_ids.append(chunk_id)
+            document_ids.append(doc_id)
+            vectors.append(vector)
+            for column, value in zip(METADATA_COLUMNS, (doc_id, *attributes)):
+                metadata[column].append(_metadata_value(value))
+
+        if skipped:
+            logger.warning("部分chunk向量无法加载到索引", skipped=skipped)
+
+        if not vectors:
+            return chunk_ids, document_ids, None, metadata
+
+        matrix = np.stack(vectors).astype(np.float32, copy=False)
+        return chunk_ids, document_ids, normalize_rows(matrix), metadata
+
+    def _encode_metadata(
+        self,
+        document_ids: Sequence[str],
+        metadata: Optional[Dict[str, Sequence[Any]]]
+    ) -> Dict[str, np.ndarray]:
+        """把元数据取值编码为int32类别编码列（缺失的列记为 None）"""
+        metadata = dict(metadata or {})
+        metadata["document_id"] = document_ids
+        columns = {}
+        for column in METADATA_COLUMNS:
+            values = metadata.get(column) or [None] * len(document_ids)
+            vocab = self._vocab[column]
+            vocab_values = self._vocab_values[column]
+            codes = np.empty(len(document_ids), dtype=np.int32)
+            for i, value in enumerate(values):
+                code = vocab.get(value)
+                if code is None:
+                    code = vocab[value] = len(vocab_values)
+                    vocab_values.append(value)
+                codes[i] = code
+            columns[column] = codes
+        return columns
+
+    async def load(self, db: AsyncSession) -> None:
+        """从数据库全量构建索引"""
+        chunk_ids, document_ids, matrix, metadata = await self._fetch_rows(db)
+
+        if matrix is None:
+            matrix = np.empty((0, self.dimension or 0), dtype=np.float32)
+
+        matrix = np.ascontiguousarray(matrix)
+        self._trained_size = 0
+        self._codes = None
+        self._matrix = matrix
+        if self.quantizer is not None:
+            self._train_quantizer(matrix)
+        self._chunk_ids = np.asarray(chunk_ids, dtype=object)
+        self._document_ids = np.asarray(document_ids, dtype=object)
+        self._metadata = self._encode_metadata(document_ids, metadata)
+        self._loaded = True
+        self.generation += 1
+
+        logger.info(
+            "向量索引构建完成",
+            vectors=self.size,
+            dimension=self.dimension,
+            quantization=self.quantizer.name if self.quantizer else "none",
+            memory_mb=round(self._matrix.nbytes / 1024 / 1024, 2)
+        )
+
+    async def ensure_loaded(self, db: AsyncSession) -> None:
+        """索引未构建时（如启动阶段失败）延迟构建"""
+        if not self._loaded:
+            await self.load(db)
+
+    def sync(self) -> None:
+        """与其他进程的写入同步（进程内索引无需同步，共享存储见 SharedVectorIndex）"""
+
+    def _live_mask(self) -> Optional[np.ndarray]:
+        """有效行掩码，None 表示所有行有效（共享存储用于屏蔽已删除的行）"""
+        return None
+
+    def _train_quantizer(self, matrix: np.ndarray) -> bool:
+        """
+        向量数达到训练阈值（首次）或增长到上次训练时的 retrain_growth 倍时，
+        在全量向量上训练量化器并重新编码所有行
+
+        训练在量化器副本上进行，完成后与编码一起替换，读方不会看到参数与编码不匹配
+
+        Returns:
+            是否重新训练
+        """
+        size = len(matrix)
+        if size < self.min_train_size:
+            return False
+        if self._trained_size and size < self._trained_size * self.retrain_growth:
+            return False
+
+        quantizer = copy.copy(self.quantizer)
+        quantizer.train(matrix)
+        codes = quantizer.encode(matrix)
+        self.quantizer, self._codes = quantizer, codes
+        logger.info(
+            "量化器已训练",
+            quantization=quantizer.name,
+            vectors=size,
+            previous=self._trained_size
+        )
+        self._trained_size = size
+        return True
+
+    def upsert(
+        self,
+        chunk_ids: Sequence[str],
+        document_ids: Sequence[str],
+        vectors: np.ndarray,
+        metadata: Optional[Dict[str, Sequence[Any]]] = None
+    ) -> None:
+        """
+        写入/覆盖向量
+
+        Args:
+            chunk_ids: chunk id列表
+            document_ids: 对应的文档id列表
+            vectors: (n, D) 未归一化的向量矩阵
+            metadata: {列名: 取值列表}，见 METADATA_COLUMNS
+        """
+        if len(chunk_ids) == 0:
+            return
+
+        vectors = normalize_rows(np.array(vectors, dtype=np.float32, ndmin=2))
+        if self.dimension is None:
+            self.dimension = vectors.shape[1]
+        if vectors.shape[1] != self.dimension:
+            raise ValueError(f"向量维度不匹配: {vectors.shape[1]} != {self.dimension}")
+
+        new_ids = np.asarray(chunk_ids, dtype=object)
+        keep = ~np.isin(self._chunk_ids, new_ids)
+        base = self._matrix[keep] if self.size else np.empty((0, self.dimension), dtype=np.float32)
+
+        matrix = np.ascontiguousarray(np.vstack([base, vectors]))
+        if self.quantizer is not None and not self._train_quantizer(matrix) and self._codes is not None:
+            self._codes = np.concatenate([self._codes[keep], self.quantizer.encode(vectors)])
+
+        self._matrix = matrix
+        self._chunk_ids = np.concatenate([self._chunk_ids[keep], new_ids])
+        self._document_ids = np.concatenate([
+            self._document_ids[keep],
+            np.asarray(document_ids, dtype=object)
+        ])
+        new_metadata = self._encode_metadata(document_ids, metadata)
+        self._metadata = {
+            column: np.concatenate([codes[keep], new_metadata[column]])
+            for column, codes in self._metadata.items()
+        }
+        self.generation += 1
+
+    def remove_document(self, document_id: str) -> int:
+        """
+        移除某个文档的所有向量
+
+        Returns:
+            移除的向量数量
+        """
+        if not self.size:
+            return 0
+
+        code = self._vocab["document_id"].get(document_id)
+        if code is None:
+            return 0
+
+        keep = self._metadata["document_id"] != code
+        removed = int(self.size - np.count_nonzero(keep))
+        if removed:
+            if self._codes is not None:
+                self._codes = self._codes[keep]
+            self._matrix = np.ascontiguousarray(self._matrix[keep])
+            self._chunk_ids = self._chunk_ids[keep]
+            self._document_ids = self._document_ids[keep]
+            self._metadata = {column: codes[keep] for column, codes in self._metadata.items()}
+            self.generation += 1
+            logger.info("从向量索引移除文档", document_id=document_id, removed=removed)
+        return removed
+
+    async def refresh_document(
+        self,
+        db: AsyncSession,
+        document_id: str
+    ) -> Tuple[List[str], List[str], Optional[np.ndarray]]:
+        """
+        按数据库中的最新状态重建某个文档的向量
+
+        Returns:
+            该文档的 (chunk_ids, document_ids, 归一化矩阵)，供其他索引同步
+        """
+        chunk_ids, document_ids, matrix, metadata = await self._fetch_rows(db, document_id=document_id)
+        self.remove_document(document_id)
+        if matrix is not None:
+            self.upsert(chunk_ids, document_ids, matrix, metadata)
+        logger.info("向量索引已同步文档", document_id=document_id, vectors=len(chunk_ids))
+        return chunk_ids, document_ids, matrix
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """当前索引内容 (chunk_ids, document_ids, 归一化矩阵)"""
+        return self._chunk_ids, self._document_ids, self._matrix
+
+    def _id_keys(self, chunk_ids: Sequence[str]) -> np.ndarray:
+        """chunk id转换为与 _chunk_ids 同类型的查找键"""
+        return np.asarray(chunk_ids, dtype=object)
+
+    def get_vectors(self, chunk_ids: Sequence[str]) -> np.ndarray:
+        """
+        按chunk id取归一化向量（供结果多样化等后处理使用）
+
+        Returns:
+            (n, D) 矩阵，索引中不存在的id对应零向量
+        """
+        self.sync()
+        matrix = self._matrix
+        vectors = np.zeros((len(chunk_ids), matrix.shape[1]), dtype=np.float32)
+        if not len(chunk_ids) or not len(self._chunk_ids):
+            return vectors
+
+        if self._id_order_generation != self.generation:
+            live = self._live_mask()
+            rows = np.flatnonzero(live) if live is not None else np.arange(len(self._chunk_ids))
+            self._id_order = rows[np.argsort(self._chunk_ids[rows], kind="stable")]
+            self._sorted_ids = self._chunk_ids[self._id_order]
+            self._id_order_generation = self.generation
+        if not len(self._sorted_ids):
+            return vectors
+
+        keys = self._id_keys(chunk_ids)
+        positions = np.searchsorted(self._sorted_ids, keys).clip(max=len(self._sorted_ids) - 1)
+        found = self._sorted_ids[positions] == keys
+        vectors[found] = matrix[self._id_order[positions[found]]]
+        return vectors
+
+    def compile_filter(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        把元数据过滤条件编译为候选行的布尔位图
+
+        Args:
+            filters: {列名: 取值 或 取值列表}，多列之间为AND，列内多个取值为OR；
+                取值为 None 的列不参与过滤
+
+        Returns:
+            与矩阵行对应的布尔掩码，无过滤条件且所有行有效时返回 None
+        """
+        mask = self._live_mask()
+        if not filters:
+            return mask
+
+        metadata = self._metadata
+        for column, values in filters.items():
+            if values is None:
+                continue
+            if column not in metadata:
+                raise ValueError(f"不支持的过滤字段: {column}，可选: {list(METADATA_COLUMNS)}")
+            if not isinstance(values, (list, tuple, set)):
+                values = [values]
+
+            vocab = self._vocab[column]
+            wanted = [vocab[_metadata_value(v)] for v in values if _metadata_value(v) in vocab]
+            if len(wanted) == 1:
+                column_mask = metadata[column] == wanted[0]
+            else:
+                column_mask = np.isin(metadata[column], wanted)
+            mask = column_mask if mask is None else mask & column_mask
+
+        return mask
+
+    def matching_documents(self, filters: Optional[Dict[str, Any]]) -> Optional[Set[str]]:
+        """
+        满足元数据过滤条件的文档ID集合（供关键词检索等其他召回通道预过滤）
+
+        Returns:
+            文档ID集合，无过滤条件时返回 None
+        """
+        mask = self.compile_filter(filters)
+        if mask is None:
+            return None
+        document_values = self._vocab_values["document_id"]
+        codes = np.unique(self._metadata["document_id"][mask])
+        return {document_values[code] for code in codes}
+
+    def search(
+        self,
+        query_embedding: Sequence[float],
+        top_k: int = 5,
+        document_id: str = None,
+        min_similarity: float = 0.0,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        余弦相似度搜索
+
+        Args:
+            query_embedding: 查询向量
+            top_k: 返回结果数量
+            document_id: 文档ID过滤
+            min_similarity: 最小相似度阈值
+            filters: 元数据过滤条件，见 compile_filter()
+
+        Returns:
+            [(chunk_id, similarity)]，按相似度降序
+        """
+        matrix, chunk_ids = self._matrix, self._chunk_ids
+        if not len(chunk_ids) or top_k <= 0:
+            return []
+
+        query = prepare_query(query_embedding, matrix.shape[1])
+        if query is None:
+            return []
+
+        if document_id:
+            filters = {**(filters or {}), "document_id": document_id}
+        mask = self.compile_filter(filters)
+
+        if mask is not None:
+            rows = np.flatnonzero(mask)
+            if not len(rows):
+                return []
+            if len(rows) <= len(chunk_ids) * PREFILTER_GATHER_RATIO:
+                # 选择性高的过滤只对候选行打分，开销与候选数成正比
+                scores = matrix[rows] @ query
+                order = select_top_k(scores, top_k, min_similarity)
+                return [(chunk_ids[rows[i]], float(scores[i])) for i in order]
+
+        codes = self._codes
+
+        if codes is not None and len(codes) == len(chunk_ids):
+            # 先扫描量化编码得到短名单，再用float32向量精确重打分
+            approx = self.quantizer.score(codes, query)
+            shortlist = select_top_k(approx, top_k * self.rescore_factor, mask=mask)
+            scores = matrix[shortlist] @ query
+            order = select_top_k(scores, top_k, min_similarity)
+            rows = shortlist[order]
+            return [(chunk_ids[r], float(s)) for r, s in zip(rows, scores[order])]
+
+        # 单次矩阵-向量乘法得到所有余弦相似度
+        scores = matrix @ query
+        order = select_top_k(scores, top_k, min_similarity, mask)
+
+        return [(chunk_ids[i], float(scores[i])) for i in order]
+
+    def search_batch(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        top_k: int = 5,
+        document_id: str = None,
+        min_similarity: float = 0.0,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        批量余弦相似度搜索：所有查询与索引只做一次矩阵-矩阵乘法
+
+        批量查询直接用float32矩阵精确打分，不经过量化短名单
+
+        Args:
+            query_embeddings: 查询向量列表（元素为 None 表示该查询向量化失败）
+            top_k / document_id / min_similarity / filters: 同 search()
+
+        Returns:
+            与输入顺序一致的 [(chunk_id, similarity)] 列表，无效查询对应空列表
+        """
+        matrix, chunk_ids = self._matrix, self._chunk_ids
+        results: List[List[Tuple[str, float]]] = [[] for _ in query_embeddings]
+        if not len(chunk_ids) or top_k <= 0:
+            return results
+
+        prepared = [
+            prepare_query(embedding, matrix.shape[1]) if embedding is not None else None
+            for embedding in query_embeddings
+        ]
+        valid = [i for i, query in enumerate(prepared) if query is not None]
+        if not valid:
+            return results
+        queries = np.stack([prepared[i] for i in valid])
+
+        if document_id:
+            filters = {**(filters or {}), "document_id": document_id}
+        mask = self.compile_filter(filters)
+
+        rows = None
+        if mask is not None:
+            candidates = np.flatnonzero(mask)
+            if not len(candidates):
+                return results
+            if len(candidates) <= len(chunk_ids) * PREFILTER_GATHER_RATIO:
+                rows, mask = candidates, None
+
+        # (Q, N) 相似度矩阵，每行对应一个查询
+        scores = queries @ (matrix[rows] if rows is not None else matrix).T
+
+        for query_scores, i in zip(scores, valid):
+            order = select_top_k(query_scores, top_k, min_similarity, mask)
+            positions = rows[order] if rows is not None else order
+            results[i] = [
+                (chunk_ids[p], float(query_scores[o])) for p, o in zip(positions, order)
+            ]
+        return results
+
+    def quantization_stats(self, top_k: int = 10, queries: int = 20, evaluate_recall: bool = False) -> dict:
+        """
+        量化模式的每向量内存占用
+
+        evaluate_recall=True 时再用 queries 次精确全量扫描评估recall@k（CPU密集，调用方应放到线程池执行）
+        """
+        dimension = self.dimension or 0
+        stats = {
+            "mode": self.quantizer.name if self.quantizer else "none",
+            "bytes_per_vector_float32": 4 * dimension,
+            "float32_memory_mb": round(self._matrix.nbytes / 1024 / 1024, 2),
+        }
+        if self.quantizer is None or self._codes is None:
+            return stats
+
+        stats.update({
+            "bytes_per_vector_codes": self.quantizer.bytes_per_vector(),
+            "codes_memory_mb": round(self._codes.nbytes / 1024 / 1024, 2),
+            "rescore_factor": self.rescore_factor,
+        })
+        if not evaluate_recall:
+            return stats
+        stats.update(evaluate_quantizer(
+            self.quantizer,
+            self._matrix,
+            self._codes,
+            top_k=top_k,
+            rescore_factor=self.rescore_factor,
+            queries=queries
+        ))
+        return stats
@@ -0,0 +1,290 @@
+"""
+向量量化
+在常驻索引的float32向量旁维护紧凑编码，搜索先扫描编码得到候选短名单，
+再用精确的float32向量重新打分
+
+- float16: 每维2字节
+- int8: 逐维标量量化（按维度的最小值/步长），每维1字节
+- pq: 乘积量化，每个子空间256个中心，每个子空间1字节
+"""
+from typing import Dict, Optional
+
+import numpy as np
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+# 分块打分的行数，控制反量化时的临时内存
+SCORE_BLOCK_ROWS = 65536
+
+
+class Quantizer:
+    """量化器基类"""
+
+    name = "none"
+
+    def __init__(self):
+        self.dimension: Optional[int] = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.dimension is not None
+
+    def bytes_per_vector(self) -> int:
+        raise NotImplementedError
+
+    def train(self, matrix: np.ndarray) -> None:
+        self.dimension = matrix.shape[1]
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def score(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """用编码近似计算 codes 各行与 query 的内积"""
+        raise NotImplementedError
+
+
+class Float16Quantizer(Quantizer):
+    """半精度存储"""
+
+    name = "float16"
+
+    def bytes_per_vector(self) -> int:
+        return 2 * self.dimension
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        return np.ascontiguousarray(matrix, dtype=np.float16)
+
+    def score(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+            block = codes[start:start + SCORE_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ query
+        return scores
+
+
+class Int8ScalarQuantizer(Quantizer):
+    """
+    逐维int8标量量化: x ≈ low + step * (code + 128)
+
+    内积可直接在编码上计算:
+    q·x ≈ q·low + 128 * (q*step)·1 + (q*step)·code
+    """
+
+    name = "int8"
+
+    def __init__(self):
+        super().__init__()
+        self.low: Optional[np.ndarray] = None
+        self.step: Optional[np.ndarray] = None
+
+    def bytes_per_vector(self) -> int:
+        return self.dimension
+
+    def train(self, matrix: np.ndarray) -> None:
+        super().train(matrix)
+        low = matrix.min(axis=0)
+        high = matrix.max(axis=0)
+        step = (high - low) / 255.0
+        step[step == 0] = 1.0
+        self.low = low.astype(np.float32)
+        self.step = step.astype(np.float32)
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        codes = np.rint((matrix - self.low) / self.step) - 128
+        return np.clip(codes, -128, 127).astype(np.int8)
+
+    def score(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        scaled = (query * self.step).astype(np.float32)
+        offset = float(query @ self.low + 128.0 * scaled.sum())
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+            block = codes[start:start + SCORE_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ scaled
+        return scores + offset
+
+
+def _kmeans(x: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """欧氏距离k-means（用于PQ子空间码本训练）"""
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+
+    for _ in range(iterations):
+        # ||x-c||^2 = ||x||^2 - 2x·c + ||c||^2，||x||^2 与argmin无关
+        distances = (centroids ** 2).sum(axis=1) - 2.0 * (x @ centroids.T)
+        assign = np.argmin(distances, axis=1)
+        # 按列bincount累加，比 np.add.at 快一个数量级
+        sums = np.stack([
+            np.bincount(assign, weights=x[:, j], minlength=k) for j in range(x.shape[1])
+        ], axis=1)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        counts[empty] = 1
+        centroids = sums / counts[:, None]
+        if np.any(empty):
+            centroids[empty] = x[rng.choice(len(x), int(empty.sum()), replace=False)]
+
+    return centroids.astype(np.float32)
+
+
+class ProductQuantizer(Quantizer):
+    """
+    乘积量化: 向量切分为 m 个子空间，每个子空间用256个中心的码本编码
+
+    打分使用非对称距离计算（ADC）：先算查询与各码本中心的内积查找表，
+    再按编码查表求和
+    """
+
+    name = "pq"
+
+    # 每个码本中心约39个训练样本即可收敛
+    TRAIN_SAMPLE = 256 * 39
+
+    def __init__(self, subspaces: int = 0):
+        super().__init__()
+        self.subspaces = subspaces
+        self.codebooks: Optional[np.ndarray] = None  # (m, ksub, dsub)
+
+    def bytes_per_vector(self) -> int:
+        return self.subspaces
+
+    def train(self, matrix: np.ndarray) -> None:
+        super().train(matrix)
+        dimension = matrix.shape[1]
+        if not self.subspaces:
+            self.subspaces = max(1, dimension // 8)
+        while dimension % self.subspaces:
+            self.subspaces -= 1
+
+        rng = np.random.default_rng(0)
+        if len(matrix) > self.TRAIN_SAMPLE:
+            matrix = matrix[np.sort(rng.choice(len(matrix), self.TRAIN_SAMPLE, replace=False))]
+
+        ksub = min(256, len(matrix))
+        dsub = dimension // self.subspaces
+        self.codebooks = np.stack([
+            _kmeans(np.ascontiguousarray(matrix[:, i * dsub:(i + 1) * dsub]), ksub)
+            for i in range(self.subspaces)
+        ])
+
+    def encode(self, matrix: np.ndarray) -> np.ndarray:
+        dsub = self.dimension // self.subspaces
+        codes = np.empty((len(matrix), self.subspaces), dtype=np.uint8)
+        for i, codebook in enumerate(self.codebooks):
+            sub = matrix[:, i * dsub:(i + 1) * dsub]
+            distances = (codebook ** 2).sum(axis=1) - 2.0 * (sub @ codebook.T)
+            codes[:, i] = np.argmin(distances, axis=1)
+        return codes
+
+    def score(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        dsub = self.dimension // self.subspaces
+        # (m, ksub) 查询与各子空间中心的内积
+        lut = np.einsum(
+            "mkd,md->mk",
+            self.codebooks,
+            query.reshape(self.subspaces, dsub)
+        ).astype(np.float32)
+        scores = np.zeros(len(codes), dtype=np.float32)
+        for i in range(self.subspaces):
+            scores += lut[i][codes[:, i]]
+        return scores
+
+
+QUANTIZERS = {
+    Float16Quantizer.name: Float16Quantizer,
+    Int8ScalarQuantizer.name: Int8ScalarQuantizer,
+    ProductQuantizer.name: ProductQuantizer,
+}
+
+
+def create_quantizer(mode: Optional[str]) -> Optional[Quantizer]:
+    """按名称创建量化器，none/空表示不量化"""
+    if not mode or mode == Quantizer.name:
+        return None
+    if mode not in QUANTIZERS:
+        raise ValueError(f"未知的量化模式: {mode}，可选: {list(QUANTIZERS)}")
+    return QUANTIZERS[mode]()
+
+
+def evaluate_quantizer(
+    quantizer: Quantizer,
+    matrix: np.ndarray,
+    codes: np.ndarray,
+    top_k: int = 10,
+    rescore_factor: int = 4,
+    queries: int = 20,
+    seed: int = 0
+) -> Dict[str, float]:
+    """
+    评估量化召回率：以索引中的随机向量为查询，对比精确top-k
+
+    Args:
+        matrix: 归一化的float32矩阵
+        codes: quantizer 对 matrix 的编码
+        rescore_factor: 短名单大小 = top_k * rescore_factor
+
+    Returns:
+        recall@k（仅编码打分 / 编码+精确重打分）
+    """
+    n = len(matrix)
+    if n == 0:
+        return {"recall_at_k": 0.0, "recall_at_k_codes_only": 0.0, "k": top_k, "queries": 0}
+
+    k = min(top_k, n)
+    shortlist_size = min(n, k * rescore_factor)
+    rng = np.random.default_rng(seed)
+    query_rows = rng.choice(n, min(queries, n), replace=False)
+
+    codes_only = 0.0
+    rescored = 0.0
+    for row in query_rows:
+        query = matrix[row]
+        exact = set(np.argpartition(matrix @ query, n - k)[n - k:].tolist())
+
+        approx = quantizer.score(codes, query)
+        shortlist = np.argpartition(approx, n - shortlist_size)[n - shortlist_size:]
+        codes_top = shortlist[np.argsort(-approx[shortlist])[:k]]
+        rescore_top = shortlist[np.argsort(-(matrix[shortlist] @ query))[:k]]
+
+        codes_only += len(exact.intersection(codes_top.tolist())) / k
+        rescored += len(exact.intersection(rescore_top.tolist())) / k
+
+    return {
+        "recall_at_k": round(rescored / len(query_rows), 4),
+        "recall_at_k_codes_only": round(codes_only / len(query_rows), 4),
+        "k": k,
+        "queries": int(len(query_rows))
+    }
+
+
+def compare_quantization_modes(
+    matrix: np.ndarray,
+    sample_size: int = 20000,
+    top_k: int = 10,
+    rescore_factor: int = 4,
+    queries: int = 20
+) -> Dict[str, Dict[str, float]]:
+    """
+    在采样子集上训练并评估所有量化模式，用于按部署选择模式
+
+    Returns:
+        {mode: {bytes_per_vector_codes, recall_at_k, ...}}
+    """
+    if not len(matrix):
+        return {}
+
+    rng = np.random.default_rng(0)
+    if len(matrix) > sample_size:
+        matrix = matrix[np.sort(rng.choice(len(matrix), sample_size, replace=False))]
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+
+    results = {}
+    for mode, quantizer_cls in QUANTIZERS.items():
+        quantizer = quantizer_cls()
+        quantizer.train(matrix)
+        codes = quantizer.encode(matrix)
+        results[mode] = {
+            "bytes_per_vector_codes": quantizer.bytes_per_vector(),
+            **evaluate_quantizer(quantizer, matrix, codes, top_k, rescore_factor, queries)
+        }
+    return results
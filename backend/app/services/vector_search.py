@@ -2,14 +2,25 @@
 简化向量搜索服务 - 基于SQLite + Numpy
 用于替代ChromaDB（Python 3.13兼容性问题）
 """
-from typing import List, Dict, Tuple
+import os
+import time
+from typing import Any, AsyncIterator, List, Dict, Tuple, Optional
 import numpy as np
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 import structlog
 
-from app.models.database import DocumentChunk
+from app.core.config import get_settings
+from app.models.database import Document, DocumentChunk
+from app.services.ann_index import AnnIndex, ann_index_lock, create_ann_index, get_vector_index_dir
+from app.services.bm25_index import BM25Index, reciprocal_rank_fusion
+from app.services.centroid_index import DocumentCentroidIndex
+from app.services.diversification import min_max_normalize, mmr_select
 from app.services.embedding_service import get_embedding_service
+from app.services.rerank_service import get_rerank_service
+from app.services.search_cache import SemanticResultCache
+from app.services.vector_index import VectorIndex, prepare_query
+from app.services.vector_quantization import create_quantizer
 
 logger = structlog.get_logger()
 
@@ -17,6 +28,239 @@ logger = structlog.get_logger()
 class SimpleVectorSearch:
     """简化的向量搜索服务"""
     
+    # 精确暴力搜索使用的索引名
+    FLAT_INDEX = "flat"
+    
+    # 检索模式: 纯向量 / 文档质心+chunk两阶段向量检索 / 向量+BM25融合 / 纯BM25
+    SEARCH_MODES = ("vector", "two_stage", "hybrid", "keyword")
+    
+    # 由 _vector_hits 处理的向量检索模式
+    VECTOR_MODES = ("vector", "two_stage")
+    
+    def __init__(self):
+        settings = get_settings()
+        # 常驻内存的向量索引，启动时构建，写入/删除时同步；多worker时使用共享的内存映射存储
+        self.index = self._create_index(settings)
+        # 可选的ANN索引（ivf/hnsw），以 self.index 为准同步
+        self.ann_indexes: Dict[str, AnnIndex] = {}
+        # 文档质心，启动时由常驻索引构建，文档向量化/删除时同步
+        self.centroids = DocumentCentroidIndex()
+        # BM25关键词索引，chunk写入/删除时增量同步
+        self.keyword_index = BM25Index(k1=settings.BM25_K1, b=settings.BM25_B)
+        # 语义结果缓存，随常驻索引 generation 失效
+        self.result_cache = SemanticResultCache(
+            max_entries=settings.SEARCH_RESULT_CACHE_SIZE,
+            max_distance=settings.SEARCH_RESULT_CACHE_MAX_DISTANCE
+        ) if settings.SEARCH_RESULT_CACHE_SIZE > 0 else None
+        # 共享存储时向其他worker通知文档变更，使其同步各自的BM25/ANN/质心
+        self.document_log = None
+        if hasattr(self.index, "document_rows"):
+            from app.services.shared_vector_store import SharedDocumentLog
+            
+            self.document_log = SharedDocumentLog(self.index.directory)
+            self.document_log.mark()
+    
+    @staticmethod
+    def _create_index(settings) -> VectorIndex:
+        """按配置创建进程内索引或多worker共享的内存映射索引"""
+        shared = settings.VECTOR_SHARED_STORE
+        if shared is None:
+            shared = not settings.DEBUG and settings.WORKERS > 1
+        if shared:
+            if os.name == "posix":
+                from app.services.shared_vector_store import SharedVectorIndex
+                
+                if settings.VECTOR_QUANTIZATION != "none":
+                    logger.warning("共享向量存储不支持量化，已忽略", quantization=settings.VECTOR_QUANTIZATION)
+                return SharedVectorIndex(get_vector_index_dir() / "shared")
+            logger.warning("当前平台不支持共享向量存储，使用进程内索引")
+        return VectorIndex(
+            quantizer=create_quantizer(settings.VECTOR_QUANTIZATION),
+            rescore_factor=settings.VECTOR_RESCORE_FACTOR,
+            min_train_size=settings.VECTOR_QUANTIZATION_MIN_TRAIN,
+            retrain_growth=settings.VECTOR_QUANTIZATION_RETRAIN_GROWTH
+        )
+    
+    def available_indexes(self) -> List[str]:
+        """当前可用于搜索的索引名"""
+        return [self.FLAT_INDEX] + [
+            name for name, ann in self.ann_indexes.items() if ann.is_built
+        ]
+    
+    def build_ann_indexes(self, names: List[str]) -> None:
+        """
+        加载或构建ANN索引
+        
+        优先从磁盘加载（IVF以mmap方式），再与常驻索引对账；
+        磁盘上没有可用索引时从常驻索引全量构建并持久化。
+        多worker共用持久化目录，按索引持锁，先启动的worker构建后其余worker直接加载
+        """
+        directory = get_vector_index_dir()
+        chunk_ids, document_ids, matrix = self.index.snapshot()
+        
+        for name in names:
+            try:
+                ann = create_ann_index(name)
+                with ann_index_lock(directory, name):
+                    if ann.load(directory):
+                        changes = ann.reconcile(chunk_ids, document_ids, matrix)
+                        logger.info("ANN索引对账完成", index=name, **changes)
+                    elif len(chunk_ids):
+                        ann.build(chunk_ids, document_ids, matrix)
+                        ann.save(directory)
+                self.ann_indexes[name] = ann
+            except Exception as e:
+                logger.error("ANN索引初始化失败", index=name, error=str(e))
+    
+    def save_ann_indexes(self) -> None:
+        """持久化所有ANN索引（持锁整体写入，多worker依次覆盖，目录中始终是某一个worker的完整副本）"""
+        directory = get_vector_index_dir()
+        for name, ann in self.ann_indexes.items():
+            try:
+                with ann_index_lock(directory, name):
+                    ann.save(directory)
+            except Exception as e:
+                logger.error("ANN索引保存失败", index=name, error=str(e))
+    
+    def build_centroids(self) -> None:
+        """由常驻索引全量构建文档质心"""
+        _, document_ids, matrix = self.index.snapshot()
+        self.centroids.build(document_ids, matrix)
+    
+    def _set_document_vectors(
+        self,
+        document_id: str,
+        chunk_ids: List[str],
+        document_ids: List[str],
+        matrix: Optional[np.ndarray]
+    ) -> None:
+        """用文档的最新向量同步质心和ANN索引（matrix 为 None 表示文档已没有向量）"""
+        if self.centroids.is_built:
+            self.centroids.set_document(document_id, matrix)
+        for ann in self.ann_indexes.values():
+            ann.remove_document(document_id)
+            if matrix is not None:
+                ann.add(chunk_ids, document_ids, matrix)
+    
+    def _notify(self, op: str, document_id: str) -> None:
+        if self.document_log is not None:
+            try:
+                self.document_log.append(op, document_id)
+            except OSError as e:
+                logger.error("写入共享文档变更日志失败", error=str(e), document_id=document_id)
+    
+    async def refresh_document(self, db: AsyncSession, document_id: str) -> None:
+        """文档向量写入后同步所有索引"""
+        chunk_ids, document_ids, matrix = await self.index.refresh_document(db, document_id)
+        self._set_document_vectors(document_id, chunk_ids, document_ids, matrix)
+        self._notify("vectors", document_id)
+    
+    def remove_document(self, document_id: str) -> None:
+        """文档删除或重新分块后从所有索引移除"""
+        self.index.remove_document(document_id)
+        for ann in self.ann_indexes.values():
+            ann.remove_document(document_id)
+        self.centroids.remove_document(document_id)
+        self.keyword_index.remove_document(document_id)
+        self._notify("remove", document_id)
+    
+    async def sync_shared(self, db: AsyncSession) -> None:
+        """
+        回放其他worker的文档变更（仅共享存储）
+        
+        向量派生结构（质心、ANN）按共享矩阵中该文档的当前行刷新，
+        BM25按数据库中该文档的当前chunks重建；同一文档多条记录只刷新一次
+        """
+        if self.document_log is None:
+            return
+        records = self.document_log.read_new()
+        if not records:
+            return
+        
+        changed = list(dict.fromkeys(record["document_id"] for record in records))
+        for document_id in changed:
+            self._set_document_vectors(document_id, *self.index.document_rows(document_id))
+        
+        keyword_documents = list(dict.fromkeys(
+            record["document_id"] for record in records if record["op"] in ("chunks", "remove")
+        ))
+        if keyword_documents and self.keyword_index.is_loaded:
+            rows = (await db.execute(
+                select(DocumentChunk.document_id, DocumentChunk.id, DocumentChunk.content).join(
+                    Document, Document.id == DocumentChunk.document_id
+                ).filter(
+                    DocumentChunk.document_id.in_(keyword_documents)
+                )
+            )).all()
+            chunks_by_document: Dict[str, List[Tuple[str, str]]] = {}
+            for row in rows:
+                chunks_by_document.setdefault(row.document_id, []).append((row.id, row.content))
+            for document_id in keyword_documents:
+                self.keyword_index.remove_document(document_id)
+                if chunks_by_document.get(document_id):
+                    self.keyword_index.add_chunks(document_id, chunks_by_document[document_id])
+        
+        logger.info("已同步其他worker的文档变更", documents=len(changed), keyword_documents=len(keyword_documents))
+    
+    def index_chunks(self, document_id: str, chunks: List[Tuple[str, str]]) -> None:
+        """
+        chunks写入后同步关键词索引（向量索引在向量化后由 refresh_document 同步）
+        
+        Args:
+            document_id: 文档ID
+            chunks: [(chunk_id, content)]
+        """
+        self.keyword_index.remove_document(document_id)
+        self.keyword_index.add_chunks(document_id, chunks)
+        self._notify("chunks", document_id)
+    
+    @staticmethod
+    def _build_filters(
+        document_type: Optional[str],
+        filters: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """合并 document_type 与元数据过滤条件，去掉未设置的字段"""
+        filters = {
+            key: value for key, value in (filters or {}).items() if value is not None
+        }
+        if document_type:
+            filters["dev_type"] = document_type
+        return filters
+    
+    @staticmethod
+    def _filters_key(filters: Dict[str, Any]) -> Tuple:
+        """过滤条件转换为可哈希的缓存键（列表取值排序后转为元组）"""
+        return tuple(sorted(
+            (key, tuple(sorted(value)) if isinstance(value, (list, tuple, set)) else value)
+            for key, value in filters.items()
+        ))
+    
+    @staticmethod
+    async def _load_chunks(db: AsyncSession, chunk_ids: List[str]) -> Dict[str, Any]:
+        """
+        一次查询加载命中的chunks及其文档标题
+        
+        只查询结果组装需要的列（不加载向量列），关联Document取标题；
+        返回的行可按属性访问 id / document_id / chunk_index / content / document_title
+        （文档已删除时 document_title 为 None）
+        """
+        if not chunk_ids:
+            return {}
+        result = await db.execute(
+            select(
+                DocumentChunk.id,
+                DocumentChunk.document_id,
+                DocumentChunk.chunk_index,
+                DocumentChunk.content,
+                Document.title.label("document_title")
+            ).outerjoin(
+                Document, Document.id == DocumentChunk.document_id
+            ).filter(
+                DocumentChunk.id.in_(chunk_ids)
+            )
+        )
+        return {row.id: row for row in result.all()}
+    
     @staticmethod
     def calculate_cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
         """
@@ -55,7 +299,13 @@ class SimpleVectorSearch:
         top_k: int = 5,
         document_type: str = None,
         document_id: str = None,
-        min_similarity: float = 0.0
+        min_similarity: float = 0.0,
+        index: Optional[str] = None,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        centroid_documents: Optional[int] = None,
+        timings: Optional[Dict[str, Any]] = None
     ) -> List[Dict]:
         """
         向量相似度搜索
@@ -64,60 +314,57 @@ class SimpleVectorSearch:
             db: 数据库会话
             query_embedding: 查询向量
             top_k: 返回结果数量
-            document_type: 文档类型过滤
+            document_type: 文档类型过滤（dev_type分类）
             document_id: 文档ID过滤
             min_similarity: 最小相似度阈值
+            index: 使用的索引（flat/ivf/hnsw），默认取配置；ANN不可用时回退flat
+            nprobe: IVF扫描簇数量
+            ef_search: HNSW搜索候选队列长度
+            filters: 元数据过滤 {team_id/project_id/access_level/...: 取值或列表}
+            centroid_documents: 设置时使用两阶段检索，先按文档质心选出该数量的文档，
+                再只对这些文档的chunks精确打分
+            timings: 传入字典时写入实际使用的索引 index（ANN不可用或带过滤时为 flat）
         
         Returns:
             搜索结果列表
         """
         try:
-            # 1. 构建查询条件
-            stmt = select(DocumentChunk).filter(
-                DocumentChunk.embedding.isnot(None)
-            )
-            
-            if document_id:
-                stmt = stmt.filter(DocumentChunk.document_id == document_id)
+            # 1. 确保常驻索引已构建，单次矩阵-向量乘法完成打分
+            await self.index.ensure_loaded(db)
+            await self.sync_shared(db)
             
-            # 执行查询
-            result = await db.execute(stmt)
-            chunks = result.scalars().all()
+            hits = self._vector_hits(
+                query_embedding,
+                top_k=top_k,
+                document_id=document_id,
+                min_similarity=min_similarity,
+                index=index,
+                nprobe=nprobe,
+                ef_search=ef_search,
+                filters=self._build_filters(document_type, filters),
+                centroid_documents=centroid_documents,
+                timings=timings
+            )
             
-            if not chunks:
-                logger.info("没有找到已向量化的chunks")
+            if not hits:
+                logger.info("没有找到匹配的chunks", indexed=self.index.size)
                 return []
             
-            logger.info(f"找到 {len(chunks)} 个已向量化的chunks，开始计算相似度")
+            # 2. 只加载命中的chunks
+            chunks_by_id = await self._load_chunks(db, [chunk_id for chunk_id, _ in hits])
             
-            # 2. 计算相似度
-            embedding_service = get_embedding_service()
-            similarities = []
-            
-            for chunk in chunks:
-                # 反序列化embedding
-                chunk_embedding = embedding_service.deserialize_embedding(chunk.embedding)
-                
-                # 计算相似度
-                similarity = self.calculate_cosine_similarity(query_embedding, chunk_embedding)
-                
-                # 过滤低相似度结果
-                if similarity >= min_similarity:
-                    similarities.append({
-                        'chunk': chunk,
-                        'similarity': similarity
-                    })
-            
-            # 3. 按相似度排序
-            similarities.sort(key=lambda x: x['similarity'], reverse=True)
-            
-            # 4. 取top_k
-            top_results = similarities[:top_k]
+            top_results = [
+                {
+                    'chunk': chunks_by_id[chunk_id],
+                    'similarity': similarity
+                }
+                for chunk_id, similarity in hits
+                if chunk_id in chunks_by_id
+            ]
             
             logger.info(
                 f"搜索完成",
-                total=len(chunks),
-                matched=len(similarities),
+                total=self.index.size,
                 returned=len(top_results),
                 top_similarity=top_results[0]['similarity'] if top_results else 0
             )
@@ -128,6 +375,229 @@ class SimpleVectorSearch:
             logger.error(f"搜索失败", error=str(e))
             return []
     
+    def _vector_hits(
+        self,
+        query_embedding: List[float],
+        top_k: int,
+        document_id: Optional[str],
+        min_similarity: float,
+        index: Optional[str],
+        nprobe: Optional[int],
+        ef_search: Optional[int],
+        filters: Dict[str, Any],
+        centroid_documents: Optional[int] = None,
+        timings: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        在选定索引上检索，返回 [(chunk_id, similarity)]
+        
+        先查语义结果缓存：与近期查询向量足够接近且参数一致时直接返回缓存结果；
+        设置 centroid_documents 时先按文档质心选出候选文档，再用位图预过滤只对其chunks打分
+        """
+        index_name = index or get_settings().VECTOR_DEFAULT_INDEX
+        ann = self.ann_indexes.get(index_name)
+        
+        # 指定文档时两阶段检索没有意义
+        two_stage = centroid_documents is not None and not document_id
+        
+        # 带过滤时ANN只能在探测到的簇/邻居中过滤，召回不足；
+        # 常驻索引用位图预过滤，只对候选行打分，使用精确搜索
+        use_ann = ann is not None and ann.is_built and not document_id and not filters and not two_stage
+        if timings is not None:
+            timings["index"] = index_name if use_ann else self.FLAT_INDEX
+        
+        # 先追上其他worker的写入，保证缓存按最新的 generation 判断失效
+        self.index.sync()
+        query = prepare_query(query_embedding, self.index.dimension)
+        if query is None:
+            return []
+        
+        cache_key = None
+        generation = self.index.generation
+        if self.result_cache is not None:
+            if use_ann:
+                index_key = (index_name, nprobe, ef_search)
+            elif two_stage:
+                index_key = ("two_stage", centroid_documents)
+            else:
+                index_key = (self.FLAT_INDEX,)
+            cache_key = (
+                index_key,
+                document_id,
+                min_similarity,
+                self._filters_key(filters)
+            )
+            cached = self.result_cache.lookup(query, cache_key, top_k, generation)
+            if cached is not None:
+                return cached
+        
+        if use_ann:
+            hits = ann.search(
+                query,
+                top_k=top_k,
+                document_id=document_id,
+                min_similarity=min_similarity,
+                nprobe=nprobe,
+                ef_search=ef_search
+            )
+        elif two_stage:
+            if not self.centroids.is_built:
+                self.build_centroids()
+            documents = self.centroids.search(
+                query,
+                centroid_documents,
+                allowed_documents=self.index.matching_documents(filters)
+            )
+            hits = self.index.search(
+                query,
+                top_k=top_k,
+                min_similarity=min_similarity,
+                filters={**filters, "document_id": [document for document, _ in documents]}
+            ) if documents else []
+        else:
+            hits = self.index.search(
+                query,
+                top_k=top_k,
+                document_id=document_id,
+                min_similarity=min_similarity,
+                filters=filters
+            )
+        
+        if cache_key is not None:
+            self.result_cache.store(query, cache_key, top_k, generation, hits)
+        return hits
+    
+    async def similar_documents(
+        self,
+        db: AsyncSession,
+        document_id: str,
+        top_k: int = 5,
+        document_type: str = None,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> Optional[List[Tuple[str, float]]]:
+        """
+        相似文档推荐：以文档质心为查询在所有质心上检索
+        
+        Returns:
+            [(document_id, similarity)]（不含自身），文档尚未向量化时返回 None
+        """
+        await self.index.ensure_loaded(db)
+        await self.sync_shared(db)
+        if not self.centroids.is_built:
+            self.build_centroids()
+        
+        centroid = self.centroids.get(document_id)
+        if centroid is None:
+            return None
+        
+        filters = self._build_filters(document_type, filters)
+        return self.centroids.search(
+            centroid,
+            top_k,
+            allowed_documents=self.index.matching_documents(filters),
+            exclude=document_id
+        )
+    
+    async def hybrid_search(
+        self,
+        db: AsyncSession,
+        query_text: str,
+        top_k: int = 5,
+        mode: str = "hybrid",
+        document_type: str = None,
+        document_id: str = None,
+        min_similarity: float = 0.0,
+        index: Optional[str] = None,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        timings: Optional[Dict[str, Any]] = None
+    ) -> List[Dict]:
+        """
+        关键词（BM25）与向量混合检索
+        
+        两路各取 SEARCH_HYBRID_CANDIDATES 个候选，按倒数排名融合（RRF）后取top_k；
+        keyword 模式只使用BM25。元数据过滤通过常驻向量索引得到允许的文档集合，
+        因此带过滤时只能检索到已向量化的文档
+        
+        Args:
+            mode: hybrid / keyword
+            其余参数同 search_by_text()
+        
+        Returns:
+            搜索结果列表，每项包含 chunk、similarity（向量未命中时为 None）、
+            bm25_score（关键词未命中时为 None）和融合分数 score
+        """
+        try:
+            settings = get_settings()
+            candidates = max(top_k, settings.SEARCH_HYBRID_CANDIDATES)
+            
+            await self.index.ensure_loaded(db)
+            await self.keyword_index.ensure_loaded(db)
+            await self.sync_shared(db)
+            
+            filters = self._build_filters(document_type, filters)
+            allowed_documents = self.index.matching_documents(
+                {**filters, "document_id": document_id} if document_id else filters
+            )
+            keyword_hits = self.keyword_index.search(query_text, candidates, allowed_documents)
+            
+            vector_hits: List[Tuple[str, float]] = []
+            if mode == "hybrid":
+                query_embedding = await get_embedding_service().embed_text(query_text)
+                if query_embedding:
+                    vector_hits = self._vector_hits(
+                        query_embedding,
+                        top_k=candidates,
+                        document_id=document_id,
+                        min_similarity=min_similarity,
+                        index=index,
+                        nprobe=nprobe,
+                        ef_search=ef_search,
+                        filters=filters,
+                        timings=timings
+                    )
+                else:
+                    logger.error("查询文本向量化失败，仅使用关键词检索")
+                fused = reciprocal_rank_fusion(
+                    [[chunk_id for chunk_id, _ in vector_hits], [chunk_id for chunk_id, _ in keyword_hits]],
+                    k=settings.SEARCH_RRF_K
+                )[:top_k]
+            else:
+                fused = keyword_hits[:top_k]
+            
+            if not fused:
+                return []
+            
+            similarities = dict(vector_hits)
+            bm25_scores = dict(keyword_hits)
+            chunks_by_id = await self._load_chunks(db, [chunk_id for chunk_id, _ in fused])
+            
+            top_results = [
+                {
+                    'chunk': chunks_by_id[chunk_id],
+                    'similarity': similarities.get(chunk_id),
+                    'bm25_score': bm25_scores.get(chunk_id),
+                    'score': score
+                }
+                for chunk_id, score in fused
+                if chunk_id in chunks_by_id
+            ]
+            
+            logger.info(
+                "混合搜索完成",
+                mode=mode,
+                vector_hits=len(vector_hits),
+                keyword_hits=len(keyword_hits),
+                returned=len(top_results)
+            )
+            
+            return top_results
+            
+        except Exception as e:
+            logger.error("混合搜索失败", error=str(e), query=query_text)
+            return []
+    
     async def search_by_text(
         self,
         db: AsyncSession,
@@ -135,10 +605,21 @@ class SimpleVectorSearch:
         top_k: int = 5,
         document_type: str = None,
         document_id: str = None,
-        min_similarity: float = 0.0
+        min_similarity: float = 0.0,
+        index: Optional[str] = None,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        mode: str = "vector",
+        rerank: Optional[bool] = None,
+        budget_ms: Optional[float] = None,
+        timings: Optional[Dict[str, Any]] = None,
+        mmr_lambda: Optional[float] = None,
+        max_per_document: Optional[int] = None,
+        centroid_documents: Optional[int] = None
     ) -> List[Dict]:
         """
-        文本语义搜索（自动向量化查询文本）
+        文本语义搜索（自动向量化查询文本），返回最后一个阶段的结果，各阶段见 search_stages()
         
         Args:
             db: 数据库会话
@@ -147,10 +628,209 @@ class SimpleVectorSearch:
             document_type: 文档类型过滤
             document_id: 文档ID过滤
             min_similarity: 最小相似度阈值
+            index / nprobe / ef_search: 索引选择及ANN参数，见 search()
+            filters: 元数据过滤，见 search()
+            mode: vector / two_stage / hybrid / keyword，后两者见 hybrid_search()
+            rerank: 是否对前 RERANK_CANDIDATES 个候选做cross-encoder重排序，默认取配置
+            budget_ms: 请求延迟预算（毫秒），默认取 RERANK_BUDGET_MS；
+                第一阶段耗时后剩余预算不足时返回第一阶段顺序
+            timings: 传入字典时写入各阶段耗时、重排序统计及实际使用的向量索引 index（keyword 模式不写入）
+            mmr_lambda: 设置时从 SEARCH_DIVERSIFY_CANDIDATES 个候选中做MMR多样化，
+                1.0 表示只按相关度，越小越偏向多样性
+            max_per_document: 每个文档最多返回的chunk数
+            centroid_documents: two_stage 模式第一阶段选取的文档数，默认取 SEARCH_CENTROID_DOCUMENTS
         
         Returns:
             搜索结果列表
         """
+        results: List[Dict] = []
+        async for _, results in self.search_stages(
+            db=db,
+            query_text=query_text,
+            top_k=top_k,
+            document_type=document_type,
+            document_id=document_id,
+            min_similarity=min_similarity,
+            index=index,
+            nprobe=nprobe,
+            ef_search=ef_search,
+            filters=filters,
+            mode=mode,
+            rerank=rerank,
+            budget_ms=budget_ms,
+            timings=timings,
+            mmr_lambda=mmr_lambda,
+            max_per_document=max_per_document,
+            centroid_documents=centroid_documents
+        ):
+            pass
+        return results
+    
+    async def search_stages(
+        self,
+        db: AsyncSession,
+        query_text: str,
+        top_k: int = 5,
+        document_type: str = None,
+        document_id: str = None,
+        min_similarity: float = 0.0,
+        index: Optional[str] = None,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        mode: str = "vector",
+        rerank: Optional[bool] = None,
+        budget_ms: Optional[float] = None,
+        timings: Optional[Dict[str, Any]] = None,
+        mmr_lambda: Optional[float] = None,
+        max_per_document: Optional[int] = None,
+        centroid_documents: Optional[int] = None
+    ) -> AsyncIterator[Tuple[str, List[Dict]]]:
+        """
+        分阶段的文本搜索，每完成一个阶段产出一次当前结果（供流式接口尽早返回）
+        
+        阶段依次为:
+        - first_stage: 第一阶段检索（向量/两阶段/混合/关键词）的前 top_k 个结果
+        - rerank: cross-encoder重排序后的结果（启用重排序时）
+        - diversify: MMR多样化/每文档上限后的结果（设置 mmr_lambda 或 max_per_document 时）
+        
+        参数同 search_by_text()；timings 在每个阶段结束后更新
+        
+        Yields:
+            (阶段名, 结果列表)
+        """
+        settings = get_settings()
+        use_rerank = settings.RERANK_ENABLED if rerank is None else rerank
+        diversify = mmr_lambda is not None or max_per_document is not None
+        pool_k = max(top_k, settings.SEARCH_DIVERSIFY_CANDIDATES) if diversify else top_k
+        first_stage_k = max(pool_k, settings.RERANK_CANDIDATES) if use_rerank else pool_k
+        
+        if timings is None:
+            timings = {}
+        
+        start = time.perf_counter()
+        results = await self._retrieve_by_text(
+            db=db,
+            query_text=query_text,
+            top_k=first_stage_k,
+            document_type=document_type,
+            document_id=document_id,
+            min_similarity=min_similarity,
+            index=index,
+            nprobe=nprobe,
+            ef_search=ef_search,
+            filters=filters,
+            mode=mode,
+            centroid_documents=centroid_documents,
+            timings=timings
+        )
+        retrieval_ms = (time.perf_counter() - start) * 1000
+        
+        timings["retrieval_ms"] = round(retrieval_ms, 2)
+        timings["rerank"] = None
+        timings["total_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        yield "first_stage", results[:top_k]
+        
+        if use_rerank:
+            budget = settings.RERANK_BUDGET_MS if budget_ms is None else budget_ms
+            results, timings["rerank"] = await get_rerank_service().rerank(
+                query_text,
+                results,
+                top_k=pool_k,
+                budget_ms=budget - retrieval_ms
+            )
+            timings["total_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            yield "rerank", results[:top_k]
+        
+        if diversify:
+            diversify_start = time.perf_counter()
+            results = self.diversify(
+                results,
+                top_k=top_k,
+                mmr_lambda=1.0 if mmr_lambda is None else mmr_lambda,
+                max_per_document=max_per_document
+            )
+            timings["diversify_ms"] = round((time.perf_counter() - diversify_start) * 1000, 3)
+            timings["total_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            yield "diversify", results
+    
+    def diversify(
+        self,
+        results: List[Dict],
+        top_k: int,
+        mmr_lambda: float = 0.5,
+        max_per_document: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        在候选池上做MMR多样化及每文档数量限制
+        
+        候选向量取自常驻索引（不在索引中的chunk不参与冗余惩罚）；相关度依次取
+        重排序分数、融合分数或向量相似度，前两者缩放到 [0, 1] 后与余弦相似度混合
+        
+        Args:
+            results: 第一阶段（或重排序后）的结果，按相关度降序
+            top_k: 返回结果数量
+            mmr_lambda: 相关度权重
+            max_per_document: 每个文档最多返回的chunk数
+        
+        Returns:
+            多样化后的结果列表
+        """
+        if not results:
+            return results
+        
+        if all('rerank_score' in item for item in results):
+            relevance = min_max_normalize([item['rerank_score'] for item in results])
+        elif all(item.get('score') is not None for item in results):
+            relevance = min_max_normalize([item['score'] for item in results])
+        else:
+            relevance = np.array([item.get('similarity') or 0.0 for item in results], dtype=np.float32)
+        
+        vectors = self.index.get_vectors([item['chunk'].id for item in results])
+        _, groups = np.unique([item['chunk'].document_id for item in results], return_inverse=True)
+        order = mmr_select(
+            vectors,
+            relevance,
+            top_k=top_k,
+            lambda_mult=mmr_lambda,
+            groups=groups.reshape(-1),
+            max_per_group=max_per_document
+        )
+        return [results[i] for i in order]
+    
+    async def _retrieve_by_text(
+        self,
+        db: AsyncSession,
+        query_text: str,
+        top_k: int,
+        document_type: Optional[str],
+        document_id: Optional[str],
+        min_similarity: float,
+        index: Optional[str],
+        nprobe: Optional[int],
+        ef_search: Optional[int],
+        filters: Optional[Dict[str, Any]],
+        mode: str,
+        centroid_documents: Optional[int] = None,
+        timings: Optional[Dict[str, Any]] = None
+    ) -> List[Dict]:
+        """第一阶段检索（按模式选择向量/两阶段/混合/关键词）"""
+        if mode not in self.VECTOR_MODES:
+            return await self.hybrid_search(
+                db=db,
+                query_text=query_text,
+                top_k=top_k,
+                mode=mode,
+                document_type=document_type,
+                document_id=document_id,
+                min_similarity=min_similarity,
+                index=index,
+                nprobe=nprobe,
+                ef_search=ef_search,
+                filters=filters,
+                timings=timings
+            )
+        
         try:
             # 1. 向量化查询文本
             embedding_service = get_embedding_service()
@@ -167,12 +847,80 @@ class SimpleVectorSearch:
                 top_k=top_k,
                 document_type=document_type,
                 document_id=document_id,
-                min_similarity=min_similarity
+                min_similarity=min_similarity,
+                index=index,
+                nprobe=nprobe,
+                ef_search=ef_search,
+                filters=filters,
+                centroid_documents=(
+                    centroid_documents or get_settings().SEARCH_CENTROID_DOCUMENTS
+                ) if mode == "two_stage" else None,
+                timings=timings
             )
             
         except Exception as e:
             logger.error(f"文本搜索失败", error=str(e), query=query_text)
             return []
+    
+    async def search_batch_by_text(
+        self,
+        db: AsyncSession,
+        query_texts: List[str],
+        top_k: int = 5,
+        document_type: str = None,
+        document_id: str = None,
+        min_similarity: float = 0.0,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[List[Tuple[str, float]]], Dict[str, Any]]:
+        """
+        批量文本语义搜索
+        
+        重复的查询文本只向量化一次，未命中查询向量缓存的查询一次 embed_batch 调用，
+        与常驻索引一次矩阵-矩阵乘法打分；命中的chunks去重后一次加载
+        
+        Args:
+            db: 数据库会话
+            query_texts: 查询文本列表
+            其余参数同 search()
+        
+        Returns:
+            (每个查询的 [(chunk_id, similarity)], {chunk_id: chunk})
+        """
+        try:
+            await self.index.ensure_loaded(db)
+            
+            unique_texts = list(dict.fromkeys(query_texts))
+            embeddings = await get_embedding_service().embed_queries(unique_texts)
+            embedding_by_text = dict(zip(unique_texts, embeddings))
+            
+            hits = self.index.search_batch(
+                [embedding_by_text.get(text) for text in query_texts],
+                top_k=top_k,
+                document_id=document_id,
+                min_similarity=min_similarity,
+                filters=self._build_filters(document_type, filters)
+            )
+            
+            hit_ids = list(dict.fromkeys(
+                chunk_id for query_hits in hits for chunk_id, _ in query_hits
+            ))
+            chunks_by_id = await self._load_chunks(db, hit_ids)
+            
+            logger.info(
+                "批量搜索完成",
+                queries=len(query_texts),
+                unique_queries=len(unique_texts),
+                unique_chunks=len(chunks_by_id)
+            )
+            
+            return [
+                [(chunk_id, similarity) for chunk_id, similarity in query_hits if chunk_id in chunks_by_id]
+                for query_hits in hits
+            ], chunks_by_id
+            
+        except Exception as e:
+            logger.error("批量搜索失败", error=str(e), queries=len(query_texts))
+            return [[] for _ in query_texts], {}
 
 
 # 全局单例
@@ -185,3 +933,29 @@ def get_vector_search() -> SimpleVectorSearch:
     if _vector_search is None:
         _vector_search = SimpleVectorSearch()
     return _vector_search
+
+
+async def init_vector_index() -> None:
+    """启动时构建常驻向量索引和BM25索引（失败时在首次搜索时重试）"""
+    from app.core import database as db_module
+    
+    try:
+        if db_module.async_session is None:
+            await db_module.init_db()
+        vector_search = get_vector_search()
+        async with db_module.async_session() as session:
+            await vector_search.index.load(session)
+            await vector_search.keyword_index.load(session)
+        vector_search.build_centroids()
+        
+        ann_names = get_settings().VECTOR_ANN_INDEXES
+        if ann_names:
+            vector_search.build_ann_indexes(ann_names)
+    except Exception as e:
+        logger.error("向量索引构建失败，将在首次搜索时重试", error=str(e))
+
+
+async def close_vector_index() -> None:
+    """关闭时持久化ANN索引"""
+    if _vector_search is not None:
+        _vector_search.save_ann_indexes()
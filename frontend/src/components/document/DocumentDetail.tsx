@@ -227,10 +227,26 @@ const DocumentDetail: React.FC = () => {
       
       if (response.ok) {
         const result = await response.json();
-        const stats = result.embedding_stats;
-        message.success(
-          `向量化成功！成功: ${stats.success}, 失败: ${stats.failed}, 跳过: ${stats.skipped}`
-        );
+        message.info(result.message);
+        
+        // 轮询任务进度直到完成
+        let job = result.job;
+        while (job.status === 'pending' || job.status === 'running') {
+          await new Promise((resolve) => setTimeout(resolve, 2000));
+          const jobResponse = await fetch(API_ENDPOINTS.DOCUMENTS.EMBED_JOB(result.job_id));
+          if (!jobResponse.ok) {
+            throw new Error('查询向量化任务失败');
+          }
+          job = (await jobResponse.json()).job;
+        }
+        
+        if (job.status === 'completed') {
+          message.success(
+            `向量化成功！成功: ${job.success}, 失败: ${job.failed}, 跳过: ${job.skipped}`
+          );
+        } else {
+          message.error(`向量化失败: ${job.error || '未知错误'}`);
+        }
         
         // 重新加载chunks以显示embedding状态
         await loadChunks();
@@ -37,6 +37,7 @@ export const API_ENDPOINTS = {
     CHUNKS: (id: string) => `${API_V1_BASE}/documents/${id}/chunks`,
     CHUNK: (id: string) => `${API_V1_BASE}/documents/${id}/chunk`,
     EMBED: (id: string) => `${API_V1_BASE}/documents/${id}/embed`,
+    EMBED_JOB: (jobId: string) => `${API_V1_BASE}/documents/embed-jobs/${jobId}`,
   },
   
   // 分类相关
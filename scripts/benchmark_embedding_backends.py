@@ -0,0 +1,154 @@
+"""
+Embedding后端基准: sentence-transformers (PyTorch) vs ONNX Runtime int8
+
+在 backend 目录下执行（使用 MODEL_CACHE_DIR 中的本地模型，ONNX模型不存在时自动导出）:
+    python ../scripts/benchmark_embedding_backends.py [--texts 512] [--batch-size 32] [--threads 0] [--queries 100]
+
+输出两种后端的批量吞吐（文本/秒）、单条查询延迟（p50/p95，毫秒），
+以及ONNX向量与PyTorch向量的余弦相似度（需不低于 ONNX_MIN_COSINE 才可与已有向量混用）
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from app.core.config import get_settings
+from app.services.onnx_embedder import (
+    ONNX_INT8_FILE, ONNX_MIN_COSINE, OnnxEmbedder, default_onnx_dir, export_onnx_model
+)
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+CODE_LINES = [
+    "def load_config(path: str) -> dict:",
+    "    with open(path, encoding='utf-8') as f:",
+    "        return json.load(f)",
+    "for item in items:",
+    "    if item.status == 'failed':",
+    "        retry_queue.append(item)",
+    "import asyncio",
+    "from typing import List, Optional",
+    "logger.info('request finished', duration_ms=elapsed)",
+    "return {k: v for k, v in params.items() if v is not None}",
+]
+DOC_SENTENCES = [
+    "接口调用前需要先获取访问令牌，令牌有效期为30分钟。",
+    "The ingestion pipeline splits each document into overlapping chunks before embedding.",
+    "发布流程包括代码评审、集成测试和灰度发布三个阶段。",
+    "Search requests are scored against the resident vector index and optionally reranked.",
+    "数据库迁移脚本必须可以重复执行，并在失败时回滚。",
+    "Each module owner is responsible for keeping the API documentation up to date.",
+    "缓存失效策略采用写入时删除，避免读到过期数据。",
+    "Batch jobs report progress through the job status endpoint every few seconds.",
+]
+CHECKLIST_ITEMS = [
+    "- [ ] 单元测试通过",
+    "- [ ] Update the changelog",
+    "- [x] 代码已格式化",
+    "- [ ] Add migration notes",
+    "- [ ] 检查日志级别",
+    "- [x] Remove debug prints",
+]
+
+
+def build_corpus(size: int, seed: int = 0) -> List[str]:
+    """生成代码、文档、检查项混合的语料（长度差异大，接近真实chunk分布）"""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(size):
+        kind = i % 3
+        if kind == 0:
+            corpus.append("\n".join(rng.choice(CODE_LINES) for _ in range(rng.randint(5, 60))))
+        elif kind == 1:
+            corpus.append(" ".join(rng.choice(DOC_SENTENCES) for _ in range(rng.randint(2, 25))))
+        else:
+            corpus.append(rng.choice(CHECKLIST_ITEMS))
+    rng.shuffle(corpus)
+    return corpus
+
+
+def measure(encode: Callable[[List[str]], np.ndarray], corpus: List[str], queries: List[str]) -> Dict[str, float]:
+    """批量吞吐与单条延迟"""
+    encode(corpus[:8])  # 预热
+
+    start = time.perf_counter()
+    vectors = encode(corpus)
+    elapsed = time.perf_counter() - start
+
+    latencies = []
+    for query in queries:
+        query_start = time.perf_counter()
+        encode([query])
+        latencies.append((time.perf_counter() - query_start) * 1000)
+
+    return {
+        "vectors": np.asarray(vectors, dtype=np.float32),
+        "throughput": len(corpus) / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95))
+    }
+
+
+def main(texts: int, batch_size: int, threads: int, query_count: int, reexport: bool):
+    from sentence_transformers import SentenceTransformer
+
+    settings = get_settings()
+    corpus = build_corpus(texts)
+    queries = [text[:200] for text in build_corpus(query_count, seed=1)]
+
+    onnx_dir = settings.EMBEDDING_ONNX_DIR or default_onnx_dir(MODEL_NAME, settings.MODEL_CACHE_DIR)
+    if reexport or not os.path.exists(os.path.join(onnx_dir, ONNX_INT8_FILE)):
+        export_onnx_model(MODEL_NAME, onnx_dir, settings.MODEL_CACHE_DIR)
+
+    if threads > 0:
+        import torch
+        torch.set_num_threads(threads)
+
+    torch_model = SentenceTransformer(MODEL_NAME, cache_folder=settings.MODEL_CACHE_DIR)
+    onnx_model = OnnxEmbedder(onnx_dir, threads=threads)
+
+    results = {
+        "sentence-transformers": measure(
+            lambda batch: torch_model.encode(batch, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False),
+            corpus,
+            queries
+        ),
+        "onnx-int8": measure(
+            lambda batch: onnx_model.encode(batch, batch_size=batch_size),
+            corpus,
+            queries
+        )
+    }
+
+    reference = results["sentence-transformers"]["vectors"]
+    candidate = results["onnx-int8"]["vectors"]
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    cosine = np.sum(reference * candidate, axis=1)
+
+    print(f"语料: {texts} 条（代码/文档/检查项混合），批大小 {batch_size}，线程数 {threads or '默认'}")
+    print(f"{'后端':<24}{'吞吐(条/秒)':>14}{'p50(ms)':>10}{'p95(ms)':>10}")
+    for name, result in results.items():
+        print(f"{name:<24}{result['throughput']:>14.1f}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}")
+    speedup = results["onnx-int8"]["throughput"] / results["sentence-transformers"]["throughput"]
+    print(f"ONNX吞吐提升: {speedup:.2f}x")
+    print(f"余弦相似度: 最小 {cosine.min():.4f}，平均 {cosine.mean():.4f}（容差 ≥ {ONNX_MIN_COSINE}）")
+    print("兼容性: " + ("通过" if cosine.min() >= ONNX_MIN_COSINE else "未通过，请勿与已有向量混用"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比较PyTorch与ONNX int8 Embedding后端")
+    parser.add_argument("--texts", type=int, default=512, help="批量吞吐测试的文本数")
+    parser.add_argument("--batch-size", type=int, default=32, help="编码批大小")
+    parser.add_argument("--threads", type=int, default=0, help="推理线程数，0表示默认")
+    parser.add_argument("--queries", type=int, default=100, help="单条延迟测试的查询数")
+    parser.add_argument("--reexport", action="store_true", help="重新导出ONNX模型")
+    args = parser.parse_args()
+
+    main(args.texts, args.batch_size, args.threads, args.queries, args.reexport)
@@ -0,0 +1,105 @@
+"""
+长度分桶组批基准: 按到达顺序每32条一批 vs 按token长度分桶、按token预算组批
+
+在 backend 目录下执行（使用 MODEL_CACHE_DIR 中的本地模型）:
+    python ../scripts/benchmark_length_bucketing.py [--texts 1024] [--backend sentence-transformers] [--token-budget 8192]
+
+语料为代码、文档、检查项混合（见 benchmark_embedding_backends.build_corpus），
+输出两种组批方式送入模型的token数（含填充）、填充占比、吞吐，以及两者向量的一致性
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import List
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from app.core.config import get_settings
+from app.services.length_bucketing import estimate_token_lengths, padded_tokens, plan_batches
+from app.services.onnx_embedder import load_local_model
+
+from benchmark_embedding_backends import MODEL_NAME, build_corpus
+
+FIXED_BATCH_SIZE = 32
+
+
+def encode_batches(model, corpus: List[str], batches: List[List[int]]) -> np.ndarray:
+    """逐批编码并按原位置写回"""
+    vectors = [None] * len(corpus)
+    for batch in batches:
+        embeddings = model.encode(
+            [corpus[i] for i in batch],
+            batch_size=len(batch),
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        for i, embedding in zip(batch, embeddings):
+            vectors[i] = embedding
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def main(texts: int, backend: str, token_budget: int, max_texts: int, repeat: int):
+    settings = get_settings()
+    model = load_local_model(
+        MODEL_NAME,
+        backend=backend,
+        cache_folder=settings.MODEL_CACHE_DIR,
+        onnx_dir=settings.EMBEDDING_ONNX_DIR
+    )
+    corpus = build_corpus(texts)
+    lengths = estimate_token_lengths(model, corpus)
+
+    plans = {
+        f"到达顺序 x{FIXED_BATCH_SIZE}": [
+            list(range(start, min(start + FIXED_BATCH_SIZE, len(corpus))))
+            for start in range(0, len(corpus), FIXED_BATCH_SIZE)
+        ],
+        "长度分桶": plan_batches(lengths, token_budget=token_budget, max_batch_size=max_texts)
+    }
+
+    encode_batches(model, corpus[:8], [list(range(8))])  # 预热
+
+    results = {}
+    for name, batches in plans.items():
+        elapsed = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            vectors = encode_batches(model, corpus, batches)
+            elapsed.append(time.perf_counter() - start)
+        results[name] = {
+            "batches": len(batches),
+            "padded_tokens": padded_tokens(lengths, batches),
+            "throughput": len(corpus) / min(elapsed),
+            "vectors": vectors
+        }
+
+    real_tokens = sum(lengths)
+    print(f"语料: {texts} 条，有效token {real_tokens}，后端 {backend}，token预算 {token_budget}")
+    print(f"{'组批方式':<16}{'批次数':>8}{'送入token':>12}{'填充占比':>10}{'吞吐(条/秒)':>14}")
+    for name, result in results.items():
+        padding = 1 - real_tokens / result["padded_tokens"]
+        print(
+            f"{name:<16}{result['batches']:>8}{result['padded_tokens']:>12}"
+            f"{padding:>10.1%}{result['throughput']:>14.1f}"
+        )
+
+    baseline, bucketed = (results[name] for name in plans)
+    print(f"吞吐提升: {bucketed['throughput'] / baseline['throughput']:.2f}x")
+    cosine = np.sum(baseline["vectors"] * bucketed["vectors"], axis=1)
+    print(f"两种组批向量的余弦相似度: 最小 {cosine.min():.6f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比较固定条数组批与长度分桶组批")
+    parser.add_argument("--texts", type=int, default=1024, help="语料条数")
+    parser.add_argument("--backend", default="sentence-transformers", help="编码后端: sentence-transformers, onnx")
+    parser.add_argument("--token-budget", type=int, default=8192, help="每批填充后的token数上限")
+    parser.add_argument("--max-texts", type=int, default=256, help="每批最多条数")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数（取最快一次）")
+    args = parser.parse_args()
+
+    main(args.texts, args.backend, args.token_budget, args.max_texts, args.repeat)
@@ -0,0 +1,70 @@
+"""
+一次性迁移：DocumentChunk.embedding (JSON文本) -> embedding_blob (小端float32)
+
+执行（可在任意目录，脚本先切换到 backend 目录，与服务端使用相同的 .env 和相对SQLite路径）:
+    python scripts/migrate_embeddings_to_binary.py [--batch-size 500] [--model all-MiniLM-L6-v2] [--drop-json]
+
+SQLite数据库文件不存在时直接报错退出，不会新建空库
+
+可重复执行，只处理尚未迁移的行。迁移期间服务端双读两种格式，
+确认全部迁移且无需回滚后，再使用 --drop-json 清空JSON列并关闭 EMBEDDING_WRITE_JSON
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, BACKEND_DIR)
+# 配置中的 .env 与默认的 sqlite:///./ai_context.db 都相对于 backend 目录
+os.chdir(BACKEND_DIR)
+
+from app.core import database as db_module
+from app.core.config import get_settings
+from app.services.embedding_codec import migrate_embeddings_to_binary
+
+
+def _missing_sqlite_file(database_url: str):
+    """SQLite数据库文件不存在时返回其路径，否则返回 None"""
+    if not database_url.startswith("sqlite") or ":///" not in database_url:
+        return None
+    path = database_url.split(":///", 1)[1].split("?", 1)[0]
+    if path in ("", ":memory:") or os.path.exists(path):
+        return None
+    return os.path.abspath(path)
+
+
+async def main(batch_size: int, model_name: str, drop_json: bool):
+    """执行迁移"""
+    missing = _missing_sqlite_file(get_settings().DATABASE_URL)
+    if missing:
+        print(f"数据库文件不存在: {missing}，请检查 DATABASE_URL", file=sys.stderr)
+        sys.exit(1)
+
+    # create_tables 会为旧库补充 embedding_blob 等新增列
+    await db_module.create_tables()
+
+    async with db_module.async_session() as session:
+        stats = await migrate_embeddings_to_binary(
+            session,
+            batch_size=batch_size,
+            model_name=model_name,
+            drop_json=drop_json
+        )
+
+    print("向量迁移完成:")
+    print(f"  已转换: {stats['converted']}")
+    print(f"  失败: {stats['failed']}")
+    if drop_json:
+        print(f"  已清空JSON列: {stats['json_dropped']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="迁移JSON文本向量到二进制列")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批处理的行数")
+    parser.add_argument("--model", default=None, help="写入 embedding_model 的模型名")
+    parser.add_argument("--drop-json", action="store_true", help="迁移后清空JSON文本列")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.batch_size, args.model, args.drop_json))
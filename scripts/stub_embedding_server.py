@@ -0,0 +1,87 @@
+"""
+本地Embedding API桩服务（OpenAI兼容 /v1/embeddings），用于测试远程Embedding客户端
+
+执行:
+    python scripts/stub_embedding_server.py [--port 9100] [--latency-ms 50] [--failure-rate 0.1] [--throttle-rate 0.05]
+
+然后以远程模式启动服务或脚本:
+    EMBEDDING_REMOTE_API_URL=http://127.0.0.1:9100/v1/embeddings
+
+- 每个请求固定延迟 latency-ms（模拟往返时间），按 failure-rate 随机返回503、按 throttle-rate 返回429
+- 单次请求超过 max-batch 条输入时返回413
+- 向量由文本的哈希确定，相同文本总是得到相同向量
+"""
+
+import argparse
+import asyncio
+import hashlib
+import random
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from typing import List
+
+app = FastAPI(title="Embedding Stub")
+options = argparse.Namespace(latency_ms=50.0, failure_rate=0.0, throttle_rate=0.0, dimension=1024, max_batch=64)
+counters = {"requests": 0, "inputs": 0, "failures": 0, "throttled": 0}
+
+
+class EmbeddingRequest(BaseModel):
+    model: str
+    input: List[str]
+    encoding_format: str = "float"
+
+
+def stub_vector(text: str, dimension: int) -> List[float]:
+    seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16)
+    vector = np.random.default_rng(seed).standard_normal(dimension).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: EmbeddingRequest):
+    counters["requests"] += 1
+    await asyncio.sleep(options.latency_ms / 1000)
+
+    if len(request.input) > options.max_batch:
+        return JSONResponse(status_code=413, content={"error": "too many inputs"})
+    roll = random.random()
+    if roll < options.throttle_rate:
+        counters["throttled"] += 1
+        return JSONResponse(status_code=429, content={"error": "rate limited"}, headers={"Retry-After": "1"})
+    if roll < options.throttle_rate + options.failure_rate:
+        counters["failures"] += 1
+        return JSONResponse(status_code=503, content={"error": "unavailable"})
+
+    counters["inputs"] += len(request.input)
+    return {
+        "object": "list",
+        "model": request.model,
+        "data": [
+            {"object": "embedding", "index": i, "embedding": stub_vector(text, options.dimension)}
+            for i, text in enumerate(request.input)
+        ]
+    }
+
+
+@app.get("/stats")
+async def stats():
+    return counters
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地Embedding API桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="每个请求的固定延迟（毫秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="随机返回503的比例")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="随机返回429的比例")
+    parser.add_argument("--dimension", type=int, default=1024, help="向量维度")
+    parser.add_argument("--max-batch", type=int, default=64, help="单次请求最多输入条数")
+    args = parser.parse_args()
+    options.__dict__.update(vars(args))
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
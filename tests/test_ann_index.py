@@ -0,0 +1,92 @@
+"""
+ANN索引持久化测试（纯Numpy的IVF索引；HNSW测试需要 hnswlib，未安装时跳过）
+
+执行（仓库根目录）:
+    python -m pytest -q tests/test_ann_index.py
+"""
+
+import os
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from app.services.ann_index import HNSWIndex, IVFFlatIndex, ann_index_lock
+from app.services.vector_index import normalize_rows
+
+
+def _rows(rng, prefix, n, dimension=16):
+    chunk_ids = np.asarray([f"{prefix}-{i}" for i in range(n)], dtype=object)
+    document_ids = np.asarray([f"{prefix}-doc{i % 4}" for i in range(n)], dtype=object)
+    matrix = normalize_rows(rng.standard_normal((n, dimension)).astype(np.float32))
+    return chunk_ids, document_ids, matrix
+
+
+def test_concurrent_saves_leave_one_complete_copy(tmp_path):
+    rng = np.random.default_rng(0)
+    indexes = []
+    for prefix in ("a", "b", "c", "d"):
+        ann = IVFFlatIndex(nlist=4)
+        ann.build(*_rows(rng, prefix, 200))
+        indexes.append(ann)
+
+    def save(ann):
+        for _ in range(5):
+            with ann_index_lock(tmp_path, ann.name):
+                ann.save(tmp_path)
+
+    threads = [threading.Thread(target=save, args=(ann,)) for ann in indexes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    loaded = IVFFlatIndex()
+    assert loaded.load(tmp_path)
+    prefixes = {str(chunk_id).split("-")[0] for chunk_id in loaded.chunk_id_set()}
+    assert len(prefixes) == 1
+
+    # 向量与chunk id来自同一个副本
+    source = indexes["abcd".index(prefixes.pop())]
+    order = np.argsort(source._chunk_ids)
+    loaded_order = np.argsort(loaded._chunk_ids)
+    np.testing.assert_array_equal(loaded._vectors[loaded_order], source._vectors[order])
+    assert not list((tmp_path / "ivf").glob("*.tmp"))
+
+
+def test_hnsw_reuses_deleted_labels():
+    pytest.importorskip("hnswlib")
+    rng = np.random.default_rng(0)
+    ann = HNSWIndex()
+    chunk_ids, document_ids, matrix = _rows(rng, "a", 100)
+    ann.build(chunk_ids, document_ids, matrix)
+
+    for _ in range(20):
+        mask = document_ids == "a-doc1"
+        ann.remove_document("a-doc1")
+        ann.add(chunk_ids[mask], document_ids[mask], matrix[mask])
+
+    assert ann.size == 100
+    assert ann.deleted <= HNSWIndex.COMPACT_RATIO * ann.size
+    assert len(ann._chunk_ids) <= 150
+    hits = ann.search(matrix[1], top_k=1)
+    assert hits[0][0] == "a-1"
+
+
+def test_hnsw_save_drops_tombstones(tmp_path):
+    pytest.importorskip("hnswlib")
+    rng = np.random.default_rng(0)
+    ann = HNSWIndex()
+    chunk_ids, document_ids, matrix = _rows(rng, "a", 100)
+    ann.build(chunk_ids, document_ids, matrix)
+    ann.remove_chunks(chunk_ids[:10])
+    ann.save(tmp_path)
+
+    loaded = HNSWIndex()
+    assert loaded.load(tmp_path)
+    assert loaded.size == 90
+    assert loaded.deleted == 0
+    assert loaded.search(matrix[50], top_k=1)[0][0] == "a-50"
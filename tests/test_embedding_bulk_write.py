@@ -0,0 +1,73 @@
+"""
+chunk向量批量写回测试（临时SQLite数据库，模型以桩代替）
+
+执行（仓库根目录）:
+    python -m pytest -q tests/test_embedding_bulk_write.py
+"""
+
+import asyncio
+import os
+import sys
+import uuid
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.models.database import Base, DevType, Document, DocumentChunk, DocumentType
+from app.services.embedding_service import EmbeddingService
+
+
+class StubService(EmbeddingService):
+    """跳过模型加载，按文本长度生成确定性向量"""
+
+    def __init__(self):
+        self.model_name = "stub"
+
+    async def _embed_with_content_cache(self, texts, db):
+        return [[float(len(text)), 1.0, 0.0] for text in texts], 0, len(texts)
+
+
+async def _run(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/t.db")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with session_factory() as db:
+        dev_type = DevType(id=str(uuid.uuid4()), category=DocumentType.BUSINESS_DOC, name="d", display_name="d")
+        document = Document(id=str(uuid.uuid4()), title="doc", content="x", dev_type_id=dev_type.id, uploaded_by="u")
+        chunks = [
+            DocumentChunk(id=str(uuid.uuid4()), document_id=document.id, content=f"chunk {i}", chunk_index=i, chunk_size=7)
+            for i in range(3)
+        ]
+        db.add_all([dev_type, document, *chunks])
+        await db.commit()
+        payload = [{"id": chunk.id, "content": chunk.content} for chunk in chunks]
+
+        # 编码期间被删除的chunk（如重新分块）
+        await db.execute(delete(DocumentChunk).where(DocumentChunk.id == chunks[1].id))
+        await db.commit()
+
+        stats = await StubService().embed_chunks_for_document(payload, db=db)
+
+        rows = (await db.execute(
+            select(DocumentChunk.id, DocumentChunk.embedding_dim, DocumentChunk.embedding_model)
+            .order_by(DocumentChunk.chunk_index)
+        )).all()
+
+    await engine.dispose()
+    return stats, rows, chunks
+
+
+def test_bulk_write_skips_deleted_chunks(tmp_path):
+    stats, rows, chunks = asyncio.run(_run(tmp_path))
+
+    assert stats["failed"] == 0
+    assert stats["success"] == 2
+    assert stats["skipped"] == 1
+    assert [row.id for row in rows] == [chunks[0].id, chunks[2].id]
+    assert all(row.embedding_dim == 3 and row.embedding_model == "stub" for row in rows)
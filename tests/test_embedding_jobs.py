@@ -0,0 +1,201 @@
+"""
+向量化任务队列测试（临时SQLite数据库，向量化服务与向量索引以桩代替）
+
+执行（仓库根目录）:
+    python -m pytest -q tests/test_embedding_jobs.py
+"""
+
+import asyncio
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core import database as db_module
+from app.models.database import (
+    Base, DevType, Document, DocumentChunk, DocumentType, EmbeddingJob, EmbeddingJobStatus
+)
+from app.services import embedding_service as embedding_service_module
+from app.services import vector_search as vector_search_module
+from app.services.embedding_jobs import EmbeddingJobWorker
+
+
+class StubEmbeddingService:
+    def __init__(self, error=None):
+        self.error = error
+        self.chunk_indexes = []
+
+    async def embed_chunks_for_document(self, chunks, db=None, update_callback=None):
+        if self.error is not None:
+            raise self.error
+        self.chunk_indexes.extend(chunk["chunk_index"] for chunk in chunks)
+        return {"success": len(chunks), "failed": 0, "skipped": 0, "cache_hits": 0}
+
+
+class StubVectorSearch:
+    def __init__(self):
+        self.refreshed = []
+
+    async def refresh_document(self, db, document_id):
+        self.refreshed.append(document_id)
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    """临时数据库 + 一个有6个chunk的文档，返回 (运行协程的函数, 文档id, 向量化桩, 索引桩)"""
+    loop = asyncio.new_event_loop()
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/t.db")
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr(db_module, "async_session", session_factory)
+
+    embedding = StubEmbeddingService()
+    search = StubVectorSearch()
+    monkeypatch.setattr(embedding_service_module, "get_embedding_service", lambda: embedding)
+    monkeypatch.setattr(vector_search_module, "get_vector_search", lambda: search)
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with session_factory() as db:
+            dev_type = DevType(id=str(uuid.uuid4()), category=DocumentType.BUSINESS_DOC, name="d", display_name="d")
+            document = Document(id=str(uuid.uuid4()), title="doc", content="x", dev_type_id=dev_type.id, uploaded_by="u")
+            db.add_all([dev_type, document])
+            db.add_all([
+                DocumentChunk(id=str(uuid.uuid4()), document_id=document.id, content=f"chunk {i}", chunk_index=i, chunk_size=7)
+                for i in range(6)
+            ])
+            await db.commit()
+            return document.id
+
+    document_id = loop.run_until_complete(setup())
+    yield loop.run_until_complete, document_id, embedding, search
+    loop.run_until_complete(engine.dispose())
+    loop.close()
+
+
+async def _add_job(document_id, **values):
+    async with db_module.async_session() as db:
+        job = EmbeddingJob(document_id=document_id, total_chunks=6, **values)
+        db.add(job)
+        await db.commit()
+        return job.id
+
+
+async def _get_job(job_id):
+    async with db_module.async_session() as db:
+        return await db.get(EmbeddingJob, job_id)
+
+
+def test_claim_is_exclusive(queue):
+    run, document_id, _, _ = queue
+    job_id = run(_add_job(document_id))
+    workers = [EmbeddingJobWorker() for _ in range(3)]
+
+    async def claim_all():
+        return await asyncio.gather(*(worker._claim() for worker in workers))
+
+    claimed = run(claim_all())
+    assert sorted(claimed, key=lambda value: value is None) == [job_id, None, None]
+
+    job = run(_get_job(job_id))
+    winner = workers[claimed.index(job_id)]
+    assert job.status == EmbeddingJobStatus.RUNNING
+    assert job.worker_id == winner.worker_id
+    assert job.attempts == 1
+
+
+def test_stale_lease_is_reclaimed_and_fenced(queue):
+    run, document_id, _, _ = queue
+    job_id = run(_add_job(document_id))
+    first = EmbeddingJobWorker(stale_seconds=60)
+    second = EmbeddingJobWorker(stale_seconds=60)
+
+    assert run(first._claim()) == job_id
+    # 心跳未超时不能被接管
+    assert run(second._claim()) is None
+
+    async def expire_heartbeat():
+        async with db_module.async_session() as db:
+            job = await db.get(EmbeddingJob, job_id)
+            job.heartbeat_at = datetime.utcnow() - timedelta(seconds=120)
+            await db.commit()
+
+    run(expire_heartbeat())
+    assert run(second._claim()) == job_id
+
+    job = run(_get_job(job_id))
+    assert job.worker_id == second.worker_id
+    assert job.attempts == 2
+
+    # 原worker的租约已失效，写入被拒绝
+    async def stale_write():
+        async with db_module.async_session() as db:
+            return await first._update_leased(db, job_id, 1, checkpoint_index=5)
+
+    assert run(stale_write()) is False
+    assert run(_get_job(job_id)).checkpoint_index == -1
+
+
+def test_resume_from_checkpoint(queue):
+    run, document_id, embedding, search = queue
+    job_id = run(_add_job(
+        document_id,
+        checkpoint_index=2,
+        processed_chunks=3,
+        success_count=3
+    ))
+    worker = EmbeddingJobWorker(batch_size=2)
+
+    assert run(worker._claim()) == job_id
+    run(worker._process(job_id))
+
+    assert embedding.chunk_indexes == [3, 4, 5]
+    assert search.refreshed == [document_id]
+    job = run(_get_job(job_id))
+    assert job.status == EmbeddingJobStatus.COMPLETED
+    assert job.checkpoint_index == 5
+    assert job.processed_chunks == 6
+    assert job.success_count == 6
+    assert worker.chunks_processed == 3
+
+
+def test_failed_after_max_attempts(queue):
+    run, document_id, embedding, _ = queue
+    embedding.error = RuntimeError("模型不可用")
+    job_id = run(_add_job(document_id))
+    worker = EmbeddingJobWorker(max_attempts=2)
+
+    assert run(worker._claim()) == job_id
+    run(worker._process(job_id))
+    job = run(_get_job(job_id))
+    assert job.status == EmbeddingJobStatus.PENDING
+    assert job.error == "模型不可用"
+    assert worker.jobs_retried == 1
+
+    assert run(worker._claim()) == job_id
+    run(worker._process(job_id))
+    job = run(_get_job(job_id))
+    assert job.status == EmbeddingJobStatus.FAILED
+    assert job.attempts == 2
+    assert job.finished_at is not None
+    assert worker.jobs_failed == 1
+
+
+def test_claim_beyond_max_attempts_fails_without_processing(queue):
+    run, document_id, embedding, _ = queue
+    job_id = run(_add_job(document_id, attempts=2))
+    worker = EmbeddingJobWorker(max_attempts=2)
+
+    assert run(worker._claim()) == job_id
+    run(worker._process(job_id))
+
+    job = run(_get_job(job_id))
+    assert job.status == EmbeddingJobStatus.FAILED
+    assert "最大尝试次数" in job.error
+    assert embedding.chunk_indexes == []
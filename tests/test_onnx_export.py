@@ -0,0 +1,56 @@
+"""
+ONNX模型导出并发测试（导出函数以桩代替，不需要torch）
+
+执行（仓库根目录）:
+    python -m pytest -q tests/test_onnx_export.py
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from app.services import onnx_embedder
+
+
+def test_concurrent_ensure_exports_once(tmp_path, monkeypatch):
+    model_dir = str(tmp_path / "onnx" / "all-MiniLM-L6-v2")
+    calls = []
+
+    def fake_export(model_name, output_dir, cache_folder=None):
+        calls.append(model_name)
+        time.sleep(0.2)
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, onnx_embedder.ONNX_INT8_FILE)
+        with open(path, "wb") as f:
+            f.write(b"onnx")
+        return path
+
+    monkeypatch.setattr(onnx_embedder, "export_onnx_model", fake_export)
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(onnx_embedder.ensure_onnx_model("all-MiniLM-L6-v2", model_dir)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [os.path.join(model_dir, onnx_embedder.ONNX_INT8_FILE)] * 4
+
+
+def test_ensure_skips_existing_model(tmp_path, monkeypatch):
+    model_dir = tmp_path / "model"
+    model_dir.mkdir()
+    (model_dir / onnx_embedder.ONNX_INT8_FILE).write_bytes(b"onnx")
+
+    def fail_export(*args, **kwargs):
+        raise AssertionError("不应重新导出")
+
+    monkeypatch.setattr(onnx_embedder, "export_onnx_model", fail_export)
+    assert onnx_embedder.ensure_onnx_model("m", str(model_dir)) == str(model_dir / onnx_embedder.ONNX_INT8_FILE)
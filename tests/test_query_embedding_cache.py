@@ -0,0 +1,60 @@
+"""
+查询向量缓存测试（Redis以内存桩代替）
+
+执行（仓库根目录）:
+    python -m pytest -q tests/test_query_embedding_cache.py
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from app.core import redis as redis_module
+from app.services.embedding_cache import QueryEmbeddingCache, RedisQueryEmbeddingCache
+
+
+class StubRedis:
+    def __init__(self):
+        self.values = {}
+        self.expiry = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value
+        self.expiry[key] = ex
+
+
+def test_redis_cache_entries_always_expire(monkeypatch):
+    """未配置TTL时Redis条目也带过期时间，避免每个不同查询永久驻留"""
+    stub = StubRedis()
+
+    async def get_redis():
+        return stub
+
+    monkeypatch.setattr(redis_module, "get_redis", get_redis)
+
+    async def main():
+        for ttl in (None, 0, 600):
+            cache = RedisQueryEmbeddingCache("model", ttl=ttl)
+            await cache.set(f"query {ttl}", [0.5, 0.25])
+            assert await cache.get(f"query  {ttl} ") == [0.5, 0.25]
+
+    asyncio.run(main())
+    assert sorted(stub.expiry.values()) == [600, RedisQueryEmbeddingCache.DEFAULT_TTL, RedisQueryEmbeddingCache.DEFAULT_TTL]
+
+
+def test_memory_cache_is_bounded():
+    async def main():
+        cache = QueryEmbeddingCache("model", max_size=2)
+        for i in range(3):
+            await cache.set(f"query {i}", [float(i)])
+        assert await cache.get("query 0") is None
+        assert await cache.get("query 2") == [2.0]
+        return cache
+
+    cache = asyncio.run(main())
+    assert cache.evictions == 1
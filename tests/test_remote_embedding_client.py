@@ -0,0 +1,133 @@
+"""
+远程Embedding客户端测试（httpx.MockTransport 模拟本地桩服务，无需网络）
+
+执行（仓库根目录）:
+    python -m pytest -q tests/test_remote_embedding_client.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from app.services.remote_embedding_client import RemoteEmbeddingClient
+
+
+def stub_vector(text):
+    """文本 'text-<n>' 对应向量 [n, 1]，便于检查位置对应关系"""
+    return [float(text.split("-")[1]), 1.0]
+
+
+def make_client(handler, **kwargs):
+    options = {
+        "batch_size": 32,
+        "max_retries": 4,
+        "backoff_base": 0.001,
+        "backoff_max": 0.01,
+        "http2": False
+    }
+    options.update(kwargs)
+    return RemoteEmbeddingClient(
+        api_url="http://stub/v1/embeddings",
+        api_key="test",
+        model_name="stub",
+        transport=httpx.MockTransport(handler),
+        **options
+    )
+
+
+def ok(texts):
+    return httpx.Response(200, json={
+        "data": [{"index": i, "embedding": stub_vector(text)} for i, text in enumerate(texts)]
+    })
+
+
+def run(client, texts):
+    async def main():
+        try:
+            return await client.embed(texts)
+        finally:
+            await client.close()
+    return asyncio.run(main())
+
+
+def test_non_retryable_input_is_isolated():
+    """一条文本返回400时只有该位置为 None，同批其他文本正常返回"""
+    texts = [f"text-{i}" for i in range(32)]
+    texts[5] = "bad-5"
+
+    def handler(request):
+        inputs = json.loads(request.content)["input"]
+        if any(text.startswith("bad") for text in inputs):
+            return httpx.Response(400, json={"error": "invalid input"})
+        return ok(inputs)
+
+    client = make_client(handler)
+    embeddings = run(client, texts)
+
+    assert embeddings[5] is None
+    assert [e for i, e in enumerate(embeddings) if i != 5] == [stub_vector(t) for i, t in enumerate(texts) if i != 5]
+    assert client.failed_texts == 1
+    assert client.retries == 0
+
+
+def test_transient_failures_are_retried():
+    """503/429 退避后重试成功，429 的 Retry-After 被采纳"""
+    responses = iter([
+        httpx.Response(503, json={"error": "unavailable"}),
+        httpx.Response(429, json={"error": "rate limited"}, headers={"Retry-After": "0"}),
+    ])
+
+    def handler(request):
+        response = next(responses, None)
+        return response or ok(json.loads(request.content)["input"])
+
+    texts = [f"text-{i}" for i in range(8)]
+    client = make_client(handler)
+    embeddings = run(client, texts)
+
+    assert embeddings == [stub_vector(t) for t in texts]
+    assert client.retries == 2
+    assert client.failed_texts == 0
+
+
+def test_oversized_batches_are_split():
+    """超过服务端上限的批次（413）被二分直到可以接受"""
+    def handler(request):
+        inputs = json.loads(request.content)["input"]
+        if len(inputs) > 8:
+            return httpx.Response(413, json={"error": "too many inputs"})
+        return ok(inputs)
+
+    texts = [f"text-{i}" for i in range(64)]
+    client = make_client(handler)
+    embeddings = run(client, texts)
+
+    assert embeddings == [stub_vector(t) for t in texts]
+    assert client.splits > 0
+    assert client.retries == 0
+
+
+def test_partial_failure_after_retries_exhausted():
+    """持续失败的文本在重试耗尽后为 None，其余文本保持原位置"""
+    def handler(request):
+        inputs = json.loads(request.content)["input"]
+        if any(text.startswith("down") for text in inputs):
+            return httpx.Response(503, json={"error": "unavailable"})
+        return ok(inputs)
+
+    texts = [f"text-{i}" for i in range(16)]
+    texts[3] = "down-3"
+    texts[12] = "down-12"
+    client = make_client(handler, batch_size=16, max_retries=6)
+    embeddings = run(client, texts)
+
+    assert embeddings[3] is None and embeddings[12] is None
+    assert [e for i, e in enumerate(embeddings) if i not in (3, 12)] == [
+        stub_vector(t) for i, t in enumerate(texts) if i not in (3, 12)
+    ]
+    assert client.failed_texts == 2
@@ -0,0 +1,66 @@
+"""
+重排序服务测试（cross-encoder打分以桩代替，不需要torch）
+
+执行（仓库根目录）:
+    python -m pytest -q tests/test_rerank_service.py
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import numpy as np
+
+from app.services.rerank_service import RerankService
+
+
+class SlowRerankService(RerankService):
+    """按候选文本长度打分，每次打分耗时 delay 秒"""
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+        self.calls = []
+
+    def score(self, query, passages):
+        self.calls.append(threading.current_thread().name)
+        time.sleep(self.delay)
+        return np.array([len(passage) for passage in passages], dtype=np.float32)
+
+
+def _candidates(*contents):
+    return [{"chunk": SimpleNamespace(content=content), "similarity": 0.5} for content in contents]
+
+
+def test_rerank_runs_on_dedicated_thread():
+    service = SlowRerankService(delay=0.0)
+    results, info = asyncio.run(service.rerank("q", _candidates("a", "ccc", "bb"), top_k=2))
+
+    assert info["applied"]
+    assert [item["chunk"].content for item in results] == ["ccc", "bb"]
+    assert service.calls[0].startswith("rerank")
+
+
+def test_timed_out_rerank_queued_behind_another_is_cancelled():
+    service = SlowRerankService(delay=0.3)
+    candidates = _candidates("a", "bb")
+
+    async def run():
+        first = asyncio.ensure_future(service.rerank("q", candidates, top_k=2))
+        await asyncio.sleep(0.05)
+        second = await service.rerank("q", candidates, top_k=2, budget_ms=50)
+        return await first, second
+
+    (first_results, first_info), (second_results, second_info) = asyncio.run(run())
+    time.sleep(0.4)
+
+    assert first_info["applied"]
+    assert second_info["timed_out"]
+    assert [item["chunk"].content for item in second_results] == ["a", "bb"]
+    # 排队中被放弃的打分没有执行
+    assert len(service.calls) == 1
@@ -0,0 +1,180 @@
+"""
+多worker共享向量存储测试（两个 SharedVectorIndex 实例共用同一目录，模拟两个worker）
+
+执行（仓库根目录）:
+    python -m pytest -q tests/test_shared_vector_store.py
+"""
+
+import asyncio
+import os
+import sys
+import uuid
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+if os.name != "posix":
+    pytest.skip("共享向量存储依赖fcntl", allow_module_level=True)
+
+from app.services import shared_vector_store as store
+from app.services.shared_vector_store import SharedDocumentLog, SharedVectorIndex
+
+DIMENSION = 8
+
+
+@pytest.fixture(autouse=True)
+def server_id(monkeypatch):
+    server_id = uuid.uuid4().hex
+    monkeypatch.setenv(store.SERVER_ID_ENV, server_id)
+    return server_id
+
+
+def _upsert(index, rng, document_id, n):
+    chunk_ids = [f"{document_id}-{i}" for i in range(n)]
+    vectors = rng.standard_normal((n, DIMENSION)).astype(np.float32)
+    index.upsert(chunk_ids, [document_id] * n, vectors)
+    return chunk_ids, vectors
+
+
+def test_server_id_from_environment(server_id):
+    assert store._server_id() == server_id
+    assert store.ensure_server_id() == server_id
+
+
+def test_server_id_fallback_includes_parent_start_time(monkeypatch):
+    monkeypatch.delenv(store.SERVER_ID_ENV)
+    if not os.path.exists(f"/proc/{os.getppid()}/stat"):
+        pytest.skip("没有 /proc")
+    assert store._server_id().startswith(f"{os.getppid()}-")
+
+
+def test_compaction_keeps_document_log(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "COMPACT_MIN_TOMBSTONES", 2)
+    # 容器内主进程PID为1时，文档日志名与按代编号的文件形式相同
+    monkeypatch.setenv(store.SERVER_ID_ENV, "1")
+    rng = np.random.default_rng(0)
+
+    document_log = SharedDocumentLog(tmp_path)
+    document_log.mark()
+    document_log.append("vectors", "a")
+
+    index = SharedVectorIndex(tmp_path)
+    _upsert(index, rng, "a", 5)
+    for _ in range(5):
+        _upsert(index, rng, "b", 5)
+        index.remove_document("b")
+
+    assert index._store_generation > 3
+    assert document_log.path.name == "documents.1.jsonl"
+    assert document_log.path.exists()
+    assert not (tmp_path / "vectors.1.f32").exists()
+
+
+def test_writes_visible_to_other_worker(tmp_path):
+    rng = np.random.default_rng(0)
+    worker_a = SharedVectorIndex(tmp_path)
+    worker_b = SharedVectorIndex(tmp_path)
+
+    chunk_ids, vectors = _upsert(worker_a, rng, "a", 5)
+    assert worker_b.size == 5
+    assert worker_b.search(vectors[2], top_k=1)[0][0] == chunk_ids[2]
+
+    _upsert(worker_b, rng, "b", 5)
+    assert worker_a.size == 10
+
+    # 覆盖写入：旧行记墓碑，其他worker只看到新向量
+    replacement = rng.standard_normal((1, DIMENSION)).astype(np.float32)
+    worker_a.upsert([chunk_ids[0]], ["a"], replacement)
+    hits = worker_b.search(replacement[0], top_k=10)
+    assert [chunk_id for chunk_id, _ in hits].count(chunk_ids[0]) == 1
+    assert hits[0][0] == chunk_ids[0]
+    assert hits[0][1] == pytest.approx(1.0, abs=1e-5)
+
+    assert worker_a.remove_document("b") == 5
+    assert worker_b.size == 5
+    assert all(chunk_id.startswith("a-") for chunk_id, _ in worker_b.search(vectors[0], top_k=10))
+    assert worker_b.document_rows("b") == ([], [], None)
+
+
+def test_compaction_switches_generation(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "COMPACT_MIN_TOMBSTONES", 2)
+    rng = np.random.default_rng(0)
+    worker_a = SharedVectorIndex(tmp_path)
+    worker_b = SharedVectorIndex(tmp_path)
+
+    chunk_ids, vectors = _upsert(worker_a, rng, "a", 5)
+    _upsert(worker_a, rng, "b", 5)
+    worker_b.sync()
+    generation = worker_b._store_generation
+
+    worker_a.remove_document("b")
+    assert worker_a._store_generation == generation + 1
+
+    worker_b.sync()
+    assert worker_b._store_generation == generation + 1
+    snapshot_ids, snapshot_documents, matrix = worker_b.snapshot()
+    assert sorted(snapshot_ids) == sorted(chunk_ids)
+    assert set(snapshot_documents) == {"a"}
+    order = np.argsort(snapshot_ids)
+    expected = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.testing.assert_allclose(matrix[order], expected[np.argsort(chunk_ids)], rtol=1e-5)
+
+    # 切换后两个worker都能继续写入
+    _upsert(worker_b, rng, "c", 3)
+    assert worker_a.size == 8
+
+
+async def _load_with_database(tmp_path, directory, rng):
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+    from app.models.database import Base, DevType, Document, DocumentChunk, DocumentType
+    from app.services.embedding_codec import encode_embedding
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/t.db")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with session_factory() as db:
+        dev_type = DevType(id=str(uuid.uuid4()), category=DocumentType.BUSINESS_DOC, name="d", display_name="d")
+        document = Document(id=str(uuid.uuid4()), title="doc", content="x", dev_type_id=dev_type.id, uploaded_by="u")
+        chunks = [
+            DocumentChunk(
+                id=str(uuid.uuid4()),
+                document_id=document.id,
+                content=f"chunk {i}",
+                chunk_index=i,
+                chunk_size=7,
+                embedding_blob=encode_embedding(rng.standard_normal(DIMENSION).tolist()),
+                embedding_dim=DIMENSION
+            )
+            for i in range(4)
+        ]
+        db.add_all([dev_type, document, *chunks])
+        await db.commit()
+
+        index = SharedVectorIndex(directory)
+        await index.load(db)
+
+    await engine.dispose()
+    return index, [chunk.id for chunk in chunks]
+
+
+def test_load_rebuilds_store_from_previous_server(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    directory = tmp_path / "shared"
+
+    # 上一次服务实例留下的存储，行数与数据库相同但内容已过期
+    monkeypatch.setenv(store.SERVER_ID_ENV, "previous")
+    previous = SharedVectorIndex(directory)
+    _upsert(previous, rng, "stale", 4)
+    stale_generation = previous._store_generation
+
+    monkeypatch.setenv(store.SERVER_ID_ENV, "current")
+    index, chunk_ids = asyncio.run(_load_with_database(tmp_path, directory, rng))
+
+    assert index._store_generation > stale_generation
+    assert index._read_manifest()["server_id"] == "current"
+    assert sorted(index.snapshot()[0]) == sorted(chunk_ids)
@@ -0,0 +1,59 @@
+"""
+常驻向量索引量化器训练测试（纯内存，不需要数据库）
+
+执行（仓库根目录）:
+    python -m pytest -q tests/test_vector_index_quantization.py
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from app.services.vector_index import VectorIndex
+from app.services.vector_quantization import Int8ScalarQuantizer
+
+
+def _upsert(index, rng, document_id, n, dimension=16, scale=1.0):
+    chunk_ids = [f"{document_id}-{i}" for i in range(n)]
+    vectors = rng.standard_normal((n, dimension)).astype(np.float32) * scale
+    index.upsert(chunk_ids, [document_id] * n, vectors)
+
+
+def test_training_deferred_until_min_size():
+    rng = np.random.default_rng(0)
+    index = VectorIndex(quantizer=Int8ScalarQuantizer(), min_train_size=100)
+
+    _upsert(index, rng, "a", 40)
+    assert index._codes is None
+    assert not index.quantizer.is_trained
+    assert len(index.search(index._matrix[0], top_k=3)) == 3
+
+    _upsert(index, rng, "b", 80)
+    assert index.quantizer.is_trained
+    assert index._codes.shape == (120, 16)
+
+
+def test_retrains_after_growth():
+    rng = np.random.default_rng(0)
+    index = VectorIndex(quantizer=Int8ScalarQuantizer(), min_train_size=10, retrain_growth=2.0)
+
+    # 首个文档只覆盖很窄的取值范围，后续文档超出该范围
+    _upsert(index, rng, "a", 10, scale=0.01)
+    first = index.quantizer
+    _upsert(index, rng, "b", 5)
+    assert index.quantizer is first
+    assert len(index._codes) == 15
+
+    _upsert(index, rng, "c", 5)
+    assert index.quantizer is not first
+    assert index._trained_size == 20
+    assert len(index._codes) == 20
+    np.testing.assert_allclose(index.quantizer.low, index._matrix.min(axis=0), rtol=1e-6)
+
+    # 重新训练后量化打分与精确内积接近
+    query = index._matrix[3]
+    approx = index.quantizer.score(index._codes, query)
+    np.testing.assert_allclose(approx, index._matrix @ query, atol=0.05)